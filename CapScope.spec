@@ -16,9 +16,19 @@ a = Analysis(
     hiddenimports=[
         'capscope',
         'capscope.universe',
+        'capscope.cache',
+        'capscope.providers',
+        'capscope.fetcher',
+        'capscope.instrument',
         'capscope.metadata',
         'capscope.prices',
+        'capscope.shares',
+        'capscope.server',
         'capscope.compute',
+        'capscope.rankings',
+        'capscope.watch',
+        'capscope.trading_calendar',
+        'capscope.backfill',
         'capscope.export',
         'capscope.gui',
         'capscope.gui.app',
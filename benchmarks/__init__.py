@@ -0,0 +1,7 @@
+"""CapScope 性能基准测试
+
+在本地回放数据上测量查询管线各阶段的耗时与内存：
+
+    python -m benchmarks run --sizes 500 3000 10000 --out results.json
+    python -m benchmarks compare baseline.json results.json --threshold 0.15
+"""
@@ -0,0 +1,88 @@
+"""基准测试命令行入口"""
+
+import argparse
+import json
+import logging
+import sys
+
+from .compare import compare
+from .pipeline import run
+from .startup import bench_startup, violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CapScope 性能基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="运行基准测试")
+    run_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[500, 3000, 10000],
+        help="股票数，默认 500 3000 10000"
+    )
+    run_parser.add_argument("--repeat", type=int, default=3, help="每阶段计时次数，默认 3")
+    run_parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="回放数据源每次调用注入的延迟（秒）"
+    )
+    run_parser.add_argument("--out", "-o", help="结果 JSON 路径，不指定则输出到 stdout")
+
+    compare_parser = sub.add_parser("compare", help="与基线对比，发现回退时返回非 0")
+    compare_parser.add_argument("baseline", help="基线结果 JSON")
+    compare_parser.add_argument("current", help="本次结果 JSON")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.10,
+        help="允许的相对增长，默认 0.10（10%%）"
+    )
+
+    import_parser = sub.add_parser(
+        "import-time", help="测量启动路径，轻量路径加载了 pandas/yfinance 时返回非 0"
+    )
+    import_parser.add_argument("--repeat", type=int, default=5, help="每个探针计时次数，默认 5")
+    import_parser.add_argument(
+        "--budget", type=float,
+        help="import capscope.cli 的耗时上限（毫秒），超出时返回非 0"
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "run":
+        results = run(args.sizes, args.repeat, args.latency)
+        text = json.dumps(results, indent=2)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+        return
+
+    if args.command == "import-time":
+        results = bench_startup(args.repeat)
+        problems = violations(results)
+        wall = results["import_cli"]["wall_min"] * 1000
+        if args.budget is not None and wall > args.budget:
+            problems.append(f"import_cli: {wall:.1f} ms exceeds budget {args.budget:.1f} ms")
+        if problems:
+            print(f"{len(problems)} startup violation(s):")
+            for item in problems:
+                print(f"  {item}")
+            sys.exit(1)
+        print("Startup paths OK")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    lines, regressions = compare(baseline, current, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for item in regressions:
+            print(f"  {item}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""对比两次基准测试结果，标记性能回退"""
+
+# 参与对比的指标
+METRICS = ("wall_min", "peak_bytes")
+
+# 低于该值的耗时（秒）噪声太大，不参与判断
+MIN_WALL = 0.002
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> tuple[list[str], list[str]]:
+    """
+    对比两次结果
+
+    Args:
+        baseline: 基线结果
+        current: 本次结果
+        threshold: 允许的相对增长（0.10 = 10%）
+
+    Returns:
+        (report_lines, regressions)
+    """
+    lines = [f"{'size':>6} {'stage':<22} {'metric':<11} {'baseline':>12} {'current':>12} {'change':>8}"]
+    regressions = []
+
+    for size, stages in current["results"].items():
+        base_stages = baseline["results"].get(size, {})
+        for stage, values in stages.items():
+            if stage not in base_stages:
+                continue
+            for metric in METRICS:
+                base = base_stages[stage][metric]
+                value = values[metric]
+                change = (value - base) / base if base else 0.0
+                regressed = change > threshold
+                if metric == "wall_min" and max(base, value) < MIN_WALL:
+                    regressed = False
+
+                flag = "  REGRESSION" if regressed else ""
+                lines.append(
+                    f"{size:>6} {stage:<22} {metric:<11} {base:>12.4g} {value:>12.4g} "
+                    f"{change:>+7.1%}{flag}"
+                )
+                if regressed:
+                    regressions.append(f"{size}/{stage}/{metric}: {change:+.1%}")
+
+    return lines, regressions
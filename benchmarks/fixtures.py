@@ -0,0 +1,79 @@
+"""生成基准测试用的回放数据（FixtureProvider 格式）"""
+
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from capscope.providers import save_fixtures
+from capscope.trading_calendar import trading_days
+from capscope.universe import get_universe
+
+FIXTURE_ROOT = Path(__file__).parent / ".fixtures"
+
+# 生成规则变化时加一，旧目录不再复用（2：交易日改用 trading_calendar，不再是 bdate_range）
+FIXTURE_VERSION = 2
+
+# 回放数据覆盖的日期区间与查询日期
+START = "2024-01-02"
+END = "2024-03-29"
+QUERY_DATE = "2024-03-15"
+
+SECTORS = [
+    "Technology", "Healthcare", "Financials", "Consumer Cyclical",
+    "Consumer Defensive", "Communication Services", "Industrials", "Energy",
+    "Utilities", "Real Estate", "Basic Materials"
+]
+
+
+def make_tickers(size: int) -> list[str]:
+    """真实股票池在前，不足部分用合成代码补齐"""
+    tickers = get_universe()[:size]
+    i = 0
+    while len(tickers) < size:
+        tickers.append(f"SYN{i:05d}")
+        i += 1
+    return tickers
+
+
+def build_fixtures(size: int, root: Path = FIXTURE_ROOT) -> Path:
+    """
+    生成（或复用）size 只股票的回放数据
+
+    数据由固定随机种子生成，多次运行结果完全一致。目录名带 FIXTURE_VERSION，
+    生成规则变化后旧数据不会被误用。
+
+    Returns:
+        数据目录
+    """
+    path = root / f"v{FIXTURE_VERSION}" / str(size)
+    if (path / "metadata.json").exists() and (path / "closes.csv").exists():
+        return path
+
+    rng = np.random.default_rng(size)
+    tickers = make_tickers(size)
+
+    metadata = [
+        {
+            "ticker": ticker,
+            "name": f"{ticker} Holdings Inc.",
+            "sector": SECTORS[rng.integers(len(SECTORS))],
+            "shares": int(rng.lognormal(20, 1.2))
+        }
+        for ticker in tickers
+    ]
+
+    dates = pd.DatetimeIndex(trading_days(date.fromisoformat(START), date.fromisoformat(END)))
+    start_prices = rng.lognormal(4, 1, size)
+    returns = rng.normal(0, 0.02, (len(dates), size))
+    closes = pd.DataFrame(
+        np.round(start_prices * np.exp(np.cumsum(returns, axis=0)), 4),
+        index=dates,
+        columns=tickers
+    )
+    # 约 1% 的股票没有价格数据
+    closes.loc[:, rng.random(size) < 0.01] = np.nan
+
+    save_fixtures(path, metadata, closes)
+    return path
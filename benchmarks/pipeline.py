@@ -0,0 +1,221 @@
+"""查询管线各阶段的基准测试"""
+
+import gc
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from capscope.cache import MetadataCache, PriceCache
+from capscope.compute import compute_market_caps, rank_by_sector
+from capscope.export import export_csv, export_json
+from capscope.metadata import fetch_metadata
+from capscope.prices import fetch_prices
+from capscope.providers import FixtureProvider
+from capscope.universe import get_universe
+
+from .fixtures import QUERY_DATE, build_fixtures, make_tickers
+from .startup import bench_startup
+
+# 模拟用户在搜索框逐字输入再删除
+KEYSTROKES = ["a", "ap", "app", "appl", "app", "ap", "a", "", "h", "ho", "hol", ""]
+
+
+def measure(fn: Callable[[Any], Any], setup: Callable[[], Any], repeat: int) -> dict:
+    """
+    测量一个阶段
+
+    先计时运行 repeat 次（每次重新 setup，setup 不计时），
+    再在 tracemalloc 下单独运行一次统计内存。
+
+    Returns:
+        {wall_min, wall_median, peak_bytes, net_blocks}
+        net_blocks 为运行前后 sys.getallocatedblocks() 之差，即运行结束时
+        （返回值尚未释放）仍存活的内存块净增数，不是运行期间的分配总次数
+    """
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        started = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - started)
+
+    state = setup()
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    net_blocks = sys.getallocatedblocks() - blocks_before
+    del result
+
+    return {
+        "wall_min": min(times),
+        "wall_median": statistics.median(times),
+        "peak_bytes": peak,
+        "net_blocks": net_blocks
+    }
+
+
+def _qt_app():
+    """创建无界面的 QApplication（未安装 PyQt6 时返回 None）"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        return None
+    return QApplication.instance() or QApplication([])
+
+
+def bench_size(size: int, repeat: int = 3, latency: float = 0.0) -> dict:
+    """
+    对 size 只股票的回放数据跑完整管线
+
+    Args:
+        size: 股票数
+        repeat: 每阶段计时次数
+        latency: 回放数据源每次调用注入的延迟（秒）
+
+    Returns:
+        {stage: 测量结果}
+    """
+    fixture_dir = build_fixtures(size)
+    provider = FixtureProvider(fixture_dir, latency=latency)
+    tickers = make_tickers(size)
+    # 本次打开的缓存，结束时先关闭连接再删除临时目录
+    caches: list[MetadataCache | PriceCache] = []
+
+    with tempfile.TemporaryDirectory(prefix="capscope-bench-") as tmp_dir:
+        try:
+            return _bench_stages(size, repeat, provider, tickers, Path(tmp_dir), caches)
+        finally:
+            for cache in caches:
+                cache.close()
+
+
+def _bench_stages(
+    size: int,
+    repeat: int,
+    provider: FixtureProvider,
+    tickers: list[str],
+    tmp: Path,
+    caches: list[MetadataCache | PriceCache]
+) -> dict:
+    """在临时目录 tmp 下逐阶段测量，打开的缓存登记到 caches"""
+    counter = iter(range(10 ** 9))
+
+    def fresh(name: str) -> Path:
+        return tmp / f"{name}-{next(counter)}"
+
+    def metadata_cache() -> MetadataCache:
+        cache = MetadataCache(fresh("metadata.db"))
+        caches.append(cache)
+        return cache
+
+    def price_cache(path: Path) -> PriceCache:
+        cache = PriceCache(path)
+        caches.append(cache)
+        return cache
+
+    def run_metadata(cache):
+        return fetch_metadata(
+            tickers, max_workers=32, cache=cache, provider=provider, rate_limit=1e9
+        )
+
+    warm_metadata = metadata_cache()
+    metadata = run_metadata(warm_metadata)
+
+    warm_prices = fresh("prices")
+    prices, _ = fetch_prices(tickers, QUERY_DATE, cache=price_cache(warm_prices), provider=provider)
+    stocks = compute_market_caps(metadata, prices)
+
+    stages: dict[str, tuple[Callable, Callable]] = {
+        "get_universe": (lambda _: get_universe(), lambda: None),
+        "fetch_metadata_cold": (run_metadata, metadata_cache),
+        "fetch_metadata_warm": (run_metadata, lambda: warm_metadata),
+        "fetch_prices_cold": (
+            lambda cache: fetch_prices(tickers, QUERY_DATE, cache=cache, provider=provider),
+            lambda: price_cache(fresh("prices"))
+        ),
+        "fetch_prices_warm": (
+            lambda cache: fetch_prices(tickers, QUERY_DATE, cache=cache, provider=provider),
+            lambda: price_cache(warm_prices)
+        ),
+        "compute_market_caps": (lambda _: compute_market_caps(metadata, prices), lambda: None),
+        "rank_by_sector": (lambda _: rank_by_sector(stocks, 100), lambda: None),
+        "export_csv": (
+            lambda path: export_csv(stocks, str(path)),
+            lambda: fresh("out.csv")
+        ),
+        "export_json": (
+            lambda path: export_json(stocks, QUERY_DATE, QUERY_DATE, str(path)),
+            lambda: fresh("out.json")
+        ),
+    }
+
+    if _qt_app() is not None:
+        from capscope.gui.model import StockTableModel
+
+        def run_filter(model):
+            for text in KEYSTROKES:
+                model.set_filter(text)
+            return model
+
+        def filter_setup():
+            model = StockTableModel()
+            model.set_data(stocks)
+            return model
+
+        stages["model_filter"] = (run_filter, filter_setup)
+
+    results = {}
+    for name, (fn, setup) in stages.items():
+        results[name] = measure(fn, setup, repeat)
+        print(
+            f"  {size:>6} {name:<22} {results[name]['wall_min'] * 1000:>10.2f} ms "
+            f"{results[name]['peak_bytes'] / 1e6:>9.2f} MB",
+            file=sys.stderr
+        )
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(sizes: list[int], repeat: int = 3, latency: float = 0.0) -> dict:
+    """
+    运行全部基准测试
+
+    Returns:
+        {meta: {...}, results: {size: {stage: 测量结果}, "startup": {probe: 测量结果}}}
+    """
+    results = {str(size): bench_size(size, repeat, latency) for size in sizes}
+    results["startup"] = bench_startup(max(repeat, 5))
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "repeat": repeat,
+            "latency": latency
+        },
+        "results": results
+    }
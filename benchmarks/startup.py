@@ -0,0 +1,152 @@
+"""启动耗时基准测试与导入守卫
+
+每个探针在全新的解释器里运行，记录导入 + 执行耗时、tracemalloc 峰值，
+以及运行结束时已加载的"禁止"模块。--help 与快照命中这类轻量路径
+不应加载 pandas/yfinance，一旦有人在模块顶层重新引入重依赖，守卫即失败。
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+from .fixtures import QUERY_DATE, build_fixtures, make_tickers
+
+# 子进程执行的包装脚本：运行探针代码，把结果 JSON 写到原始 stdout
+_HARNESS = """
+import contextlib, io, json, sys, time, tracemalloc
+code, forbidden = sys.argv[1], json.loads(sys.argv[2])
+error = None
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    try:
+        exec(compile(code, "<probe>", "exec"), {"__name__": "__probe__"})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"exit status {e.code}"
+    except Exception as e:
+        error = repr(e)
+elapsed = time.perf_counter() - started
+peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+print(json.dumps({
+    "wall": elapsed,
+    "peak_bytes": peak,
+    "loaded": [m for m in forbidden if m in sys.modules],
+    "error": error
+}))
+"""
+
+_CLI = "import sys\nfrom capscope.cli import main\nsys.argv = {argv!r}\nmain()"
+
+# 名称 → (探针代码, 禁止加载的模块)
+PROBES: dict[str, tuple[str, tuple[str, ...]]] = {
+    "import_cli": ("import capscope.cli", ("pandas", "numpy", "yfinance")),
+    "cli_help": (
+        _CLI.format(argv=["capscope", "--help"]),
+        ("pandas", "numpy", "yfinance")
+    ),
+    "cli_snapshot": (
+        _CLI.format(argv=[
+            "capscope", "--provider", "fixture", "--date", QUERY_DATE,
+            "--sector", "Technology", "--top", "20"
+        ]),
+        ("pandas", "yfinance")
+    ),
+    "import_gui": ("import capscope.gui.main_window", ("pandas", "yfinance")),
+}
+
+
+def _qt_available() -> bool:
+    try:
+        import PyQt6.QtWidgets  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _seed_snapshot(cache_dir: Path, size: int = 500) -> None:
+    """在独立缓存目录里为 QUERY_DATE 写一份快照，供 cli_snapshot 命中"""
+    from capscope.cache import SnapshotCache
+    from capscope.compute import compute_market_caps
+    from capscope.providers import FixtureProvider
+    from capscope.trading_calendar import previous_trading_day
+
+    provider = FixtureProvider(build_fixtures(size))
+    tickers = make_tickers(size)
+    session = previous_trading_day(date.fromisoformat(QUERY_DATE))
+    closes = provider.get_closes(tickers, session, session).dropna(how="all")
+    row = closes.iloc[-1].dropna()
+    stocks = compute_market_caps(provider.get_metadata(tickers), row.to_dict())
+    SnapshotCache(cache_dir / provider.name / "snapshots", provider=provider.name).save(
+        QUERY_DATE, closes.index[-1].strftime("%Y-%m-%d"), stocks
+    )
+
+
+def _probe(code: str, forbidden: tuple[str, ...], env: dict, trace: bool = False) -> dict:
+    """在新解释器里运行一次探针"""
+    run_env = dict(env)
+    if trace:
+        run_env["PYTHONTRACEMALLOC"] = "1"
+    completed = subprocess.run(
+        [sys.executable, "-c", _HARNESS, code, json.dumps(forbidden)],
+        capture_output=True, text=True, env=run_env, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(repeat: int = 5) -> dict:
+    """
+    测量各启动路径
+
+    Args:
+        repeat: 每个探针的计时次数
+
+    Returns:
+        {probe: {wall_min, wall_median, peak_bytes, loaded, error}}
+    """
+    root = Path(__file__).resolve().parent.parent
+    with tempfile.TemporaryDirectory(prefix="capscope-startup-") as tmp:
+        cache_dir = Path(tmp)
+        _seed_snapshot(cache_dir)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(root), env.get("PYTHONPATH")]))
+        env["CAPSCOPE_CACHE_DIR"] = str(cache_dir)
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+        results = {}
+        for name, (code, forbidden) in PROBES.items():
+            if name == "import_gui" and not _qt_available():
+                continue
+            runs = [_probe(code, forbidden, env) for _ in range(repeat)]
+            times = [r["wall"] for r in runs]
+            results[name] = {
+                "wall_min": min(times),
+                "wall_median": statistics.median(times),
+                "peak_bytes": _probe(code, forbidden, env, trace=True)["peak_bytes"],
+                "loaded": sorted({m for r in runs for m in r["loaded"]}),
+                "error": runs[-1]["error"]
+            }
+            print(
+                f"  {name:<14} {results[name]['wall_min'] * 1000:>10.2f} ms "
+                f"{results[name]['peak_bytes'] / 1e6:>9.2f} MB  "
+                f"{', '.join(results[name]['loaded']) or '-'}"
+                f"{'  ' + results[name]['error'] if results[name]['error'] else ''}",
+                file=sys.stderr
+            )
+        return results
+
+
+def violations(results: dict) -> list[str]:
+    """列出出错或加载了禁止模块的探针"""
+    problems = []
+    for name, values in results.items():
+        if values["error"]:
+            problems.append(f"{name}: {values['error']}")
+        if values["loaded"]:
+            problems.append(f"{name}: loaded {', '.join(values['loaded'])}")
+    return problems
@@ -0,0 +1,311 @@
+"""多进程回填排名索引
+
+    python -m capscope backfill --start 2015-01-01 --end 2024-12-31 --workers 8
+
+materialize 在单个进程里逐日排名，回填多年数据时受限于单核。backfill 把同一件事
+拆成作业目录里的若干分片，交给进程池并行计算：
+
+    <缓存目录>/<provider>/jobs/backfill-<start>-<end>-d<depth>/
+        job.json      ticker/公司名/行业编码/股数、覆盖区间、分片表
+        dates.npy     交易日（自 1970-01-01 起的天数，int64）
+        panel.npy     (交易日数, 股票数) 收盘价，已按成分变动置 NaN
+        shards/0007/  分片结果，格式同 rankings 的年份目录
+
+工作进程以内存映射方式读取 panel.npy，不经过 pickle 传递面板；每个分片算完即
+整体写入磁盘，目录出现即视为完成。中断后以相同参数重新运行会跳过已完成的分片，
+全部完成后按年并入排名索引并删除作业目录。
+"""
+
+import argparse
+import functools
+import json
+import logging
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from . import instrument
+from .cache import MetadataCache, PriceCache, get_cache_dir
+from .compute import MarketCapTable
+from .rankings import DEFAULT_DEPTH, RankStore, RankYear, rank_rows, store_year, write_index
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 每个分片最多包含的交易日数（分片不跨年，便于按年合并）
+DEFAULT_SHARD_DAYS = 63
+
+
+def job_dir(provider: str, start: str, end: str, depth: int) -> Path:
+    """同一组参数对应同一个作业目录（重新运行即续跑）"""
+    return get_cache_dir(provider) / "jobs" / f"backfill-{start}-{end}-d{depth}"
+
+
+def prepare_job(
+    path: Path,
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    start: str,
+    end: str,
+    depth: int = DEFAULT_DEPTH,
+    shard_days: int = DEFAULT_SHARD_DAYS
+) -> dict | None:
+    """
+    写出作业目录（输入面板与分片表）
+
+    Args:
+        path: 作业目录（已存在时整体替换）
+        metadata: [{ticker, name, sector, shares}, ...]
+        closes: 收盘价宽表（index=交易日，columns=ticker），不在成分内的已置 NaN
+        start: 起始日期 "YYYY-MM-DD"（含）
+        end: 结束日期 "YYYY-MM-DD"（含）；今天及以后的收盘价还会变化，不写入
+        depth: 每个行业/全市场保存的股票数
+        shard_days: 每个分片的交易日数
+
+    Returns:
+        作业描述；区间内没有已收盘的交易日时返回 None
+    """
+    import pandas as pd
+
+    start_date = date.fromisoformat(start)
+    end_date = min(date.fromisoformat(end), date.today() - timedelta(days=1))
+    closes = closes.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+    if end_date < start_date or closes.empty:
+        return None
+
+    metadata = [m for m in metadata if m["ticker"] in closes.columns]
+    codes, sectors = MarketCapTable._encode_sectors([m["sector"] for m in metadata])
+    days = closes.index.values.astype("datetime64[D]").astype(np.int64)
+    years = closes.index.year.to_numpy()
+
+    # 按年切开，再把每年切成不超过 shard_days 的连续段
+    shards = []
+    for bounds in np.split(np.arange(len(days)), np.flatnonzero(np.diff(years)) + 1):
+        for lo in range(0, len(bounds), shard_days):
+            part = bounds[lo:lo + shard_days]
+            shards.append([int(years[part[0]]), int(part[0]), int(part[-1]) + 1])
+
+    shutil.rmtree(path, ignore_errors=True)
+    (path / "shards").mkdir(parents=True)
+    np.save(path / "dates.npy", days)
+    np.save(
+        path / "panel.npy",
+        closes.reindex(columns=[m["ticker"] for m in metadata]).to_numpy(dtype=np.float64)
+    )
+    job = {
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "depth": depth,
+        "tickers": [m["ticker"] for m in metadata],
+        "names": [m["name"] for m in metadata],
+        "sectors": sectors,
+        "sector_codes": codes.tolist(),
+        "shares": [float(m["shares"]) for m in metadata],
+        "shards": shards,
+        "created_at": time.time()
+    }
+    # job.json 最后写入：以它是否存在判断作业目录完整
+    with open(path / "job.json", "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    logger.info(f"Prepared backfill job: {len(days)} trading days × {len(metadata)} tickers, {len(shards)} shards")
+    return job
+
+
+def load_job(path: Path) -> dict | None:
+    """读取作业描述（目录不完整时返回 None）"""
+    try:
+        with open(path / "job.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _shard_path(path: Path, shard: int) -> Path:
+    return path / "shards" / f"{shard:04d}"
+
+
+@functools.lru_cache(maxsize=4)
+def _open_job(path: str) -> tuple[dict, np.ndarray, np.ndarray, tuple]:
+    """工作进程内打开一次作业（同一进程处理多个分片时复用）"""
+    job = load_job(Path(path))
+    columns = (
+        np.array(job["tickers"], dtype=object),
+        np.array(job["names"], dtype=object),
+        np.array(job["sector_codes"], dtype=np.int32),
+        job["sectors"],
+        np.array(job["shares"], dtype=np.float64)
+    )
+    panel = np.load(Path(path) / "panel.npy", mmap_mode="r")
+    dates = np.load(Path(path) / "dates.npy")
+    return job, panel, dates, columns
+
+
+def run_shard(path: str, shard: int) -> int:
+    """
+    计算一个分片并写入 shards/<shard>（在工作进程中执行）
+
+    Returns:
+        分片的交易日数
+    """
+    job, panel, dates, (tickers, names, codes, sectors, shares) = _open_job(path)
+    _, lo, hi = job["shards"][shard]
+    days = rank_rows(
+        tickers, names, codes, sectors, shares,
+        np.asarray(panel[lo:hi]), dates[lo:hi], job["depth"]
+    )
+    first, last = (date(1970, 1, 1) + timedelta(days=int(dates[i])) for i in (lo, hi - 1))
+    write_index(
+        _shard_path(Path(path), shard), days, dict(zip(job["tickers"], job["names"])),
+        first, last, job["depth"]
+    )
+    return hi - lo
+
+
+def run_job(
+    path: Path,
+    store: RankStore,
+    workers: int | None = None,
+    progress_callback: Callable[[int, int], None] | None = None
+) -> int:
+    """
+    运行作业：并行计算未完成的分片，全部完成后按年并入排名索引
+
+    Args:
+        path: 作业目录（prepare_job 的输出）
+        store: 排名索引存储
+        workers: 工作进程数，默认 CPU 核数；1 时在当前进程内计算
+        progress_callback: 进度回调 (已完成交易日数, 总交易日数)
+
+    Returns:
+        写入索引的交易日数
+    """
+    job = load_job(path)
+    shards = job["shards"]
+    total = sum(hi - lo for _, lo, hi in shards)
+    pending = [i for i in range(len(shards)) if not (_shard_path(path, i) / "meta.json").exists()]
+    completed = total - sum(shards[i][2] - shards[i][1] for i in pending)
+    if completed:
+        logger.info(f"Resuming backfill: {len(shards) - len(pending)}/{len(shards)} shards already done")
+    if progress_callback:
+        progress_callback(completed, total)
+
+    with instrument.span("backfill.shards", shards=len(pending)):
+        if workers == 1:
+            for shard in pending:
+                completed += run_shard(str(path), shard)
+                if progress_callback:
+                    progress_callback(completed, total)
+        elif pending:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(run_shard, str(path), shard) for shard in pending]
+                try:
+                    for future in as_completed(futures):
+                        completed += future.result()
+                        if progress_callback:
+                            progress_callback(completed, total)
+                except BaseException:
+                    # 已写入的分片保留，下次运行续跑
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+    _open_job.cache_clear()
+
+    start = date.fromisoformat(job["start"])
+    end = date.fromisoformat(job["end"])
+    names = dict(zip(job["tickers"], job["names"]))
+    written = 0
+    with instrument.span("backfill.merge"):
+        for year in sorted({y for y, _, _ in shards}):
+            days = [
+                d
+                for i, (y, _, _) in enumerate(shards) if y == year
+                for d in RankYear(_shard_path(path, i)).decode()
+            ]
+            written += store_year(store, year, days, names, start, end, job["depth"])
+
+    shutil.rmtree(path, ignore_errors=True)
+    return written
+
+
+def main(argv: list[str] | None = None):
+    """python -m capscope backfill 入口"""
+    from .cli import add_source_arguments, build_provider, setup_logging
+
+    parser = argparse.ArgumentParser(
+        prog="capscope backfill",
+        description="多进程预计算长区间内每个交易日的行业排名（可中断续跑）"
+    )
+    parser.add_argument("--start", required=True, help="起始日期 (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="结束日期 (YYYY-MM-DD)")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=DEFAULT_DEPTH,
+        help=f"每个行业/全市场保存的股票数，默认 {DEFAULT_DEPTH}"
+    )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        help="工作进程数，默认 CPU 核数"
+    )
+    parser.add_argument(
+        "--shard-days",
+        type=int,
+        default=DEFAULT_SHARD_DAYS,
+        help=f"每个分片的交易日数，默认 {DEFAULT_SHARD_DAYS}"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="丢弃未完成的同参数作业，重新抓取数据"
+    )
+    add_source_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_logging(args.verbose)
+
+    path = job_dir(args.provider, args.start, args.end, args.depth)
+    if args.restart:
+        shutil.rmtree(path, ignore_errors=True)
+
+    job = load_job(path)
+    if job is None:
+        from .metadata import fetch_metadata
+        from .prices import fetch_price_panel
+        from .universe import get_universe_between, membership_mask
+
+        provider = build_provider(args)
+        metadata_cache = None if args.no_cache else MetadataCache(
+            ttl=args.cache_ttl * 3600, provider=provider.name
+        )
+        price_cache = None if args.no_cache else PriceCache(provider=provider.name)
+
+        tickers = get_universe_between(args.start, args.end)
+        metadata = fetch_metadata(tickers, cache=metadata_cache, provider=provider)
+        closes = fetch_price_panel(
+            [m["ticker"] for m in metadata], args.start, args.end,
+            cache=price_cache, provider=provider
+        )
+        closes = closes.where(membership_mask(list(closes.columns), closes.index.values))
+        job = prepare_job(path, metadata, closes, args.start, args.end, args.depth, args.shard_days)
+        if job is None:
+            logger.warning(f"Nothing to backfill: {args.start} ~ {args.end} has no closed trading day")
+            return
+    else:
+        logger.info(f"Found unfinished job {path.name} (use --restart to discard it)")
+
+    def progress(done, total):
+        pct = done * 100 // max(1, total)
+        print(
+            f"\rBackfill: {done}/{total} trading days ({pct}%)",
+            end="\n" if done == total else "", flush=True
+        )
+
+    store = RankStore(provider=args.provider)
+    days = run_job(path, store, workers=args.workers, progress_callback=progress)
+    logger.info(f"Backfilled {days} trading days into {store.root}")
@@ -0,0 +1,623 @@
+"""本地缓存模块"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import trading_calendar
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 元数据默认有效期：流通股数/公司名/行业变化很慢，一周刷新一次足够
+DEFAULT_METADATA_TTL = 7 * 24 * 3600  # 秒
+
+# SQLite 单条语句的参数上限（老版本为 999）
+_SQL_CHUNK = 500
+
+
+def get_cache_dir(namespace: str | None = None) -> Path:
+    """
+    获取用户缓存目录（可用环境变量 CAPSCOPE_CACHE_DIR 覆盖）
+
+    Args:
+        namespace: 子目录名（如数据源名称）
+
+    Returns:
+        已创建的缓存目录
+    """
+    override = os.environ.get("CAPSCOPE_CACHE_DIR")
+    if override:
+        base = Path(override)
+    elif sys.platform == "win32":
+        local = os.environ.get("LOCALAPPDATA") or str(Path.home() / "AppData" / "Local")
+        base = Path(local) / "CapScope" / "Cache"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches" / "CapScope"
+    else:
+        xdg = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+        base = Path(xdg) / "capscope"
+
+    if namespace:
+        base = base / namespace
+    base.mkdir(parents=True, exist_ok=True)
+    return base
+
+
+def _chunks(items: list, size: int = _SQL_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class MetadataCache:
+    """
+    元数据缓存（SQLite）
+
+    按 ticker 存储 name/sector/shares，每个字段单独记录抓取时间，
+    任一字段超过 TTL 即视为过期，需要重新抓取。
+    """
+
+    FIELDS = ("name", "sector", "shares")
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        ttl: float = DEFAULT_METADATA_TTL,
+        provider: str = "yfinance"
+    ):
+        """
+        Args:
+            path: 数据库文件路径，默认 <缓存目录>/<provider>/metadata.db
+            ttl: 有效期（秒）
+            provider: 数据源名称，不同数据源的缓存互相隔离
+        """
+        self.path = Path(path) if path else get_cache_dir(provider) / "metadata.db"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (
+                ticker TEXT PRIMARY KEY,
+                name TEXT,
+                name_fetched_at REAL,
+                sector TEXT,
+                sector_fetched_at REAL,
+                shares REAL,
+                shares_fetched_at REAL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_fresh(
+        self,
+        tickers: list[str],
+        now: float | None = None
+    ) -> tuple[list[dict], list[str]]:
+        """
+        查询缓存
+
+        Args:
+            tickers: 股票代码列表
+            now: 当前时间戳（测试用），默认 time.time()
+
+        Returns:
+            (fresh, stale)
+            fresh: 未过期的元数据 [{ticker, name, sector, shares}, ...]
+            stale: 缺失或过期、需要重新抓取的 ticker（保持输入顺序）
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl
+        found: dict[str, dict] = {}
+
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT ticker, name, sector, shares
+                    FROM metadata
+                    WHERE ticker IN ({placeholders})
+                      AND name_fetched_at >= ?
+                      AND sector_fetched_at >= ?
+                      AND shares_fetched_at >= ?
+                    """,
+                    (*chunk, cutoff, cutoff, cutoff)
+                ).fetchall()
+                for ticker, name, sector, shares in rows:
+                    found[ticker] = {
+                        "ticker": ticker,
+                        "name": name,
+                        "sector": sector,
+                        "shares": shares
+                    }
+
+        fresh = [found[t] for t in tickers if t in found]
+        stale = [t for t in tickers if t not in found]
+        return fresh, stale
+
+    def get_shares(self, tickers: list[str]) -> dict[str, float]:
+        """
+        读取缓存中的流通股数（不论是否过期，用于估算市值排序）
+
+        Returns:
+            {ticker: shares}
+        """
+        shares = {}
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT ticker, shares FROM metadata
+                    WHERE ticker IN ({placeholders}) AND shares IS NOT NULL
+                    """,
+                    chunk
+                ).fetchall()
+                shares.update(rows)
+        return shares
+
+    def put(self, records: list[dict], now: float | None = None) -> None:
+        """
+        写入元数据（只更新记录中出现的字段及其时间戳）
+
+        Args:
+            records: [{ticker, name?, sector?, shares?}, ...]
+            now: 当前时间戳（测试用），默认 time.time()
+        """
+        if not records:
+            return
+        now = time.time() if now is None else now
+
+        with self._lock:
+            for record in records:
+                fields = [f for f in self.FIELDS if f in record]
+                if not fields:
+                    continue
+                columns = ["ticker"]
+                values = [record["ticker"]]
+                for field in fields:
+                    columns += [field, f"{field}_fetched_at"]
+                    values += [record[field], now]
+                updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+                self._conn.execute(
+                    f"""
+                    INSERT INTO metadata ({", ".join(columns)})
+                    VALUES ({", ".join("?" * len(columns))})
+                    ON CONFLICT(ticker) DO UPDATE SET {updates}
+                    """,
+                    values
+                )
+            self._conn.commit()
+
+        logger.debug(f"Cached metadata for {len(records)} tickers")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM metadata")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class SharesStore:
+    """
+    历史流通股数与拆股事件（SQLite）
+
+    shares 表存各 ticker 按披露日期的股数（原始口径，未做拆股调整），
+    splits 表存拆股事件；refreshed 表记录每个 ticker 的抓取时间与起始日期，
+    超过 TTL 或需要更早的历史时重新抓取。
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        ttl: float = DEFAULT_METADATA_TTL,
+        provider: str = "yfinance"
+    ):
+        """
+        Args:
+            path: 数据库文件路径，默认 <缓存目录>/<provider>/shares.db；":memory:" 为不落盘
+            ttl: 有效期（秒）
+            provider: 数据源名称，不同数据源的缓存互相隔离
+        """
+        self.path = Path(path) if path else get_cache_dir(provider) / "shares.db"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version = 0  # 每次写入加一，供上层判断索引是否需要重建
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS shares (
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                shares REAL NOT NULL,
+                PRIMARY KEY (ticker, date)
+            );
+            CREATE TABLE IF NOT EXISTS splits (
+                ticker TEXT NOT NULL,
+                date TEXT NOT NULL,
+                ratio REAL NOT NULL,
+                PRIMARY KEY (ticker, date)
+            );
+            CREATE TABLE IF NOT EXISTS refreshed (
+                ticker TEXT PRIMARY KEY,
+                start TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def stale(self, tickers: list[str], start: date, now: float | None = None) -> list[str]:
+        """
+        需要重新抓取的 ticker：从未抓取、已过期，或已有历史晚于 start
+
+        Returns:
+            ticker 列表（保持输入顺序）
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl
+        fresh = set()
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT ticker FROM refreshed
+                    WHERE ticker IN ({placeholders}) AND fetched_at >= ? AND start <= ?
+                    """,
+                    (*chunk, cutoff, start.isoformat())
+                ).fetchall()
+                fresh.update(t for (t,) in rows)
+        return [t for t in tickers if t not in fresh]
+
+    def put(
+        self,
+        tickers: list[str],
+        start: date,
+        shares: list[tuple[str, str, float]],
+        splits: list[tuple[str, str, float]],
+        now: float | None = None
+    ) -> None:
+        """
+        替换一批 ticker 的历史并标记为已抓取
+
+        Args:
+            tickers: 本次抓取的 ticker（包括没有任何记录的）
+            start: 本次抓取的起始日期
+            shares: [(ticker, "YYYY-MM-DD", shares), ...]
+            splits: [(ticker, "YYYY-MM-DD", ratio), ...]
+            now: 当前时间戳（测试用），默认 time.time()
+        """
+        if not tickers:
+            return
+        now = time.time() if now is None else now
+
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                placeholders = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM shares WHERE ticker IN ({placeholders})", chunk)
+                self._conn.execute(f"DELETE FROM splits WHERE ticker IN ({placeholders})", chunk)
+            self._conn.executemany("INSERT OR REPLACE INTO shares VALUES (?, ?, ?)", shares)
+            self._conn.executemany("INSERT OR REPLACE INTO splits VALUES (?, ?, ?)", splits)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO refreshed VALUES (?, ?, ?)",
+                [(t, start.isoformat(), now) for t in tickers]
+            )
+            self._conn.commit()
+            self._version += 1
+
+        logger.debug(f"Cached shares history for {len(tickers)} tickers")
+
+    def load(self) -> tuple[list[tuple[str, str, float]], list[tuple[str, str, float]]]:
+        """
+        读取全部历史
+
+        Returns:
+            (shares, splits)，均为 [(ticker, "YYYY-MM-DD", value), ...]，按 (ticker, date) 排序
+        """
+        with self._lock:
+            shares = self._conn.execute(
+                "SELECT ticker, date, shares FROM shares ORDER BY ticker, date"
+            ).fetchall()
+            splits = self._conn.execute(
+                "SELECT ticker, date, ratio FROM splits ORDER BY ticker, date"
+            ).fetchall()
+        return shares, splits
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def _merge_spans(spans: list[tuple[date, date]]) -> list[tuple[date, date]]:
+    """合并重叠或相邻（差一天）的日期区间"""
+    merged: list[tuple[date, date]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _trading_spans(spans: list[tuple[date, date]]) -> list[tuple[date, date]]:
+    """把区间首尾收缩到交易日，只含休市日的区间去掉（那些日子本来就没有数据）"""
+    trimmed = []
+    for start, end in spans:
+        start = trading_calendar.next_trading_day(start)
+        end = trading_calendar.previous_trading_day(end)
+        if start <= end:
+            trimmed.append((start, end))
+    return trimmed
+
+
+def _subtract_spans(
+    start: date,
+    end: date,
+    covered: list[tuple[date, date]]
+) -> list[tuple[date, date]]:
+    """[start, end] 中未被 covered 覆盖的区间"""
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start - timedelta(days=1)))
+        cursor = max(cursor, c_end + timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class PriceCache:
+    """
+    收盘价缓存
+
+    收盘价按年分区存为宽表（行=交易日，列=ticker），
+    另用 SQLite 记录每个 ticker 已覆盖的日期区间（含周末/节假日），
+    查询时只需下载未覆盖的缺口；按交易日历只由休市日组成的部分不算缺口。
+    """
+
+    def __init__(self, root: str | Path | None = None, provider: str = "yfinance"):
+        """
+        Args:
+            root: 缓存目录，默认 <缓存目录>/<provider>/prices
+            provider: 数据源名称，不同数据源的缓存互相隔离
+        """
+        self.root = Path(root) if root else get_cache_dir(provider) / "prices"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._years: dict[int, "pd.DataFrame"] = {}
+        self._conn = sqlite3.connect(str(self.root / "coverage.db"), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spans (
+                ticker TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_ticker ON spans(ticker)")
+        self._conn.commit()
+
+        self._spans: dict[str, list[tuple[date, date]]] = {}
+        for ticker, start, end in self._conn.execute("SELECT ticker, start, end FROM spans"):
+            self._spans.setdefault(ticker, []).append(
+                (date.fromisoformat(start), date.fromisoformat(end))
+            )
+        for ticker in self._spans:
+            self._spans[ticker] = _merge_spans(self._spans[ticker])
+
+    def missing(
+        self,
+        tickers: list[str],
+        start: date,
+        end: date
+    ) -> dict[str, list[tuple[date, date]]]:
+        """
+        计算未覆盖的日期区间
+
+        Args:
+            tickers: 股票代码列表
+            start: 起始日期（含）
+            end: 结束日期（含）
+
+        Returns:
+            {ticker: [(gap_start, gap_end), ...]}，缺口首尾都是交易日；
+            已完全覆盖（或只差休市日）的 ticker 不出现
+        """
+        gaps = {}
+        with self._lock:
+            for ticker in tickers:
+                ticker_gaps = _trading_spans(_subtract_spans(start, end, self._spans.get(ticker, [])))
+                if ticker_gaps:
+                    gaps[ticker] = ticker_gaps
+        return gaps
+
+    def get_closes(self, tickers: list[str], start: date, end: date) -> "pd.DataFrame":
+        """
+        读取收盘价
+
+        Returns:
+            DataFrame（index=交易日，columns=ticker），全空的行已去掉
+        """
+        import pandas as pd
+
+        frames = []
+        with self._lock:
+            for year in range(start.year, end.year + 1):
+                frame = self._load_year(year)
+                if frame is None:
+                    continue
+                columns = [t for t in tickers if t in frame.columns]
+                frames.append(frame.loc[pd.Timestamp(start):pd.Timestamp(end), columns])
+
+        if not frames:
+            return pd.DataFrame(columns=tickers, dtype="float64")
+
+        closes = pd.concat(frames).dropna(how="all")
+        return closes.reindex(columns=tickers)
+
+    def put(
+        self,
+        closes: "pd.DataFrame",
+        tickers: list[str],
+        start: date,
+        end: date
+    ) -> None:
+        """
+        写入一次下载的结果并标记覆盖区间
+
+        只有返回了数据的 ticker 才会被标记为已覆盖（失败的下次重试）；
+        今天及以后的日期收盘价尚未确定，不标记。
+
+        Args:
+            closes: 下载得到的收盘价宽表
+            tickers: 本次请求的 ticker
+            start: 请求起始日期（含）
+            end: 请求结束日期（含）
+        """
+        import pandas as pd
+
+        end = min(end, date.today() - timedelta(days=1))
+        closes = closes.loc[:pd.Timestamp(end)]
+        # 没有数据的 ticker/日期不必合并进年度文件（否则每次重试都要重写整年）
+        values = closes.dropna(axis=1, how="all").dropna(how="all")
+
+        with self._lock:
+            for year, part in values.groupby(values.index.year):
+                old = self._load_year(year)
+                merged = part if old is None else part.combine_first(old)
+                self._save_year(year, merged.sort_index())
+
+            if start > end:
+                return
+
+            with_data = set(closes.columns[closes.notna().any()])
+            covered = [t for t in tickers if t in with_data]
+            for ticker in covered:
+                spans = _merge_spans(self._spans.get(ticker, []) + [(start, end)])
+                self._spans[ticker] = spans
+                self._conn.execute("DELETE FROM spans WHERE ticker = ?", (ticker,))
+                self._conn.executemany(
+                    "INSERT INTO spans (ticker, start, end) VALUES (?, ?, ?)",
+                    [(ticker, s.isoformat(), e.isoformat()) for s, e in spans]
+                )
+            self._conn.commit()
+
+        logger.debug(f"Cached closes for {len(covered)} tickers, {start} ~ {end}")
+
+    def _year_path(self, year: int) -> Path:
+        return self.root / f"closes-{year}.pkl"
+
+    def _load_year(self, year: int) -> "pd.DataFrame | None":
+        import pandas as pd
+
+        if year not in self._years:
+            path = self._year_path(year)
+            if not path.exists():
+                return None
+            self._years[year] = pd.read_pickle(path)
+        return self._years[year]
+
+    def _save_year(self, year: int, frame: "pd.DataFrame") -> None:
+        path = self._year_path(year)
+        tmp = path.with_suffix(".tmp")
+        frame.to_pickle(tmp)
+        os.replace(tmp, path)
+        self._years[year] = frame
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class SnapshotCache:
+    """
+    查询结果快照
+
+    每个查询日期保存最近一次完整计算结果（JSON），
+    界面打开时可立即显示，再在后台刷新。
+    """
+
+    def __init__(self, root: str | Path | None = None, provider: str = "yfinance"):
+        """
+        Args:
+            root: 快照目录，默认 <缓存目录>/<provider>/snapshots
+            provider: 数据源名称，不同数据源的缓存互相隔离
+        """
+        self.root = Path(root) if root else get_cache_dir(provider) / "snapshots"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, query_date: str) -> Path:
+        return self.root / f"{query_date}.json"
+
+    def load(self, query_date: str) -> dict | None:
+        """
+        读取快照
+
+        Returns:
+            {query_date, actual_date, saved_at, stocks} 或 None，stocks 为 StockRecord 列表
+        """
+        from .compute import as_records
+
+        path = self._path(query_date)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot["stocks"] = as_records(snapshot["stocks"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+        return snapshot
+
+    def save(self, query_date: str, actual_date: str, stocks: list) -> None:
+        """
+        保存快照
+
+        Args:
+            query_date: 用户请求日期
+            actual_date: 实际使用的交易日
+            stocks: compute_market_caps 的结果
+        """
+        path = self._path(query_date)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "query_date": query_date,
+                "actual_date": actual_date,
+                "saved_at": time.time(),
+                "stocks": [dict(s) for s in stocks]
+            }, f, ensure_ascii=False)
+        os.replace(tmp, path)
@@ -1,15 +1,27 @@
-"""命令行入口"""
+"""命令行入口
+
+模块级只导入轻量依赖：numpy/pandas 等在真正计算时才导入，
+yfinance 只在需要联网时导入，--help 与快照命中时都不会加载它们。
+"""
 
 import argparse
 import logging
 import sys
+import time
 from datetime import datetime
+from typing import TYPE_CHECKING
+
+from . import instrument
+from .universe import get_universe, get_universe_between
+from .cache import MetadataCache, PriceCache, SharesStore, SnapshotCache, DEFAULT_METADATA_TTL
+from .providers import PROVIDERS, get_provider
+from .export import (
+    FORMATS, WATCH_FIELDNAMES, export_json, export_records, export_series,
+    open_writer, print_changes, print_csv, print_series
+)
 
-from .universe import get_universe
-from .metadata import fetch_metadata
-from .prices import fetch_prices
-from .compute import compute_market_caps, rank_by_sector, get_top_overall
-from .export import export_csv, export_json, print_csv
+if TYPE_CHECKING:
+    from .compute import RankedTable
 
 
 def setup_logging(verbose: bool = False):
@@ -21,7 +33,69 @@ def setup_logging(verbose: bool = False):
     )
 
 
+def add_source_arguments(parser: argparse.ArgumentParser) -> None:
+    """数据源与缓存相关参数（查询命令与 serve 共用）"""
+    parser.add_argument(
+        "--provider",
+        choices=list(PROVIDERS),
+        default="yfinance",
+        help="数据源，默认 yfinance；fixture 为本地回放数据"
+    )
+    parser.add_argument(
+        "--fixture-dir",
+        help="fixture 数据目录（默认取 CAPSCOPE_FIXTURE_DIR）"
+    )
+    parser.add_argument(
+        "--fixture-latency",
+        type=float,
+        default=0.0,
+        help="fixture 数据源每次调用注入的延迟（秒）"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用本地缓存（元数据与收盘价），全部重新抓取"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_METADATA_TTL / 3600,
+        help="元数据缓存有效期（小时），默认 168"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="详细日志"
+    )
+
+
+def build_provider(args):
+    """按命令行参数创建数据源"""
+    if args.provider == "fixture":
+        return get_provider(
+            "fixture", path=args.fixture_dir, latency=args.fixture_latency
+        )
+    return get_provider(args.provider)
+
+
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from .server import main as serve_main
+        serve_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["universe"]:
+        from .universe import main as universe_main
+        universe_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["materialize"]:
+        from .rankings import main as materialize_main
+        materialize_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["backfill"]:
+        from .backfill import main as backfill_main
+        backfill_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description="CapScope - 美股历史市值查看工具"
     )
@@ -30,15 +104,23 @@ def main():
         default=datetime.now().strftime("%Y-%m-%d"),
         help="查询日期 (YYYY-MM-DD)，默认今天"
     )
+    parser.add_argument(
+        "--start",
+        help="区间模式起始日期 (YYYY-MM-DD)，需与 --end 同时使用"
+    )
+    parser.add_argument(
+        "--end",
+        help="区间模式结束日期 (YYYY-MM-DD)，输出区间内每个交易日的排名"
+    )
     parser.add_argument(
         "--out", "-o",
         help="输出文件路径，不指定则输出到 stdout"
     )
     parser.add_argument(
         "--format", "-f",
-        choices=["csv", "json"],
+        choices=FORMATS,
         default="csv",
-        help="输出格式 (csv/json)，默认 csv"
+        help="输出格式 (csv/json/ndjson/parquet/arrow)，默认 csv；parquet/arrow 需要 pyarrow"
     )
     parser.add_argument(
         "--sector", "-s",
@@ -51,18 +133,157 @@ def main():
         help="每行业取 Top N，默认 100"
     )
     parser.add_argument(
-        "--verbose", "-v",
+        "--point-in-time",
         action="store_true",
-        help="详细日志"
+        help="使用查询日当时的流通股数（按拆股调整），而不是当前股数"
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="INTERVAL",
+        help="盘中模式：每隔 INTERVAL 秒只拉最新价格，输出前 N 名的变化（Ctrl+C 结束）"
+    )
+    parser.add_argument(
+        "--watch-count",
+        type=int,
+        metavar="N",
+        help="盘中模式轮询 N 次后结束，默认一直运行"
+    )
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="只用预计算排名或本地快照回答（不联网，不检查有效期），都没有时报错"
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="结束时输出各阶段耗时与计数（请求、重试、缓存命中等）"
+    )
+    parser.add_argument(
+        "--profile-out",
+        help="埋点数据输出路径（隐含 --profile）：.jsonl 为 JSON lines，其余为 Chrome trace"
+    )
+    add_source_arguments(parser)
     
     args = parser.parse_args()
+    if bool(args.start) != bool(args.end):
+        parser.error("--start and --end must be used together")
+    if args.format in ("parquet", "arrow") and not args.out:
+        parser.error(f"--format {args.format} requires --out")
+    if args.top < 0:
+        parser.error("--top must not be negative")
+    if args.cache_only and (args.start or args.point_in_time or args.no_cache):
+        parser.error("--cache-only cannot be combined with --start/--end, --point-in-time or --no-cache")
+    if args.watch is not None:
+        if args.watch <= 0:
+            parser.error("--watch INTERVAL must be positive")
+        if args.start or args.point_in_time or args.cache_only:
+            parser.error("--watch cannot be combined with --start/--end, --point-in-time or --cache-only")
+        if args.date != datetime.now().strftime("%Y-%m-%d"):
+            parser.error("--watch always follows today's prices and cannot be combined with --date")
+        if args.out and args.format not in ("csv", "ndjson"):
+            parser.error("--watch writes csv or ndjson")
+    elif args.watch_count is not None:
+        parser.error("--watch-count requires --watch")
     setup_logging(args.verbose)
+    
+    recorder = instrument.enable() if args.profile or args.profile_out else None
+    try:
+        _run(args)
+    finally:
+        if recorder is not None:
+            instrument.disable()
+            print(recorder.report(), file=sys.stderr)
+            if args.profile_out:
+                recorder.write(args.profile_out)
+                logging.getLogger(__name__).info(f"Profile written to {args.profile_out}")
+
+
+def _load_ranking(args) -> "tuple[RankedTable, str] | None":
+    """
+    读取 materialize 预计算的排名
+
+    索引在元数据有效期内且保存深度不小于 --top 时可用；--cache-only 时不检查有效期。
+
+    Returns:
+        (RankedTable, actual_date) 或 None
+    """
+    if args.no_cache or args.start or args.point_in_time or args.watch:
+        return None
+    from .rankings import RankStore
+    
+    with instrument.span("rankings"):
+        found = RankStore(provider=args.provider).lookup(
+            args.date, max_age=None if args.cache_only else args.cache_ttl * 3600
+        )
+    if found is None or not found[0].complete(args.top):
+        return None
+    return found
+
+
+def _load_snapshot(args) -> dict | None:
+    """
+    读取可直接回答本次查询的快照
+
+    查询日已过去（收盘价不会再变）且快照在元数据有效期内时可用；
+    --cache-only 时只要有快照就用。
+
+    Returns:
+        快照或 None
+    """
+    if args.no_cache or args.start or args.point_in_time or args.watch:
+        return None
+    with instrument.span("snapshot"):
+        snapshot = SnapshotCache(provider=args.provider).load(args.date)
+    if snapshot is None or args.cache_only:
+        return snapshot
+    if args.date >= datetime.now().strftime("%Y-%m-%d"):
+        return None
+    if time.time() - snapshot["saved_at"] > args.cache_ttl * 3600:
+        return None
+    return snapshot
+
+
+def _run(args):
+    """执行查询：抓取、计算并输出排名（区间模式转交 _run_range）"""
     logger = logging.getLogger(__name__)
     
-    # 1. 加载股票池
+    # 预计算排名或快照命中时直接输出，不创建数据源、不导入 pandas/yfinance
+    ranking = _load_ranking(args)
+    if ranking is not None:
+        ranked, actual_date = ranking
+        logger.info(f"Answering from ranking index of {actual_date}")
+        _output(args, ranked, actual_date)
+        logger.info("Done!")
+        return
+    
+    snapshot = _load_snapshot(args)
+    if snapshot is not None:
+        logger.info(f"Answering from snapshot of {snapshot['actual_date']}")
+        _output(args, snapshot["stocks"], snapshot["actual_date"])
+        logger.info("Done!")
+        return
+    if args.cache_only:
+        logger.error(
+            f"No ranking index or snapshot for {args.date} "
+            f"(run once without --cache-only, or 'capscope materialize')"
+        )
+        sys.exit(1)
+    
+    from .metadata import fetch_metadata
+    from .prices import fetch_prices
+    from .compute import compute_market_caps
+    from .shares import history_start, load_shares, point_in_time_metadata
+    
+    provider = build_provider(args)
+    
+    # 1. 加载股票池（只取查询日/区间内属于成分的股票）
     logger.info("Loading universe...")
-    tickers = get_universe()
+    with instrument.span("universe"):
+        if args.start:
+            tickers = get_universe_between(args.start, args.end)
+        else:
+            tickers = get_universe(args.date)
     logger.info(f"Loaded {len(tickers)} tickers")
     
     # 2. 获取元数据
@@ -72,24 +293,69 @@ def main():
         pct = done * 100 // total
         print(f"\rFetching metadata: {done}/{total} ({pct}%)", end="", flush=True)
     
-    metadata = fetch_metadata(tickers, progress_callback=progress)
+    cache = None if args.no_cache else MetadataCache(
+        ttl=args.cache_ttl * 3600, provider=provider.name
+    )
+    metadata = fetch_metadata(
+        tickers, progress_callback=progress, cache=cache, provider=provider
+    )
     print()  # 换行
     
+    valid_tickers = [m["ticker"] for m in metadata]
+    price_cache = None if args.no_cache else PriceCache(provider=provider.name)
+    
+    shares_store = None
+    if args.point_in_time:
+        shares_store = SharesStore(
+            ":memory:" if args.no_cache else None,
+            ttl=args.cache_ttl * 3600,
+            provider=provider.name
+        )
+    
+    if args.start:
+        _run_range(args, metadata, price_cache, provider, shares_store)
+        return
+    if args.watch:
+        _run_watch(args, metadata, provider)
+        return
+    
     # 3. 获取价格
     logger.info(f"Fetching prices for {args.date}...")
-    valid_tickers = [m["ticker"] for m in metadata]
-    prices, actual_date = fetch_prices(valid_tickers, args.date)
+    prices, actual_date = fetch_prices(
+        valid_tickers, args.date, cache=price_cache, provider=provider
+    )
     
     if actual_date != args.date:
         logger.info(f"Note: Using trading day {actual_date} (requested {args.date})")
     
+    if shares_store is not None:
+        logger.info("Loading point-in-time shares...")
+        index = load_shares(valid_tickers, history_start(actual_date), shares_store, provider)
+        metadata = point_in_time_metadata(metadata, actual_date, index)
+    
     # 4. 计算市值
     logger.info("Computing market caps...")
-    stocks = compute_market_caps(metadata, prices)
+    with instrument.span("compute"):
+        stocks = compute_market_caps(metadata, prices)
+    if not args.no_cache and shares_store is None:
+        # 快照与 GUI 共用，只保存按当前股数计算的结果
+        with instrument.span("snapshot"):
+            SnapshotCache(provider=provider.name).save(args.date, actual_date, stocks)
+    
+    _output(args, stocks, actual_date)
+    logger.info("Done!")
+
+
+def _output(args, stocks: "list[dict] | RankedTable", actual_date: str):
+    """过滤/排名并输出（计算结果、快照与预计算排名共用）"""
+    from .compute import rank_by_sector, get_top_overall
+    
+    logger = logging.getLogger(__name__)
     
     # 5. 过滤/排名
     if args.sector:
-        by_sector = rank_by_sector(stocks, args.top)
+        with instrument.span("rank"):
+            by_sector = rank_by_sector(stocks, args.top)
         if args.sector in by_sector:
             output_stocks = by_sector[args.sector]
         else:
@@ -97,20 +363,106 @@ def main():
             logger.info(f"Available sectors: {list(by_sector.keys())}")
             sys.exit(1)
     else:
-        output_stocks = get_top_overall(stocks, args.top)
+        with instrument.span("rank"):
+            output_stocks = get_top_overall(stocks, args.top)
     
     # 6. 输出
-    if args.out:
-        if args.format == "json":
-            export_json(output_stocks, args.date, actual_date, args.out)
+    with instrument.span("export"):
+        if args.out:
+            if args.format == "json":
+                export_json(output_stocks, args.date, actual_date, args.out)
+            else:
+                export_records(output_stocks, args.out, args.format)
+            logger.info(f"Exported to {args.out}")
         else:
-            export_csv(output_stocks, args.out)
-        logger.info(f"Exported to {args.out}")
-    else:
-        print_csv(output_stocks)
+            print_csv(output_stocks)
+
+
+def _run_range(args, metadata: list[dict], price_cache, provider, shares_store=None):
+    """区间模式：一次下载收盘价面板，输出每个交易日的排名长表"""
+    from .prices import fetch_price_panel
+    from .compute import iter_market_cap_series
+    from .shares import history_start, load_shares, shares_frame
+    from .universe import membership_mask
+    
+    logger = logging.getLogger(__name__)
+    
+    # 3. 获取价格面板
+    valid_tickers = [m["ticker"] for m in metadata]
+    closes = fetch_price_panel(
+        valid_tickers, args.start, args.end, cache=price_cache, provider=provider
+    )
+    # 不属于当日成分的股票不参与当日排名
+    closes = closes.where(membership_mask(list(closes.columns), closes.index.values))
+    
+    shares = None
+    if shares_store is not None:
+        logger.info("Loading point-in-time shares...")
+        index = load_shares(valid_tickers, history_start(args.start), shares_store, provider)
+        shares = shares_frame(valid_tickers, closes.index, index)
+    
+    _check_sector(args, metadata)
+    
+    # 4-5. 逐块计算每日排名并流式输出（内存与区间长度无关）
+    logger.info("Computing market cap series...")
+    chunks = iter_market_cap_series(
+        metadata, closes, top_n=args.top, sector=args.sector, shares=shares
+    )
+    with instrument.span("compute+export"):
+        if args.out:
+            rows = export_series(chunks, args.out, args.format)
+            logger.info(f"Exported {rows} rows to {args.out}")
+        else:
+            print_series(chunks)
     
     logger.info("Done!")
 
 
+def _check_sector(args, metadata: list[dict]):
+    """--sector 不在元数据中时报错退出"""
+    if args.sector and args.sector not in {m["sector"] for m in metadata}:
+        logger = logging.getLogger(__name__)
+        logger.error(f"Sector '{args.sector}' not found")
+        logger.info(f"Available sectors: {sorted({m['sector'] for m in metadata})}")
+        sys.exit(1)
+
+
+def _run_watch(args, metadata: list[dict], provider):
+    """盘中模式：元数据只取一次，之后每隔 --watch 秒只拉最新价格并输出排名变化"""
+    from .watch import ALL, LiveRanking, watch
+    
+    logger = logging.getLogger(__name__)
+    _check_sector(args, metadata)
+    
+    ranking = LiveRanking(metadata, top_n=args.top, sector=args.sector)
+    group = args.sector or ALL
+    writer = open_writer(args.out, args.format, WATCH_FIELDNAMES) if args.out else None
+    first = True
+    
+    def emit(changes: dict[str, list[dict]]):
+        nonlocal first
+        events = changes.get(group)
+        if not events:
+            return
+        now = datetime.now().strftime("%H:%M:%S")
+        rows = [{"time": now, **event} for event in events]
+        if writer is not None:
+            writer.write(rows)
+            writer.flush()
+        else:
+            print_changes(rows, header=first)
+        first = False
+    
+    logger.info(f"Watching {len(metadata)} tickers every {args.watch:g}s (Ctrl+C to stop)")
+    try:
+        watch(ranking, provider, args.watch, emit, count=args.watch_count)
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    finally:
+        if writer is not None:
+            writer.close()
+            logger.info(f"Changes written to {args.out}")
+
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,14 @@
 """市值计算与排名模块"""
 
 import logging
+import threading
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Iterator
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +32,375 @@ SECTOR_CN_MAP = {
 }
 
 
+# 行业驻留表：StockRecord 只存编码，同名行业在进程内共用同一个字符串
+_sector_names: list[str] = []
+_sector_cn: list[str] = []
+_sector_codes: dict[str, int] = {}
+_sector_lock = threading.Lock()
+
+
+def sector_code(sector: str) -> int:
+    """行业名 → 进程内唯一的编码（首次出现时登记）"""
+    code = _sector_codes.get(sector)
+    if code is None:
+        with _sector_lock:
+            code = _sector_codes.get(sector)
+            if code is None:
+                code = len(_sector_names)
+                _sector_names.append(sector)
+                _sector_cn.append(SECTOR_CN_MAP.get(sector, "未分类"))
+                _sector_codes[sector] = code
+    return code
+
+
+class StockRecord(Mapping):
+    """
+    一只股票的市值记录
+
+    字段存在 __slots__ 里，行业只存驻留编码，sector/sector_cn 按编码查表。
+    同时是只读 Mapping：r["close"]、r.get()、dict(r) 等字典用法照常可用。
+    """
+
+    __slots__ = ("ticker", "name", "sector_code", "close", "shares", "market_cap", "market_cap_b")
+
+    FIELDS = ("ticker", "name", "sector", "sector_cn", "close", "shares", "market_cap", "market_cap_b")
+    _KEYS = frozenset(FIELDS)
+
+    def __init__(
+        self,
+        ticker: str,
+        name: str,
+        sector_code: int,
+        close: float,
+        shares: float,
+        market_cap: float,
+        market_cap_b: float
+    ):
+        self.ticker = ticker
+        self.name = name
+        self.sector_code = sector_code
+        self.close = close
+        self.shares = shares
+        self.market_cap = market_cap
+        self.market_cap_b = market_cap_b
+
+    @classmethod
+    def from_dict(cls, stock: dict) -> "StockRecord":
+        """由字典（如快照 JSON）构建"""
+        return cls(
+            stock["ticker"], stock["name"], sector_code(stock["sector"]), stock["close"],
+            stock["shares"], stock["market_cap"], stock["market_cap_b"]
+        )
+
+    @property
+    def sector(self) -> str:
+        return _sector_names[self.sector_code]
+
+    @property
+    def sector_cn(self) -> str:
+        return _sector_cn[self.sector_code]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, StockRecord):
+            return (
+                self.ticker == other.ticker and self.name == other.name
+                and self.sector_code == other.sector_code and self.close == other.close
+                and self.shares == other.shares and self.market_cap == other.market_cap
+            )
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"StockRecord({self.to_dict()!r})"
+
+
+def as_records(stocks: list) -> list[StockRecord]:
+    """把字典列表（如快照）转为 StockRecord 列表，已是记录的原样保留"""
+    if all(isinstance(s, StockRecord) for s in stocks):
+        return stocks if isinstance(stocks, list) else list(stocks)
+    return [s if isinstance(s, StockRecord) else StockRecord.from_dict(s) for s in stocks]
+
+
+class MarketCapTable:
+    """
+    列式市值表
+
+    ticker/公司名/行业编码/股数/收盘价/市值各存一个数组，
+    排名用 argpartition 只排前 N，字典只在输出时生成。
+    """
+
+    def __init__(
+        self,
+        tickers: np.ndarray,
+        names: np.ndarray,
+        sector_codes: np.ndarray,
+        sectors: list[str],
+        shares: np.ndarray,
+        closes: np.ndarray,
+        market_caps: np.ndarray | None = None
+    ):
+        """
+        Args:
+            tickers: ticker 数组（object）
+            names: 公司名数组（object）
+            sector_codes: 行业编码数组（int32，对应 sectors 下标）
+            sectors: 行业名列表
+            shares: 流通股数（float64）
+            closes: 收盘价（float64）
+            market_caps: 市值（float64），默认 closes * shares
+        """
+        self.tickers = tickers
+        self.names = names
+        self.sector_codes = sector_codes
+        self.sectors = sectors
+        self.shares = shares
+        self.closes = closes
+        self.market_caps = closes * shares if market_caps is None else market_caps
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    @staticmethod
+    def _encode_sectors(values: list) -> tuple[np.ndarray, list]:
+        """行业名（或驻留编码）→ (编码数组, 按首次出现排列的原值)"""
+        sectors: dict = {}
+        codes = np.fromiter(
+            (sectors.setdefault(v, len(sectors)) for v in values),
+            dtype=np.int32,
+            count=len(values)
+        )
+        return codes, list(sectors)
+
+    @classmethod
+    def from_metadata(cls, metadata: list[dict], prices: dict[str, float]) -> "MarketCapTable":
+        """
+        由元数据和收盘价构建（没有价格的股票被跳过）
+
+        Args:
+            metadata: [{ticker, name, sector, shares}, ...]
+            prices: {ticker: close_price, ...}
+        """
+        metadata = [m for m in metadata if m["ticker"] in prices]
+        n = len(metadata)
+        codes, sectors = cls._encode_sectors([m["sector"] for m in metadata])
+
+        return cls(
+            tickers=np.array([m["ticker"] for m in metadata], dtype=object),
+            names=np.array([m["name"] for m in metadata], dtype=object),
+            sector_codes=codes,
+            sectors=sectors,
+            shares=np.fromiter((m["shares"] for m in metadata), dtype=np.float64, count=n),
+            closes=np.fromiter((prices[m["ticker"]] for m in metadata), dtype=np.float64, count=n)
+        )
+
+    @classmethod
+    def from_records(cls, stocks: list[StockRecord]) -> "MarketCapTable":
+        """由 compute_market_caps 的输出（或同字段的字典列表）重建"""
+        stocks = as_records(stocks)
+        n = len(stocks)
+        codes, interned = cls._encode_sectors([s.sector_code for s in stocks])
+        sectors = [_sector_names[code] for code in interned]
+
+        return cls(
+            tickers=np.array([s.ticker for s in stocks], dtype=object),
+            names=np.array([s.name for s in stocks], dtype=object),
+            sector_codes=codes,
+            sectors=sectors,
+            shares=np.fromiter((s.shares for s in stocks), dtype=np.float64, count=n),
+            closes=np.fromiter((s.close for s in stocks), dtype=np.float64, count=n),
+            market_caps=np.fromiter((s.market_cap for s in stocks), dtype=np.float64, count=n)
+        )
+
+    def _top_of(self, idx: np.ndarray, n: int) -> np.ndarray:
+        """idx 中市值最大的 n 个（降序，市值相同按原顺序）"""
+        if n <= 0 or len(idx) == 0:
+            return idx[:0]
+        caps = self.market_caps[idx]
+        if n < len(idx):
+            # argpartition 在边界处的并列中任取，这里取第 n 大的市值，
+            # 大于它的全部保留，等于它的按原顺序取够 n 个
+            kth = -np.partition(-caps, n - 1)[n - 1]
+            above = np.flatnonzero(caps > kth)
+            ties = np.flatnonzero(caps == kth)[:n - len(above)]
+            part = np.concatenate([above, ties])
+            idx, caps = idx[part], caps[part]
+        order = np.lexsort((idx, -caps))
+        return idx[order]
+
+    def top(self, n: int | None = None) -> np.ndarray:
+        """
+        全市场按市值降序的前 n 个下标
+
+        Args:
+            n: 取前 N，None 表示全部
+        """
+        n = len(self) if n is None else n
+        return self._top_of(np.arange(len(self)), n)
+
+    def top_by_sector(self, n: int) -> dict[str, np.ndarray]:
+        """
+        每个行业市值最大的 n 个下标
+
+        Returns:
+            {sector: 下标数组}，行业按其最大市值降序
+        """
+        # 按行业编码稳定排序后各行业连续，再在组内 argpartition
+        grouped = np.argsort(self.sector_codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(self.sector_codes[grouped])) + 1
+
+        result = {}
+        leaders = {}  # 行业 → 其市值最大的下标（n <= 0 时各组为空，仍按它排序）
+        for group in np.split(grouped, bounds):
+            if len(group) == 0:
+                continue
+            sector = self.sectors[self.sector_codes[group[0]]]
+            top = result[sector] = self._top_of(group, n)
+            leaders[sector] = top[0] if len(top) else self._top_of(group, 1)[0]
+
+        # 最大市值相同的行业按其龙头的原顺序
+        return {
+            sector: result[sector]
+            for sector in sorted(result, key=lambda s: (-self.market_caps[leaders[s]], leaders[s]))
+        }
+
+    def to_records(self, idx: np.ndarray) -> list[StockRecord]:
+        """
+        生成记录列表
+
+        Returns:
+            [StockRecord, ...]，字段为
+            {ticker, name, sector, sector_cn, close, shares, market_cap, market_cap_b}
+        """
+        codes = [sector_code(s) for s in self.sectors]
+
+        caps = self.market_caps[idx]
+        shares = self.shares[idx]
+        # 股数是整数，保持整数输出
+        if np.array_equal(shares, np.floor(shares)):
+            shares = shares.astype(np.int64)
+
+        columns = zip(
+            self.tickers[idx].tolist(),
+            self.names[idx].tolist(),
+            self.sector_codes[idx].tolist(),
+            np.round(self.closes[idx], 2).tolist(),
+            shares.tolist(),
+            np.round(caps, 2).tolist(),
+            np.round(caps / 1e9, 2).tolist()  # 十亿美元
+        )
+
+        return [
+            StockRecord(ticker, name, codes[code], close, share, cap, cap_b)
+            for ticker, name, code, close, share, cap, cap_b in columns
+        ]
+
+
+class RankedTable:
+    """
+    预先排好名的市值表（rankings 索引中的一个交易日）
+
+    每个行业与全市场各有一段按市值降序的数组（最多 depth 只），
+    取前 N 只只需切片，开销与股票总数无关。
+    """
+
+    def __init__(
+        self,
+        tickers: np.ndarray,
+        names: np.ndarray,
+        sector_codes: np.ndarray,
+        sectors: list[str],
+        ids: np.ndarray,
+        closes: np.ndarray,
+        shares: np.ndarray,
+        offsets: np.ndarray,
+        count: int,
+        depth: int
+    ):
+        """
+        Args:
+            tickers: ticker 表（object）
+            names: 公司名表（object）
+            sector_codes: 每个 ticker 的行业编码（int32，对应 sectors 下标）
+            sectors: 行业名列表
+            ids: 各段依次拼接的 ticker 编号（可为内存映射）
+            closes: 对应收盘价
+            shares: 对应股数
+            offsets: len(sectors) + 2 个段边界：前 len(sectors) 段为各行业，最后一段为全市场
+            count: 当日有价格的股票数
+            depth: 每段最多保存的股票数
+        """
+        self.tickers = tickers
+        self.names = names
+        self.sector_codes = sector_codes
+        self.sectors = sectors
+        self.ids = ids
+        self.closes = closes
+        self.shares = shares
+        self.offsets = offsets
+        self.count = count
+        self.depth = depth
+
+    def __len__(self) -> int:
+        return self.count
+
+    def complete(self, n: int | None) -> bool:
+        """前 n 只是否都在索引里（n 超过保存深度时需要现场计算）"""
+        return n is not None and n <= self.depth
+
+    def _segment(self, k: int, n: int | None) -> list[StockRecord]:
+        """第 k 段的前 n 只"""
+        start, stop = int(self.offsets[k]), int(self.offsets[k + 1])
+        if n is not None:
+            stop = min(stop, start + max(n, 0))
+        ids = np.asarray(self.ids[start:stop])
+        table = MarketCapTable(
+            tickers=self.tickers[ids],
+            names=self.names[ids],
+            sector_codes=self.sector_codes[ids],
+            sectors=self.sectors,
+            shares=np.asarray(self.shares[start:stop], dtype=np.float64),
+            closes=np.asarray(self.closes[start:stop], dtype=np.float64)
+        )
+        return table.to_records(np.arange(len(ids)))
+
+    def top(self, n: int | None = None) -> list[StockRecord]:
+        """全市场前 n 只（None 表示索引中保存的全部）"""
+        return self._segment(len(self.sectors), n)
+
+    def top_by_sector(self, n: int) -> dict[str, list[StockRecord]]:
+        """
+        每个行业前 n 只
+
+        Returns:
+            {sector: [stocks]}，行业按其最大市值降序（与 rank_by_sector 一致）
+        """
+        result = {}
+        for k, sector in enumerate(self.sectors):
+            stocks = self._segment(k, n)
+            if stocks:
+                result[sector] = stocks
+        return dict(sorted(result.items(), key=lambda item: -item[1][0]["market_cap"]))
+
+
 def compute_market_caps(
     metadata: list[dict],
     prices: dict[str, float]
-) -> list[dict]:
+) -> list[StockRecord]:
     """
     计算市值
     
@@ -36,69 +409,186 @@ def compute_market_caps(
         prices: {ticker: close_price, ...}
     
     Returns:
-        [{ticker, name, sector, sector_cn, close, shares, market_cap, market_cap_b}, ...]
+        [StockRecord, ...]（按市值降序），字段为
+        {ticker, name, sector, sector_cn, close, shares, market_cap, market_cap_b}
     """
-    results = []
+    table = MarketCapTable.from_metadata(metadata, prices)
     
-    for stock in metadata:
-        ticker = stock["ticker"]
-        
-        if ticker not in prices:
-            logger.debug(f"No price for {ticker}, skipping")
-            continue
-        
-        close = prices[ticker]
-        shares = stock["shares"]
-        market_cap = close * shares
-        
-        results.append({
-            "ticker": ticker,
-            "name": stock["name"],
-            "sector": stock["sector"],
-            "sector_cn": SECTOR_CN_MAP.get(stock["sector"], "未分类"),
-            "close": round(close, 2),
-            "shares": shares,
-            "market_cap": round(market_cap, 2),
-            "market_cap_b": round(market_cap / 1e9, 2)  # 十亿美元
-        })
-    
-    # 按市值降序排序
-    results.sort(key=lambda x: x["market_cap"], reverse=True)
+    skipped = len(metadata) - len(table)
+    if skipped:
+        logger.debug(f"No price for {skipped} tickers, skipped")
     
-    logger.info(f"Computed market caps for {len(results)} stocks")
-    return results
+    logger.info(f"Computed market caps for {len(table)} stocks")
+    return table.to_records(table.top())
 
 
 def rank_by_sector(
-    stocks: list[dict],
+    stocks: list[StockRecord] | MarketCapTable | RankedTable,
     top_n: int = 100
-) -> dict[str, list[dict]]:
+) -> dict[str, list[StockRecord]]:
     """
     按行业分组并排名
     
     Args:
-        stocks: 已计算市值的股票列表
+        stocks: 已计算市值的股票列表（或 MarketCapTable / 预计算的 RankedTable）
         top_n: 每行业取前 N 只
     
     Returns:
         {sector: [top N stocks], ...}
     """
-    sectors: dict[str, list[dict]] = {}
-    
-    for stock in stocks:
-        sector = stock["sector"]
-        if sector not in sectors:
-            sectors[sector] = []
-        sectors[sector].append(stock)
+    if isinstance(stocks, RankedTable):
+        return stocks.top_by_sector(top_n)
     
-    # 每个行业按市值排序，取 top N
-    for sector in sectors:
-        sectors[sector].sort(key=lambda x: x["market_cap"], reverse=True)
-        sectors[sector] = sectors[sector][:top_n]
+    table = stocks if isinstance(stocks, MarketCapTable) else MarketCapTable.from_records(stocks)
     
-    return sectors
+    return {
+        sector: table.to_records(idx)
+        for sector, idx in table.top_by_sector(top_n).items()
+    }
+
+
+# 区间模式每块最多处理的 (交易日 × ticker) 单元数，决定分块内存上限
+SERIES_CHUNK_CELLS = 100_000
+
+
+def iter_market_cap_series(
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    top_n: int | None = None,
+    sector: str | None = None,
+    shares: "pd.DataFrame | None" = None,
+    chunk_days: int | None = None
+) -> "Iterator[pd.DataFrame]":
+    """
+    逐块计算日期区间内每个交易日的市值与排名
+
+    每天的排名互不依赖，按 chunk_days 个交易日一块计算并产出，
+    内存占用只与块大小有关，与区间长度无关。
+
+    Args:
+        metadata: [{ticker, name, sector, shares}, ...]
+        closes: 收盘价宽表（index=交易日，columns=ticker）
+        top_n: 每日只保留前 N（指定 sector 时按行业内排名）
+        sector: 只保留某个行业
+        shares: 每个交易日的股数宽表（point-in-time），缺失处用元数据中的当前股数
+        chunk_days: 每块的交易日数，默认按 SERIES_CHUNK_CELLS 推算
+
+    Yields:
+        长表 DataFrame 块，列同 compute_market_cap_series，块内按 (date, rank) 排序
+    """
+    import pandas as pd
+
+    metadata = [m for m in metadata if m["ticker"] in closes.columns]
+    tickers = np.array([m["ticker"] for m in metadata], dtype=object)
+    names = np.array([m["name"] for m in metadata], dtype=object)
+    codes, sectors = MarketCapTable._encode_sectors([m["sector"] for m in metadata])
+    current = np.fromiter((m["shares"] for m in metadata), dtype=np.float64, count=len(metadata))
+    sector_names = np.array(sectors, dtype=object)
+    sector_cn = np.array([SECTOR_CN_MAP.get(s, "未分类") for s in sectors], dtype=object)
+    sector_columns = [np.flatnonzero(codes == code) for code in range(len(sectors))]
+
+    closes = closes.reindex(columns=list(tickers))
+    if shares is not None:
+        shares = shares.reindex(index=closes.index, columns=list(tickers))
+
+    def _ranks(key: np.ndarray) -> np.ndarray:
+        """每行按 key 升序的名次（从 1 开始）"""
+        order = np.argsort(key, axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, key.shape[1] + 1)[None, :], axis=1)
+        return ranks
+
+    if chunk_days is None:
+        chunk_days = max(1, SERIES_CHUNK_CELLS // max(1, len(tickers)))
+
+    total = 0
+    for start in range(0, len(closes), chunk_days):
+        # (date × ticker) 股数与市值矩阵
+        dates = closes.index[start:start + chunk_days]
+        panel = closes.iloc[start:start + chunk_days].to_numpy(dtype=np.float64)
+        if shares is None:
+            share_panel = np.broadcast_to(current, panel.shape)
+        else:
+            share_panel = shares.iloc[start:start + chunk_days].to_numpy(dtype=np.float64)
+            share_panel = np.where(np.isnan(share_panel), current, share_panel)
+        caps = panel * share_panel
+        valid = ~np.isnan(caps)
+        sort_key = np.where(valid, -caps, np.inf)
+
+        ranks = _ranks(sort_key)
+        sector_ranks = np.empty_like(ranks)
+        for columns in sector_columns:
+            sector_ranks[:, columns] = _ranks(sort_key[:, columns])
+
+        keep = valid
+        if sector is not None:
+            keep = keep & (sector_names[codes] == sector)[None, :]
+        if top_n is not None:
+            keep = keep & ((sector_ranks if sector is not None else ranks) <= top_n)
+
+        rows, cols = np.nonzero(keep)
+        row_caps = caps[rows, cols]
+        row_shares = share_panel[rows, cols]
+        if np.array_equal(row_shares, np.floor(row_shares)):
+            row_shares = row_shares.astype(np.int64)
+
+        chunk = pd.DataFrame({
+            "date": dates[rows].strftime("%Y-%m-%d"),
+            "rank": ranks[rows, cols],
+            "sector_rank": sector_ranks[rows, cols],
+            "ticker": tickers[cols],
+            "name": names[cols],
+            "sector": sector_names[codes[cols]],
+            "sector_cn": sector_cn[codes[cols]],
+            "close": np.round(panel[rows, cols], 2),
+            "shares": row_shares,
+            "market_cap": np.round(row_caps, 2),
+            "market_cap_b": np.round(row_caps / 1e9, 2)
+        })
+        total += len(chunk)
+        yield chunk.sort_values(["date", "rank"], kind="stable").reset_index(drop=True)
+
+    logger.info(
+        f"Computed market cap series: {closes.shape[0]} days × {len(tickers)} tickers, "
+        f"{total} rows"
+    )
+
+
+def compute_market_cap_series(
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    top_n: int | None = None,
+    sector: str | None = None,
+    shares: "pd.DataFrame | None" = None
+) -> "pd.DataFrame":
+    """
+    计算日期区间内每个交易日的市值与排名
+
+    Args:
+        metadata: [{ticker, name, sector, shares}, ...]
+        closes: 收盘价宽表（index=交易日，columns=ticker）
+        top_n: 每日只保留前 N（指定 sector 时按行业内排名）
+        sector: 只保留某个行业
+        shares: 每个交易日的股数宽表（point-in-time），缺失处用元数据中的当前股数
+
+    Returns:
+        长表 DataFrame，列为
+        [date, rank, sector_rank, ticker, name, sector, sector_cn,
+         close, shares, market_cap, market_cap_b]，按 (date, rank) 排序
+    """
+    import pandas as pd
+
+    chunks = list(iter_market_cap_series(metadata, closes, top_n, sector, shares))
+    if not chunks:
+        return pd.DataFrame(columns=[
+            "date", "rank", "sector_rank", "ticker", "name", "sector", "sector_cn",
+            "close", "shares", "market_cap", "market_cap_b"
+        ])
+    return pd.concat(chunks, ignore_index=True)
 
 
-def get_top_overall(stocks: list[dict], top_n: int = 100) -> list[dict]:
-    """获取全市场 Top N"""
+def get_top_overall(stocks: list[StockRecord] | RankedTable, top_n: int = 100) -> list[StockRecord]:
+    """获取全市场 Top N（RankedTable 直接取预排好的前 N 只）"""
+    if isinstance(stocks, RankedTable):
+        return stocks.top(top_n)
     return stocks[:top_n]
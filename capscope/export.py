@@ -1,66 +1,510 @@
-"""导出模块"""
+"""导出模块
+
+所有格式都由流式 writer 写出：逐批接收记录（dict/StockRecord 列表或 DataFrame 块），
+写完即释放，内存占用与结果总量无关。
+
+    with open_writer("out.parquet", "parquet", SERIES_FIELDNAMES) as writer:
+        for chunk in iter_market_cap_series(...):
+            writer.write(chunk)
+"""
 
 import csv
+import itertools
 import json
-from datetime import datetime
-from pathlib import Path
+import operator
+import sys
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FIELDNAMES = ["ticker", "name", "sector", "sector_cn", "close", "shares", "market_cap", "market_cap_b"]
+SERIES_FIELDNAMES = ["date", "rank", "sector_rank"] + FIELDNAMES
+# 盘中模式每轮输出的排名变化
+WATCH_FIELDNAMES = ["time", "event", "rank", "prev_rank", "ticker", "name", "sector", "close", "market_cap_b"]
+
+# 支持的导出格式
+FORMATS = ["csv", "json", "ndjson", "parquet", "arrow"]
+
+# 列表类记录每次写出的行数
+CHUNK_SIZE = 10_000
+
+# JSON 类格式把 DataFrame 块再切成的行数（序列化时的中间字符串/字典与之成正比）
+JSON_SLICE_ROWS = 5_000
+
+
+def _chunked(records: Iterable[dict], size: int = CHUNK_SIZE) -> Iterable[list[dict]]:
+    """把记录流切成固定大小的批"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _is_frame(batch: Any) -> bool:
+    return hasattr(batch, "to_dict") and hasattr(batch, "columns")
+
+
+def _values(records: list, fieldnames: list[str]) -> Iterator[tuple]:
+    """
+    按列顺序逐条取出记录的值
+
+    dict 逐键 get（缺失为 None）；StockRecord 直接按属性取，省去逐键查找
+    """
+    if isinstance(records[0], dict):
+        return (tuple(r.get(f) for f in fieldnames) for r in records)
+    get = operator.attrgetter(*fieldnames)
+    if len(fieldnames) == 1:
+        return ((get(r),) for r in records)
+    return map(get, records)
+
+
+def frame_values(frame: "pd.DataFrame", fieldnames: list[str]) -> Iterator[tuple]:
+    """
+    按列顺序逐行取出 DataFrame 的值
+
+    转成 Python 标量（缺失为 None），json.dumps 输出与记录列表完全一致
+    （float 按 repr，不经 to_json 的 10 位精度截断）
+    """
+    columns = []
+    for name in fieldnames:
+        column = frame[name]
+        values = column.tolist()
+        if column.hasnans:
+            values = [None if missing else v for v, missing in zip(values, column.isna().tolist())]
+        columns.append(values)
+    return zip(*columns)
+
+
+class RecordWriter(ABC):
+    """流式 writer 基类：write() 逐批写入，close() 收尾"""
+
+    def __init__(self, path: str, fieldnames: list[str] = FIELDNAMES):
+        """
+        Args:
+            path: 输出文件路径
+            fieldnames: 输出列
+        """
+        self.path = path
+        self.fieldnames = fieldnames
+        self.count = 0
+
+    def write(self, batch: "list[dict] | pd.DataFrame") -> None:
+        """写入一批记录"""
+        if len(batch) == 0:
+            return
+        if _is_frame(batch):
+            self._write_frame(batch)
+        else:
+            self._write_records(batch)
+        self.count += len(batch)
+
+    def write_all(self, records: Iterable[dict]) -> None:
+        """分批写入任意记录流"""
+        for batch in _chunked(records):
+            self.write(batch)
+
+    @abstractmethod
+    def _write_records(self, records: list[dict]) -> None:
+        """写入一批 dict/StockRecord 记录（非空）"""
+
+    def _write_frame(self, frame: "pd.DataFrame") -> None:
+        self._write_records(frame.to_dict("records"))
+
+    def flush(self) -> None:
+        """把已写入的记录刷到磁盘（逐行格式写完一批即完整可读）"""
+
+    def close(self) -> None:
+        """写完收尾并关闭文件"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvWriter(RecordWriter):
+    """CSV（UTF-8 BOM，Excel 可直接打开）"""
+
+    def __init__(self, path: str, fieldnames: list[str] = FIELDNAMES):
+        super().__init__(path, fieldnames)
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def _write_records(self, records: list[dict]) -> None:
+        self._writer.writer.writerows(_values(records, self.fieldnames))
+
+    def _write_frame(self, frame: "pd.DataFrame") -> None:
+        frame.to_csv(
+            self._file, columns=self.fieldnames, header=False, index=False,
+            lineterminator=self._writer.writer.dialect.lineterminator
+        )
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class NdjsonWriter(RecordWriter):
+    """NDJSON：每行一条记录"""
+
+    def __init__(self, path: str, fieldnames: list[str] = FIELDNAMES):
+        super().__init__(path, fieldnames)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write_records(self, records: list[dict]) -> None:
+        self._write_values(_values(records, self.fieldnames))
+
+    def _write_frame(self, frame: "pd.DataFrame") -> None:
+        for start in range(0, len(frame), JSON_SLICE_ROWS):
+            piece = frame.iloc[start:start + JSON_SLICE_ROWS]
+            self._write_values(frame_values(piece, self.fieldnames))
+
+    def _write_values(self, rows: Iterable[tuple]) -> None:
+        fields = self.fieldnames
+        self._file.write("".join(
+            json.dumps(dict(zip(fields, values)), ensure_ascii=False) + "\n"
+            for values in rows
+        ))
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JsonWriter(RecordWriter):
+    """
+    JSON 文档（indent=2）
+
+    有 header 时输出 {header..., "total_stocks": N, "stocks": [...]}，
+    否则输出记录数组。total 未知时 total_stocks 写在数组之后。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: list[str] = FIELDNAMES,
+        header: dict | None = None,
+        total: int | None = None
+    ):
+        """
+        Args:
+            path: 输出文件路径
+            fieldnames: 输出列
+            header: 文档头字段（如 query_date/actual_date）
+            total: 记录总数（已知时写在数组之前）
+        """
+        super().__init__(path, fieldnames)
+        self._file = open(path, "w", encoding="utf-8")
+        self._header = header
+        self._total = total
+        self._indent = "    " if header is not None else "  "
+        self._started = False  # 是否已写出过记录（决定分隔逗号）
+
+        if header is None:
+            self._file.write("[")
+            return
+        self._file.write("{")
+        items = dict(header)
+        if total is not None:
+            items["total_stocks"] = total
+        for key, value in items.items():
+            self._file.write(f"\n  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},")
+        self._file.write('\n  "stocks": [')
+
+    def _write_records(self, records: list[dict]) -> None:
+        self._write_values(_values(records, self.fieldnames))
+
+    def _write_frame(self, frame: "pd.DataFrame") -> None:
+        for start in range(0, len(frame), JSON_SLICE_ROWS):
+            piece = frame.iloc[start:start + JSON_SLICE_ROWS]
+            self._write_values(frame_values(piece, self.fieldnames))
+
+    def _write_values(self, rows: Iterable[tuple]) -> None:
+        fields = self.fieldnames
+        parts = []
+        for values in rows:
+            text = json.dumps(dict(zip(fields, values)), ensure_ascii=False, indent=2)
+            parts.append("\n" + self._indent + text.replace("\n", "\n" + self._indent))
+        prefix = "," if self._started else ""
+        self._file.write(prefix + ",".join(parts))
+        self._started = True
+
+    def close(self) -> None:
+        indent = self._indent[:-2]
+        closing = f"\n{indent}]" if self._started else "]"
+        if self._header is None:
+            self._file.write(closing + "\n")
+        elif self._total is None:
+            self._file.write(f'{closing},\n  "total_stocks": {self.count}\n}}')
+        else:
+            self._file.write(f"{closing}\n}}")
+        self._file.close()
+
+
+def _arrow_schema(fieldnames: list[str]):
+    """各列的 Arrow 类型"""
+    import pyarrow as pa
 
+    types = {
+        "date": pa.date32(),
+        "rank": pa.int32(),
+        "sector_rank": pa.int32(),
+        "ticker": pa.string(),
+        "name": pa.string(),
+        "sector": pa.dictionary(pa.int8(), pa.string()),
+        "sector_cn": pa.dictionary(pa.int8(), pa.string()),
+        "close": pa.float64(),
+        "shares": pa.int64(),
+        "market_cap": pa.float64(),
+        "market_cap_b": pa.float64(),
+    }
+    return pa.schema([(f, types.get(f, pa.string())) for f in fieldnames])
+
+
+class ArrowWriter(RecordWriter):
+    """
+    Parquet / Arrow IPC（需要 pyarrow）
+
+    列带类型（日期为 date32，行业为字典编码），按批写入 row group / record batch。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: list[str] = FIELDNAMES,
+        fmt: str = "parquet",
+        compression: str = "zstd"
+    ):
+        """
+        Args:
+            path: 输出文件路径
+            fieldnames: 输出列
+            fmt: parquet 或 arrow（Arrow IPC 文件）
+            compression: 压缩算法（parquet: zstd/snappy/gzip/none；arrow: zstd/lz4/none）
+        """
+        super().__init__(path, fieldnames)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(f"{fmt} export requires pyarrow (pip install pyarrow)")
+
+        self._pa = pa
+        self.schema = _arrow_schema(fieldnames)
+        codec = None if compression == "none" else compression
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self.schema, compression=codec or "none")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=codec)
+            self._writer = pa.ipc.new_file(path, self.schema, options=options)
+
+    def _to_batch(self, columns: dict[str, list]):
+        pa = self._pa
+        arrays = []
+        for field in self.schema:
+            values = columns[field.name]
+            if field.name == "date":
+                values = [date.fromisoformat(v) if isinstance(v, str) else v for v in values]
+            elif field.name == "shares":
+                values = [None if v is None or v != v else int(v) for v in values]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, pa.string()).dictionary_encode().cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _write_records(self, records: list[dict]) -> None:
+        columns = dict(zip(self.fieldnames, map(list, zip(*_values(records, self.fieldnames)))))
+        self._writer.write_batch(self._to_batch(columns))
+
+    def _write_frame(self, frame: "pd.DataFrame") -> None:
+        columns = {f: frame[f].tolist() for f in self.fieldnames}
+        self._writer.write_batch(self._to_batch(columns))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_writer(
+    path: str,
+    fmt: str = "csv",
+    fieldnames: list[str] = FIELDNAMES,
+    **options
+) -> RecordWriter:
+    """
+    按格式创建流式 writer
+
+    Args:
+        path: 输出文件路径
+        fmt: csv/json/ndjson/parquet/arrow
+        fieldnames: 输出列
+        **options: 传给 writer 的参数（json 的 header/total，parquet/arrow 的 compression）
 
-def export_csv(stocks: list[dict], path: str) -> None:
+    Returns:
+        RecordWriter（用 with 保证收尾）
     """
-    导出为 CSV
-    
+    if fmt == "csv":
+        return CsvWriter(path, fieldnames)
+    if fmt == "json":
+        return JsonWriter(path, fieldnames, **options)
+    if fmt == "ndjson":
+        return NdjsonWriter(path, fieldnames)
+    if fmt in ("parquet", "arrow"):
+        return ArrowWriter(path, fieldnames, fmt, **options)
+    raise ValueError(f"Unknown export format '{fmt}', available: {FORMATS}")
+
+
+def export_records(
+    records: "Iterable[dict] | Iterable[pd.DataFrame]",
+    path: str,
+    fmt: str = "csv",
+    fieldnames: list[str] = FIELDNAMES,
+    **options
+) -> int:
+    """
+    把记录流（单条 dict 或 DataFrame 块）写入文件
+
+    Returns:
+        写出的记录数
+    """
+    with open_writer(path, fmt, fieldnames, **options) as writer:
+        pending = []
+        for item in records:
+            if _is_frame(item):
+                writer.write_all(pending)
+                pending = []
+                writer.write(item)
+            else:
+                pending.append(item)
+                if len(pending) >= CHUNK_SIZE:
+                    writer.write(pending)
+                    pending = []
+        writer.write_all(pending)
+    return writer.count
+
+
+def export_csv(stocks: Iterable[dict], path: str) -> None:
+    """
+    导出为 CSV（没有记录时不创建文件）
+
     Args:
-        stocks: 股票数据列表
+        stocks: 股票数据（列表或迭代器）
         path: 输出文件路径
     """
-    if not stocks:
+    stocks = iter(stocks)
+    first = next(stocks, None)
+    if first is None:
         return
-    
-    fieldnames = ["ticker", "name", "sector", "sector_cn", "close", "shares", "market_cap", "market_cap_b"]
-    
-    with open(path, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(stocks)
+    export_records(itertools.chain([first], stocks), path, "csv")
 
 
 def export_json(
-    stocks: list[dict],
+    stocks: Iterable[dict],
     query_date: str,
     actual_date: str,
     path: str
 ) -> None:
     """
     导出为 JSON
-    
+
     Args:
-        stocks: 股票数据列表
+        stocks: 股票数据（列表或迭代器）
         query_date: 用户请求日期
         actual_date: 实际使用的交易日
         path: 输出文件路径
     """
-    data = {
+    header = {
         "query_date": query_date,
         "actual_date": actual_date,
-        "generated_at": datetime.utcnow().isoformat() + "Z",
-        "total_stocks": len(stocks),
-        "stocks": stocks
+        "generated_at": datetime.utcnow().isoformat() + "Z"
     }
-    
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    total = len(stocks) if isinstance(stocks, list) else None
+    export_records(stocks, path, "json", header=header, total=total)
 
 
-def print_csv(stocks: list[dict]) -> None:
+def print_csv(stocks: Iterable[dict]) -> None:
     """输出到 stdout"""
-    if not stocks:
-        print("No data")
-        return
-    
     fieldnames = ["ticker", "name", "sector", "close", "shares", "market_cap_b"]
-    print(",".join(fieldnames))
-    
+    empty = True
+
     for stock in stocks:
+        if empty:
+            print(",".join(fieldnames))
+            empty = False
         row = [str(stock.get(f, "")) for f in fieldnames]
         print(",".join(row))
+
+    if empty:
+        print("No data")
+
+
+def print_changes(changes: list[dict], header: bool = True) -> None:
+    """
+    盘中排名变化输出到 stdout（每轮调用一次，立即刷新）
+
+    Args:
+        changes: 本轮的变化（字段见 WATCH_FIELDNAMES）
+        header: 是否先输出表头（只在第一轮输出）
+    """
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    if header:
+        writer.writerow(WATCH_FIELDNAMES)
+    writer.writerows(_values(changes, WATCH_FIELDNAMES) if changes else [])
+    sys.stdout.flush()
+
+
+def export_parquet(stocks: Iterable[dict], path: str) -> None:
+    """
+    导出为 Parquet（需要 pyarrow）
+
+    Args:
+        stocks: 股票数据（列表或迭代器）
+        path: 输出文件路径
+    """
+    export_records(stocks, path, "parquet")
+
+
+def export_series(series: "pd.DataFrame | Iterable[pd.DataFrame]", path: str, fmt: str = "csv") -> int:
+    """
+    导出区间市值长表
+
+    Args:
+        series: compute_market_cap_series 的结果，或 iter_market_cap_series 的分块
+        path: 输出文件路径
+        fmt: csv/json/ndjson/parquet/arrow
+
+    Returns:
+        写出的行数
+    """
+    chunks = [series] if _is_frame(series) else series
+    return export_records(chunks, path, fmt, SERIES_FIELDNAMES)
+
+
+def print_series(series: "pd.DataFrame | Iterable[pd.DataFrame]") -> None:
+    """区间市值输出到 stdout"""
+    fieldnames = ["date", "rank", "ticker", "name", "sector", "close", "shares", "market_cap_b"]
+    chunks = [series] if _is_frame(series) else series
+    empty = True
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        sys.stdout.write(chunk.to_csv(columns=fieldnames, index=False, header=empty))
+        empty = False
+
+    if empty:
+        print("No data")
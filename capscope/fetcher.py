@@ -0,0 +1,226 @@
+"""异步批量抓取模块
+
+令牌桶限速 + 指数退避重试 + AIMD 自适应并发。
+数据源调用本身是阻塞的（yfinance），在专用线程池中执行，
+由 asyncio 负责调度、限速和重试。
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from . import instrument
+
+logger = logging.getLogger(__name__)
+
+
+class FetchCancelled(Exception):
+    """抓取被调用方取消"""
+
+
+class TokenBucket:
+    """令牌桶限速器"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数（即平均请求速率）
+            capacity: 桶容量（允许的突发请求数），默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """取一个令牌，不足时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制
+
+    每成功一轮（limit 个请求）并发 +1；出错或延迟超过目标时并发减半。
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 32,
+        latency_target: float = 5.0
+    ):
+        """
+        Args:
+            initial: 初始并发数
+            minimum: 最小并发数
+            maximum: 最大并发数
+            latency_target: 单次请求的目标延迟（秒），超过视为拥塞
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        """记录一次成功请求"""
+        if latency > self.latency_target:
+            self._decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_error(self) -> None:
+        """记录一次失败请求"""
+        self._decrease()
+
+    def _decrease(self) -> None:
+        # 同一轮并发中的多个失败只减一次
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        logger.debug(f"Concurrency decreased to {int(self.limit)}")
+
+
+def is_throttled(error: Exception) -> bool:
+    """是否为限流错误（HTTP 429 / yfinance YFRateLimitError）"""
+    text = f"{type(error).__name__} {error}"
+    return "RateLimit" in text or "Too Many Requests" in text or "429" in text
+
+
+async def fetch_all(
+    batches: list[list[str]],
+    fetch: Callable[[list[str]], Any],
+    on_done: Callable[[list[str], Any | None], None],
+    rate: float | None = 20.0,
+    max_concurrency: int = 10,
+    retries: int = 3,
+    backoff: float = 0.5,
+    cancel_event: threading.Event | None = None
+) -> None:
+    """
+    并发抓取所有批次
+
+    Args:
+        batches: ticker 批次列表
+        fetch: 阻塞的抓取函数 batch -> result，失败抛异常
+        on_done: 每个批次结束时回调 (batch, result)，重试耗尽时 result 为 None
+        rate: 每秒最多发起的请求数，None 为不限速
+        max_concurrency: 最大并发数
+        retries: 失败后最多重试次数
+        backoff: 首次重试等待（秒），之后指数增长并加随机抖动
+        cancel_event: 取消标志，置位后不再发起新请求，未完成的批次直接放弃
+
+    Raises:
+        FetchCancelled: 抓取被取消
+    """
+    if not batches:
+        return
+
+    loop = asyncio.get_running_loop()
+    bucket = TokenBucket(rate) if rate is not None else None
+    limiter = AdaptiveLimiter(initial=min(4, max_concurrency), maximum=max_concurrency)
+
+    # 所有请求复用同一个线程池（yfinance 内部共享 session，连接按 host 复用）
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
+    def call(batch: list[str]) -> Any:
+        with instrument.span("fetch.request", size=len(batch)):
+            return fetch(batch)
+
+    async def run(batch: list[str]) -> None:
+        for attempt in range(retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            if cancelled():
+                return
+            async with limiter:
+                # 等待并发名额期间可能已被取消
+                if cancelled():
+                    return
+                started = time.monotonic()
+                instrument.count("fetch.requests")
+                try:
+                    # 在本任务上下文的副本中执行，埋点记到调用方的记录器
+                    context = contextvars.copy_context()
+                    result = await loop.run_in_executor(executor, context.run, call, batch)
+                except Exception as e:
+                    limiter.on_error()
+                    instrument.count("fetch.errors")
+                    if is_throttled(e):
+                        instrument.count("fetch.throttled")
+                    error = e
+                else:
+                    limiter.on_success(time.monotonic() - started)
+                    on_done(batch, result)
+                    return
+
+            if attempt < retries:
+                instrument.count("fetch.retries")
+                delay = backoff * (2 ** attempt) * (2 if is_throttled(error) else 1)
+                delay *= random.uniform(0.5, 1.5)
+                logger.debug(
+                    f"Retry {attempt + 1}/{retries} for {', '.join(batch)} "
+                    f"in {delay:.1f}s: {error}"
+                )
+                await asyncio.sleep(delay)
+
+        logger.error(f"Dropped {', '.join(batch)} after {retries + 1} attempts: {error}")
+        instrument.count("fetch.dropped", len(batch))
+        on_done(batch, None)
+
+    tasks = [asyncio.ensure_future(run(b)) for b in batches]
+
+    async def watch_cancel() -> None:
+        while not cancel_event.is_set():
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+
+    watcher = asyncio.ensure_future(watch_cancel()) if cancel_event is not None else None
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        if not cancelled():
+            raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        # 取消时不等待正在执行的阻塞调用，排队中的直接丢弃
+        executor.shutdown(wait=not cancelled(), cancel_futures=True)
+
+    if cancelled():
+        raise FetchCancelled()
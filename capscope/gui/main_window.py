@@ -1,39 +1,73 @@
 """主窗口"""
 
-import csv
+import os
 from datetime import datetime, date
 from pathlib import Path
 
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QDateEdit, QLineEdit, QLabel,
+    QPushButton, QDateEdit, QLineEdit, QLabel, QCheckBox, QSpinBox,
     QTableView, QTabWidget, QProgressDialog,
     QFileDialog, QMessageBox, QStatusBar, QHeaderView
 )
 from PyQt6.QtCore import Qt, QDate, QTimer
 from PyQt6.QtGui import QIcon
 
-from .model import StockTableModel
-from .worker import DataLoaderWorker
-from ..compute import rank_by_sector, get_top_overall
+from .model import StockStore, StockTableModel
+from .worker import DataLoaderWorker, ExportWorker, WatchWorker
+from ..cache import SnapshotCache
+from ..compute import SECTOR_CN_MAP, RankedTable, StockRecord, rank_by_sector, get_top_overall
+from ..rankings import RankStore
 
 
 class MainWindow(QMainWindow):
     """主窗口"""
     
+    # 搜索输入防抖间隔（毫秒）
+    SEARCH_DEBOUNCE_MS = 150
+    
+    # 每个 Tab 显示的股票数
+    TOP_N = 100
+    
+    # 自动刷新的默认间隔（秒）
+    AUTO_REFRESH_SECONDS = 15
+    
+    # 状态栏显示耗时的阶段（span 名称 -> 显示名）
+    STAGE_LABELS = {"prices": "价格", "metadata": "元数据", "compute": "计算"}
+    
+    # 导出对话框的文件类型 -> 导出格式
+    EXPORT_FILTERS = {
+        "CSV Files (*.csv)": "csv",
+        "NDJSON Files (*.ndjson)": "ndjson",
+        "JSON Files (*.json)": "json",
+        "Parquet Files (*.parquet)": "parquet",
+        "Arrow IPC Files (*.arrow)": "arrow",
+    }
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("CapScope - 美股市值查看工具")
         self.setMinimumSize(900, 600)
         
         # 数据
-        self._all_stocks: list[dict] = []
-        self._by_sector: dict[str, list[dict]] = {}
+        self._all_stocks: list[StockRecord] | RankedTable = []
+        self._by_sector: dict[str, list[StockRecord]] = {}
+        self._store = StockStore()
         self._actual_date = ""
         self._load_time = 0.0
         
+        # 数据源（离线调试可设 CAPSCOPE_PROVIDER=fixture）
+        self._provider = os.environ.get("CAPSCOPE_PROVIDER", "yfinance")
+        self._snapshots = SnapshotCache(provider=self._provider)
+        self._rankings = RankStore(provider=self._provider)
+        self._showing_stale = False
+        self._streamed: list[StockRecord] = []
+        
         # 工作线程
         self._worker: DataLoaderWorker | None = None
+        self._export_worker: ExportWorker | None = None
+        self._watcher: WatchWorker | None = None
+        self._retired_watchers: set[WatchWorker] = set()  # 已停止、仍在结束当前这轮的线程
         self._progress_dialog: QProgressDialog | None = None
         self._start_time = 0.0
         
@@ -53,17 +87,29 @@ class MainWindow(QMainWindow):
         self.date_edit.setDate(QDate.currentDate())
         self.date_edit.setCalendarPopup(True)
         self.date_edit.setDisplayFormat("yyyy-MM-dd")
+        self.date_edit.dateChanged.connect(self._on_date_changed)
         toolbar.addWidget(self.date_edit)
         
         self.refresh_btn = QPushButton("🔄 刷新")
         self.refresh_btn.clicked.connect(self._on_refresh)
         toolbar.addWidget(self.refresh_btn)
         
-        self.export_btn = QPushButton("💾 导出CSV")
+        self.export_btn = QPushButton("💾 导出")
         self.export_btn.clicked.connect(self._on_export)
         self.export_btn.setEnabled(False)
         toolbar.addWidget(self.export_btn)
         
+        # 自动刷新：元数据取一次，之后只轮询今天的最新价格
+        self.auto_check = QCheckBox("⏱ 自动刷新")
+        self.auto_check.toggled.connect(self._on_auto_refresh_toggled)
+        toolbar.addWidget(self.auto_check)
+        
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(5, 600)
+        self.interval_spin.setValue(self.AUTO_REFRESH_SECONDS)
+        self.interval_spin.setSuffix(" 秒")
+        toolbar.addWidget(self.interval_spin)
+        
         toolbar.addStretch()
         
         toolbar.addWidget(QLabel("🔍 搜索:"))
@@ -73,6 +119,11 @@ class MainWindow(QMainWindow):
         self.search_edit.textChanged.connect(self._on_search)
         toolbar.addWidget(self.search_edit)
         
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self._apply_search)
+        
         layout.addLayout(toolbar)
         
         # 行业 Tab
@@ -80,36 +131,40 @@ class MainWindow(QMainWindow):
         self.tab_widget.currentChanged.connect(self._on_tab_changed)
         layout.addWidget(self.tab_widget)
         
-        # 创建初始 Tab
-        self._create_tabs([])
+        # 创建初始 Tab（之后刷新只增删有变化的行业 Tab）
+        self._tabs: dict[str, QTableView] = {}
+        self._spare_tables: list[QTableView] = []
+        self._sync_tabs([])
         
         # 状态栏
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self._update_status("请点击「刷新」加载数据")
     
-    def _create_tabs(self, sectors: list[str]):
-        """创建行业 Tab"""
-        self.tab_widget.clear()
-        self._tab_models: dict[str, StockTableModel] = {}
-        
-        # 全部 Tab
-        all_model = StockTableModel()
-        all_table = self._create_table(all_model)
-        self.tab_widget.addTab(all_table, "全部")
-        self._tab_models["__all__"] = all_model
-        
-        # 各行业 Tab
-        for sector in sorted(sectors):
-            model = StockTableModel()
-            table = self._create_table(model)
-            
-            # 中文行业名
-            from ..compute import SECTOR_CN_MAP
-            sector_cn = SECTOR_CN_MAP.get(sector, sector)
-            
-            self.tab_widget.addTab(table, sector_cn)
-            self._tab_models[sector] = model
+    def _sync_tabs(self, sectors: list[str]):
+        """
+        让 Tab 与行业列表一致：已有行业的 Tab 原样保留（选中状态随之保留），
+        多出的表格收进备用池，新行业优先复用备用池里的表格
+        """
+        wanted = ["__all__", *sorted(sectors)]
+        
+        for key in [k for k in self._tabs if k not in wanted]:
+            table = self._tabs.pop(key)
+            self.tab_widget.removeTab(self.tab_widget.indexOf(table))
+            table.model().set_view(StockStore(), key)
+            self._spare_tables.append(table)
+        
+        for position, key in enumerate(wanted):
+            table = self._tabs.get(key)
+            if table is None:
+                table = self._spare_tables.pop() if self._spare_tables else self._create_table(StockTableModel())
+                self._tabs[key] = table
+            if self.tab_widget.indexOf(table) != position:
+                if self.tab_widget.indexOf(table) >= 0:
+                    self.tab_widget.removeTab(self.tab_widget.indexOf(table))
+                # 中文行业名
+                title = "全部" if key == "__all__" else SECTOR_CN_MAP.get(key, key)
+                self.tab_widget.insertTab(position, table, title)
     
     def _create_table(self, model: StockTableModel) -> QTableView:
         """创建表格"""
@@ -117,7 +172,9 @@ class MainWindow(QMainWindow):
         table.setModel(model)
         table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
         table.setAlternatingRowColors(True)
-        table.setSortingEnabled(False)
+        # 默认按排名升序；点击表头由模型用预先算好的排列排序
+        table.horizontalHeader().setSortIndicator(0, Qt.SortOrder.AscendingOrder)
+        table.setSortingEnabled(True)
         
         # 列宽
         header = table.horizontalHeader()
@@ -137,135 +194,343 @@ class MainWindow(QMainWindow):
         return table
     
     def _on_refresh(self):
-        """刷新数据"""
+        """刷新数据（有快照时先显示快照，再后台更新）；加载中再次点击为取消"""
         if self._worker and self._worker.isRunning():
+            self._on_cancel()
             return
         
         date_str = self.date_edit.date().toString("yyyy-MM-dd")
+        self._progress_dialog = None
+        self._showing_stale = False
+        self._streamed = []
         
-        # 显示进度对话框
-        self._progress_dialog = QProgressDialog("正在加载数据...", "取消", 0, 100, self)
-        self._progress_dialog.setWindowTitle("加载中")
-        self._progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
-        self._progress_dialog.setMinimumDuration(0)
-        self._progress_dialog.setValue(0)
-        self._progress_dialog.show()
-        
-        self.refresh_btn.setEnabled(False)
+        if self._show_cached(date_str, "，正在后台更新..."):
+            self._showing_stale = True
+        else:
+            # 显示进度对话框
+            self._progress_dialog = QProgressDialog("正在加载数据...", "取消", 0, 100, self)
+            self._progress_dialog.setWindowTitle("加载中")
+            self._progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+            self._progress_dialog.setMinimumDuration(0)
+            self._progress_dialog.setValue(0)
+            self._progress_dialog.canceled.connect(self._on_cancel)
+            self._progress_dialog.show()
+        
+        self._set_loading(True)
         self._start_time = datetime.now().timestamp()
         
         # 启动工作线程
-        self._worker = DataLoaderWorker(date_str)
+        self._worker = DataLoaderWorker(date_str, provider=self._provider)
         self._worker.progress.connect(self._on_progress)
+        self._worker.partial.connect(self._on_partial)
         self._worker.finished.connect(self._on_load_finished)
+        self._worker.cancelled.connect(self._on_load_cancelled)
         self._worker.error.connect(self._on_load_error)
         self._worker.start()
     
+    def _on_date_changed(self, qdate: QDate):
+        """切换日期：有预计算排名或快照时立即显示，不联网"""
+        if self._worker and self._worker.isRunning():
+            return
+        self._showing_stale = False
+        date_str = qdate.toString("yyyy-MM-dd")
+        if not self._show_cached(date_str, "，点击「刷新」更新"):
+            self._update_status(f"{date_str} 没有本地数据，请点击「刷新」加载")
+    
+    def _show_cached(self, date_str: str, note: str) -> bool:
+        """
+        显示本地已有的数据：优先 materialize 预计算的排名，其次快照
+        
+        Returns:
+            是否有可显示的数据
+        """
+        ranking = self._rankings.lookup(date_str)
+        if ranking is not None and ranking[0].complete(self.TOP_N):
+            ranked, actual_date = ranking
+            self._apply_stocks(ranked, actual_date)
+            count, source = len(ranked), "预计算排名"
+        else:
+            snapshot = self._snapshots.load(date_str)
+            if not snapshot:
+                return False
+            self._apply_stocks(snapshot["stocks"], snapshot["actual_date"])
+            saved_at = datetime.fromtimestamp(snapshot["saved_at"]).strftime("%m-%d %H:%M")
+            count, source = len(snapshot["stocks"]), f"缓存数据（{saved_at}）"
+        
+        self._update_status(f"数据日期: {self._actual_date} │ 共 {count} 只 │ {source}{note}")
+        return True
+    
+    def _set_loading(self, loading: bool):
+        """加载中时刷新按钮变为取消按钮"""
+        self.refresh_btn.setText("⏹ 取消" if loading else "🔄 刷新")
+    
+    def _close_progress_dialog(self):
+        """关闭进度对话框（关闭时 Qt 会发出 canceled，先断开）"""
+        if self._progress_dialog:
+            self._progress_dialog.canceled.disconnect(self._on_cancel)
+            self._progress_dialog.close()
+            self._progress_dialog = None
+    
+    def _on_cancel(self):
+        """取消加载"""
+        if self._worker and self._worker.isRunning():
+            self._worker.cancel()
+            self.refresh_btn.setEnabled(False)
+            self._update_status("正在取消...")
+    
     def _on_progress(self, done: int, total: int):
         """更新进度"""
         if self._progress_dialog:
             pct = done * 100 // total if total > 0 else 0
             self._progress_dialog.setValue(pct)
             self._progress_dialog.setLabelText(f"正在获取元数据... {done}/{total}")
+        elif self._showing_stale:
+            self._update_status(
+                f"数据日期: {self._actual_date} │ "
+                f"缓存数据，正在后台更新... {done}/{total}"
+            )
+        else:
+            self._update_status(
+                f"数据日期: {self._actual_date} │ "
+                f"已加载 {len(self._streamed)} 只，正在获取元数据... {done}/{total}"
+            )
     
-    def _on_load_finished(self, stocks: list[dict], actual_date: str):
-        """加载完成"""
-        self._load_time = datetime.now().timestamp() - self._start_time
-        self._all_stocks = stocks
-        self._actual_date = actual_date
-        self._by_sector = rank_by_sector(stocks, top_n=100)
+    def _on_partial(self, stocks: list[StockRecord], actual_date: str):
+        """收到一批新算出的股票：边加载边显示"""
+        if self._showing_stale:
+            # 正在显示完整的缓存数据，不用部分结果覆盖
+            return
         
-        # 更新 Tab
-        self._create_tabs(list(self._by_sector.keys()))
+        # 第一批数据到达后关闭模态对话框，进度改在状态栏显示
+        self._close_progress_dialog()
         
-        # 填充数据
-        self._tab_models["__all__"].set_data(get_top_overall(stocks, 100))
-        for sector, sector_stocks in self._by_sector.items():
-            if sector in self._tab_models:
-                self._tab_models[sector].set_data(sector_stocks)
+        self._streamed.extend(stocks)
+        self._streamed.sort(key=lambda s: s.market_cap, reverse=True)
+        self._apply_stocks(self._streamed, actual_date)
+    
+    def _on_load_finished(self, stocks: list[StockRecord], actual_date: str):
+        """加载完成"""
+        self._load_time = datetime.now().timestamp() - self._start_time
+        self._showing_stale = False
+        self._apply_stocks(stocks, actual_date)
         
-        # 更新状态
+        # 更新状态（各阶段耗时见状态栏提示）
         self._update_status(
             f"数据日期: {actual_date} │ "
             f"共 {len(stocks)} 只 │ "
-            f"加载耗时: {self._load_time:.1f}s"
+            f"加载耗时: {self._load_time:.1f}s{self._stage_summary()}"
         )
         
+        self._set_loading(False)
         self.refresh_btn.setEnabled(True)
-        self.export_btn.setEnabled(True)
+        self._close_progress_dialog()
+    
+    def _stage_summary(self) -> str:
+        """主要阶段耗时摘要，完整报告放进状态栏提示"""
+        recorder = self._worker.recorder if self._worker else None
+        if recorder is None:
+            return ""
+        self.status_bar.setToolTip(recorder.report())
+        totals = recorder.stage_totals()
+        parts = [
+            f"{label} {totals[name]:.1f}s"
+            for name, label in self.STAGE_LABELS.items()
+            if name in totals
+        ]
+        return f"（{' · '.join(parts)}）" if parts else ""
+    
+    def _on_load_cancelled(self):
+        """加载已取消（保留已显示的数据）"""
+        self._set_loading(False)
+        self.refresh_btn.setEnabled(True)
+        self._close_progress_dialog()
         
-        if self._progress_dialog:
-            self._progress_dialog.close()
+        if self._showing_stale:
+            self._update_status(f"数据日期: {self._actual_date} │ 缓存数据（已取消更新）")
+        else:
+            self._update_status(f"已取消，显示已加载的 {len(self._streamed)} 只")
+    
+    def _apply_stocks(self, stocks: list[StockRecord] | RankedTable, actual_date: str):
+        """显示数据：按全市场与行业排名后交给 _apply_views"""
+        self._all_stocks = stocks
+        self._apply_views(
+            get_top_overall(stocks, self.TOP_N),
+            rank_by_sector(stocks, top_n=self.TOP_N),
+            actual_date
+        )
+    
+    def _apply_views(
+        self,
+        top_overall: list[StockRecord],
+        by_sector: dict[str, list[StockRecord]],
+        actual_date: str
+    ):
+        """换上新的 StockStore，各 Tab 只更新有变化的行"""
+        self._actual_date = actual_date
+        self._by_sector = by_sector
+        self._store = StockStore({"__all__": top_overall, **by_sector})
+        
+        self._sync_tabs(list(self._by_sector))
+        for key, table in self._tabs.items():
+            table.model().update_view(self._store, key)
+        self._apply_search()
+        
+        self.export_btn.setEnabled(True)
     
     def _on_load_error(self, error: str):
         """加载失败"""
+        self._set_loading(False)
         self.refresh_btn.setEnabled(True)
+        self._close_progress_dialog()
         
-        if self._progress_dialog:
-            self._progress_dialog.close()
+        if self._showing_stale:
+            # 已显示快照，只在状态栏提示
+            self._update_status(
+                f"数据日期: {self._actual_date} │ 缓存数据（后台更新失败: {error}）"
+            )
+            return
         
         QMessageBox.critical(self, "加载失败", f"数据加载失败:\n{error}")
         self._update_status("加载失败")
     
+    def _on_auto_refresh_toggled(self, checked: bool):
+        """开关自动刷新：开启时切到今天，停止手动加载，后台轮询最新价格"""
+        if not checked:
+            self._stop_watcher()
+            self._update_status(f"数据日期: {self._actual_date} │ 已停止自动刷新")
+            return
+        
+        if self._worker and self._worker.isRunning():
+            # 手动加载让位给自动刷新，之后它发出的结果不再显示
+            worker = self._worker
+            for signal in (worker.progress, worker.partial, worker.finished, worker.cancelled, worker.error):
+                signal.disconnect()
+            worker.cancel()
+            self._set_loading(False)
+            self._close_progress_dialog()
+        self.date_edit.setDate(QDate.currentDate())
+        for widget in (self.date_edit, self.refresh_btn, self.interval_spin):
+            widget.setEnabled(False)
+        
+        interval = self.interval_spin.value()
+        self._update_status(f"自动刷新已开启（每 {interval} 秒），正在准备...")
+        self._watcher = WatchWorker(interval, top_n=self.TOP_N, provider=self._provider)
+        self._watcher.updated.connect(self._on_watch_updated)
+        self._watcher.error.connect(self._on_watch_error)
+        self._watcher.start()
+    
+    def _stop_watcher(self):
+        """停止自动刷新线程（不等待当前这轮结束），恢复手动控件"""
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.updated.disconnect(self._on_watch_updated)
+            watcher.error.disconnect(self._on_watch_error)
+            watcher.cancel()
+            # 不阻塞界面：保留引用直到线程结束，结束后再释放
+            self._retired_watchers.add(watcher)
+            watcher.finished.connect(lambda: self._retired_watchers.discard(watcher))
+            watcher.finished.connect(watcher.deleteLater)
+            if watcher.isFinished():
+                self._retired_watchers.discard(watcher)
+                watcher.deleteLater()
+        for widget in (self.date_edit, self.refresh_btn, self.interval_spin):
+            widget.setEnabled(True)
+    
+    def _on_watch_updated(
+        self,
+        top_overall: list[StockRecord],
+        by_sector: dict[str, list[StockRecord]],
+        moves: int
+    ):
+        """自动刷新有新价格：各 Tab 只更新有变化的行"""
+        self._showing_stale = False
+        self._apply_views(top_overall, by_sector, date.today().isoformat())
+        self._update_status(
+            f"实时数据: {datetime.now().strftime('%H:%M:%S')} │ "
+            f"每 {self.interval_spin.value()} 秒刷新 │ 本轮排名变化 {moves} 处"
+        )
+    
+    def _on_watch_error(self, error: str):
+        """自动刷新失败：关闭开关，保留已显示的数据"""
+        self.auto_check.setChecked(False)
+        self._update_status(f"数据日期: {self._actual_date} │ 自动刷新失败: {error}")
+    
     def _on_search(self, text: str):
-        """搜索过滤"""
-        for model in self._tab_models.values():
-            model.set_filter(text)
+        """搜索输入（防抖后再过滤）"""
+        self._search_timer.start()
+    
+    def _apply_search(self):
+        """搜索过滤：只过滤当前 Tab，其余 Tab 切换时再过滤"""
+        model = self._current_model()
+        if model:
+            model.set_filter(self.search_edit.text())
     
     def _on_tab_changed(self, index: int):
         """Tab 切换"""
         # 搜索过滤保持
-        text = self.search_edit.text()
-        if text:
-            self._on_search(text)
+        self._apply_search()
+    
+    def _current_model(self) -> StockTableModel | None:
+        """当前 Tab 的模型"""
+        table = self.tab_widget.currentWidget()
+        return table.model() if table is not None else None
     
     def _on_export(self):
-        """导出 CSV"""
+        """导出当前 Tab 的数据（后台线程写文件）"""
         # 获取当前 Tab 的数据
-        current_index = self.tab_widget.currentIndex()
-        if current_index == 0:
-            model = self._tab_models.get("__all__")
-        else:
-            tab_text = self.tab_widget.tabText(current_index)
-            # 找到对应的英文 sector
-            from ..compute import SECTOR_CN_MAP
-            sector = None
-            for en, cn in SECTOR_CN_MAP.items():
-                if cn == tab_text:
-                    sector = en
-                    break
-            model = self._tab_models.get(sector) if sector else None
+        model = self._current_model()
         
         if not model:
             return
         
+        if self._export_worker and self._export_worker.isRunning():
+            return
+        
         data = model.get_filtered_data()
         if not data:
             QMessageBox.information(self, "导出", "没有数据可导出")
             return
         
-        # 选择保存路径
+        # 选择保存路径与格式
         default_name = f"capscope_{self._actual_date}.csv"
-        path, _ = QFileDialog.getSaveFileName(
-            self, "导出 CSV", default_name, "CSV Files (*.csv)"
+        path, selected = QFileDialog.getSaveFileName(
+            self, "导出", default_name, ";;".join(self.EXPORT_FILTERS)
         )
         
         if not path:
             return
         
-        # 写入 CSV
-        try:
-            with open(path, "w", newline="", encoding="utf-8-sig") as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    "ticker", "name", "sector", "sector_cn",
-                    "close", "shares", "market_cap", "market_cap_b"
-                ])
-                writer.writeheader()
-                writer.writerows(data)
-            
-            QMessageBox.information(self, "导出成功", f"已导出到:\n{path}")
-        except Exception as e:
-            QMessageBox.critical(self, "导出失败", str(e))
+        fmt = self.EXPORT_FILTERS[selected] if selected in self.EXPORT_FILTERS else "csv"
+        self.export_btn.setEnabled(False)
+        self._update_status(f"正在导出 {len(data)} 条...")
+        
+        self._export_worker = ExportWorker(data, path, fmt)
+        self._export_worker.finished.connect(self._on_export_finished)
+        self._export_worker.error.connect(self._on_export_error)
+        self._export_worker.start()
+    
+    def _on_export_finished(self, path: str, count: int):
+        """导出完成"""
+        self.export_btn.setEnabled(True)
+        self._update_status(f"已导出 {count} 条到 {path}")
+        QMessageBox.information(self, "导出成功", f"已导出到:\n{path}")
+    
+    def _on_export_error(self, error: str):
+        """导出失败"""
+        self.export_btn.setEnabled(True)
+        QMessageBox.critical(self, "导出失败", error)
+    
+    def closeEvent(self, event):
+        """关闭窗口时取消后台加载，等待导出写完"""
+        if self._worker and self._worker.isRunning():
+            self._worker.cancel()
+            self._worker.wait(3000)
+        self._stop_watcher()
+        for watcher in list(self._retired_watchers):
+            watcher.wait(3000)
+        if self._export_worker and self._export_worker.isRunning():
+            self._export_worker.wait()
+        super().closeEvent(event)
     
     def _update_status(self, text: str):
         """更新状态栏"""
@@ -3,75 +3,325 @@
 from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
 from typing import Any
 
+import numpy as np
+
+from ..compute import StockRecord, as_records
+
+
+class StockStore:
+    """
+    一个日期已加载的数据（列式，所有 Tab 共用）
+
+    每只股票只存一行，显示字符串与搜索键在构建时一次算好；
+    各 Tab 只保存自己的行号列表（views），不复制行数据。
+    排序键（数值列为 float 数组，文本列为不区分大小写的名次）与各视图的
+    排列在第一次按某列排序时计算，之后直接复用。
+    """
+
+    # 按数值排序的字段，其余字段按文本排序
+    NUMERIC_FIELDS = ("close", "shares", "market_cap", "market_cap_b")
+
+    def __init__(self, views: dict[str, list[StockRecord]] | None = None):
+        """
+        Args:
+            views: {视图名: 按排名排列的股票}，同一 ticker 在多个视图中只存一行
+        """
+        self.records: list[StockRecord] = []
+        self.tickers: list[str] = []
+        self.names: list[str] = []
+        self.sectors_cn: list[str] = []
+        self.close_text: list[str] = []
+        self.cap_text: list[str] = []
+        self.search_keys: list[str] = []
+        self.views: dict[str, list[int]] = {}
+        self._sort_keys: dict[str, np.ndarray] = {}
+        self._orders: dict[tuple[str, str | None, bool], list[int]] = {}
+
+        row_of: dict[str, int] = {}
+        for key, stocks in (views or {}).items():
+            rows = []
+            for stock in as_records(stocks):
+                row = row_of.get(stock.ticker)
+                if row is None:
+                    row = row_of[stock.ticker] = len(self.records)
+                    self._append(stock)
+                rows.append(row)
+            self.views[key] = rows
+
+    def _append(self, stock: StockRecord) -> None:
+        self.records.append(stock)
+        self.tickers.append(stock.ticker)
+        self.names.append(stock.name)
+        self.sectors_cn.append(stock.sector_cn)
+        self.close_text.append(f"${stock.close:,.2f}")
+        self.cap_text.append(f"{stock.market_cap_b:,.2f}")
+        self.search_keys.append(f"{stock.ticker}\x00{stock.name}".lower())
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def sort_key(self, field: str) -> np.ndarray:
+        """某字段的排序键（每行一个，按 store 行号）"""
+        key = self._sort_keys.get(field)
+        if key is None:
+            values = [getattr(r, field) for r in self.records]
+            if field in self.NUMERIC_FIELDS:
+                key = np.array(values, dtype=np.float64)
+            else:
+                # 相同文本得到相同名次，排序时按原排名稳定排列
+                texts = np.array([v.casefold() for v in values], dtype=str)
+                key = np.unique(texts, return_inverse=True)[1].reshape(-1).astype(np.int64)
+            self._sort_keys[field] = key
+        return key
+
+    def order(self, view: str, field: str | None, descending: bool = False) -> list[int]:
+        """
+        视图按某字段排序后的排列
+
+        Args:
+            view: 视图名
+            field: 排序字段，None 为原排名
+            descending: 是否降序（相同键保持原排名先后）
+
+        Returns:
+            视图内位置（views[view] 的下标）的列表
+        """
+        cache_key = (view, field, descending)
+        cached = self._orders.get(cache_key)
+        if cached is None:
+            rows = self.views.get(view, [])
+            if field is None:
+                cached = list(range(len(rows)))
+                if descending:
+                    cached.reverse()
+            else:
+                keys = self.sort_key(field)[np.asarray(rows, dtype=np.intp)]
+                cached = np.argsort(-keys if descending else keys, kind="stable").tolist()
+            self._orders[cache_key] = cached
+        return cached
+
 
 class StockTableModel(QAbstractTableModel):
-    """股票数据表格模型"""
-    
+    """
+    股票表格模型（StockStore 中一个视图的过滤结果）
+
+    模型只保存行号；刷新时换成新的 StockStore，只通知有变化的行。
+    排序取 store 缓存的排列，只发出布局变化，不重置模型。
+    """
+
     HEADERS = ["#", "Ticker", "公司名称", "行业", "收盘价", "市值(B)"]
-    
+
+    # 各列的排序字段（None 为按原排名）
+    SORT_FIELDS = [None, "ticker", "name", "sector_cn", "close", "market_cap"]
+
+    # 过滤结果变化的连续块超过该数量时，直接重置模型比逐块通知更快
+    MAX_ROW_BLOCKS = 50
+
     def __init__(self):
         super().__init__()
-        self._data: list[dict] = []
-        self._filtered_data: list[dict] = []
+        self._store = StockStore()
+        self._view = ""
+        self._ids: list[int] = []  # 本视图的行（store 行号，按排名）
+        self._sort: tuple[str | None, bool] = (None, False)  # (排序字段, 是否降序)
+        self._order: list[int] = []  # _ids 下标按当前排序排列
+        self._rows: list[int] = []  # 可见行在 _ids 中的下标（按当前排序）
+        self._visible: list[int] = []  # 可见行的 store 行号，与 _rows 同步
         self._filter_text = ""
-    
-    def set_data(self, stocks: list[dict]):
-        """设置数据"""
+
+    def set_view(self, store: StockStore, key: str):
+        """切换到 store 中的视图（重置模型）"""
         self.beginResetModel()
-        self._data = stocks
-        self._apply_filter()
+        self._store, self._view = store, key
+        self._ids = store.views.get(key, [])
+        self._order = store.order(key, *self._sort)
+        self._rows = self._match(self._order)
+        self._visible = [self._ids[i] for i in self._rows]
         self.endResetModel()
-    
+
+    def update_view(self, store: StockStore, key: str):
+        """换成新 store 中的视图：只通知行数变化和内容有变化的行"""
+        old_store, old, old_rows = self._store, self._visible, self._rows
+        ids = store.views.get(key, [])
+        order = store.order(key, *self._sort)
+        new_rows = self._match(order, ids, store)
+        new = [ids[i] for i in new_rows]
+
+        def swap():
+            self._store, self._view, self._ids, self._order = store, key, ids, order
+            self._rows, self._visible = new_rows, new
+
+        # 行号只在各自的 store 中有效，整体切换；先按新行数通知尾部增删，
+        # 再对重叠部分逐行比较
+        if len(new) < len(old):
+            self.beginRemoveRows(QModelIndex(), len(new), len(old) - 1)
+            swap()
+            self.endRemoveRows()
+        elif len(new) > len(old):
+            self.beginInsertRows(QModelIndex(), len(old), len(new) - 1)
+            swap()
+            self.endInsertRows()
+        else:
+            swap()
+
+        last_col = self.columnCount() - 1
+        first = None
+        for row in range(min(len(old), len(new)) + 1):
+            changed = (
+                row < len(old) and row < len(new)
+                and (
+                    old_rows[row] != new_rows[row]
+                    or old_store.records[old[row]] != store.records[new[row]]
+                )
+            )
+            if changed and first is None:
+                first = row
+            elif not changed and first is not None:
+                self.dataChanged.emit(self.index(first, 0), self.index(row - 1, last_col))
+                first = None
+
+    def set_data(self, stocks: list[StockRecord]):
+        """设置数据（单独使用、不与其他 Tab 共用 store 时）"""
+        self.set_view(StockStore({"": stocks}), "")
+
+    def update_data(self, stocks: list[StockRecord]):
+        """增量更新数据（单独使用、不与其他 Tab 共用 store 时）"""
+        self.update_view(StockStore({"": stocks}), "")
+
     def set_filter(self, text: str):
-        """设置过滤文本"""
-        self.beginResetModel()
-        self._filter_text = text.lower()
-        self._apply_filter()
-        self.endResetModel()
-    
-    def _apply_filter(self):
-        """应用过滤"""
-        if not self._filter_text:
-            self._filtered_data = self._data
+        """设置过滤文本（逐块通知增删的行）"""
+        text = text.lower()
+        if text == self._filter_text:
+            return
+
+        # 新文本包含旧文本时，结果一定是当前结果的子集，只需扫描当前可见行
+        narrowing = self._filter_text in text
+        self._filter_text = text
+        candidates = self._rows if narrowing else self._order
+        self._apply_rows(self._match(candidates))
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+        """按列排序：取 store 缓存的排列，保留过滤结果与选中行，只发出布局变化"""
+        sort = (self.SORT_FIELDS[column], order == Qt.SortOrder.DescendingOrder)
+        if sort == self._sort:
+            return
+
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        selected = [self._visible[index.row()] for index in persistent]
+
+        self._sort = sort
+        self._order = self._store.order(self._view, *sort)
+        if len(self._rows) == len(self._ids):
+            self._rows = list(self._order)
         else:
-            self._filtered_data = [
-                s for s in self._data
-                if self._filter_text in s["ticker"].lower()
-                or self._filter_text in s["name"].lower()
-            ]
-    
-    def get_filtered_data(self) -> list[dict]:
+            shown = set(self._rows)
+            self._rows = [i for i in self._order if i in shown]
+        self._visible = [self._ids[i] for i in self._rows]
+
+        row_of = {sid: row for row, sid in enumerate(self._visible)}
+        self.changePersistentIndexList(persistent, [
+            self.index(row_of[sid], index.column()) for sid, index in zip(selected, persistent)
+        ])
+        self.layoutChanged.emit()
+
+    def _match(
+        self,
+        candidates,
+        ids: list[int] | None = None,
+        store: StockStore | None = None
+    ) -> list[int]:
+        """在候选行（ids 下标，按当前排序）中筛选匹配当前过滤文本的行（保持候选顺序）"""
+        text = self._filter_text
+        if not text:
+            return list(candidates)
+        ids = self._ids if ids is None else ids
+        keys = (self._store if store is None else store).search_keys
+        return [i for i in candidates if text in keys[ids[i]]]
+
+    def _apply_rows(self, new_rows: list[int]):
+        """把可见行切换为 new_rows，按连续块发出删除/插入通知"""
+        rows = self._rows
+        keep = set(new_rows)
+
+        removed_blocks = []
+        pos = len(rows) - 1
+        while pos >= 0:
+            if rows[pos] in keep:
+                pos -= 1
+                continue
+            end = pos
+            while pos >= 0 and rows[pos] not in keep:
+                pos -= 1
+            removed_blocks.append((pos + 1, end))
+
+        if len(removed_blocks) + abs(len(new_rows) - len(rows)) // 2 > self.MAX_ROW_BLOCKS:
+            self.beginResetModel()
+            self._rows = new_rows
+            self._visible = [self._ids[i] for i in new_rows]
+            self.endResetModel()
+            return
+
+        # 删除：从后往前
+        visible = self._visible
+        for start, end in removed_blocks:
+            self.beginRemoveRows(QModelIndex(), start, end)
+            del rows[start:end + 1]
+            del visible[start:end + 1]
+            self.endRemoveRows()
+
+        # 插入：此时 rows 是 new_rows 的子序列，从前往后补齐
+        pos = 0
+        i = 0
+        while i < len(new_rows):
+            if pos < len(rows) and rows[pos] == new_rows[i]:
+                pos += 1
+                i += 1
+                continue
+            start = i
+            while i < len(new_rows) and (pos >= len(rows) or rows[pos] != new_rows[i]):
+                i += 1
+            block = new_rows[start:i]
+            self.beginInsertRows(QModelIndex(), pos, pos + len(block) - 1)
+            rows[pos:pos] = block
+            visible[pos:pos] = [self._ids[j] for j in block]
+            self.endInsertRows()
+            pos += len(block)
+
+    def get_filtered_data(self) -> list[StockRecord]:
         """获取过滤后的数据"""
-        return self._filtered_data
-    
+        records = self._store.records
+        return [records[i] for i in self._visible]
+
     def rowCount(self, parent=QModelIndex()) -> int:
-        return len(self._filtered_data)
-    
+        return 0 if parent.isValid() else len(self._rows)
+
     def columnCount(self, parent=QModelIndex()) -> int:
-        return len(self.HEADERS)
-    
+        return 0 if parent.isValid() else len(self.HEADERS)
+
     def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
         if not index.isValid():
             return None
-        
+
         if role == Qt.ItemDataRole.DisplayRole:
-            row = index.row()
             col = index.column()
-            stock = self._filtered_data[row]
-            
+            row = index.row()
+            store = self._store
+            sid = self._visible[row]
+
             if col == 0:
-                return row + 1
+                # 排名（过滤后保持原排名）
+                return self._rows[row] + 1
             elif col == 1:
-                return stock["ticker"]
+                return store.tickers[sid]
             elif col == 2:
-                return stock["name"]
+                return store.names[sid]
             elif col == 3:
-                return stock["sector_cn"]
+                return store.sectors_cn[sid]
             elif col == 4:
-                return f"${stock['close']:,.2f}"
+                return store.close_text[sid]
             elif col == 5:
-                return f"{stock['market_cap_b']:,.2f}"
-        
+                return store.cap_text[sid]
+
         elif role == Qt.ItemDataRole.TextAlignmentRole:
             col = index.column()
             if col in [0]:
@@ -79,9 +329,9 @@ class StockTableModel(QAbstractTableModel):
             elif col in [4, 5]:
                 return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
             return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
-        
+
         return None
-    
+
     def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
         if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
             return self.HEADERS[section]
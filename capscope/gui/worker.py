@@ -1,43 +1,240 @@
 """后台工作线程"""
 
+import threading
+import time
+from typing import TYPE_CHECKING
+
 from PyQt6.QtCore import QThread, pyqtSignal
 
+from .. import instrument
+from ..fetcher import FetchCancelled
+
+if TYPE_CHECKING:
+    from ..compute import StockRecord
+
 
 class DataLoaderWorker(QThread):
-    """数据加载工作线程"""
-    
+    """
+    数据加载工作线程
+
+    先取全部收盘价，再按估算市值从大到小抓元数据，
+    每隔 PARTIAL_INTERVAL 秒把新算出的股票通过 partial 信号发出。
+    """
+
+    # 两次 partial 信号的最小间隔（秒）
+    PARTIAL_INTERVAL = 0.25
+
     progress = pyqtSignal(int, int)  # (completed, total)
+    partial = pyqtSignal(list, str)  # (新算出市值的一批股票, actual_date)
     finished = pyqtSignal(list, str)  # (stocks, actual_date)
+    cancelled = pyqtSignal()
     error = pyqtSignal(str)
-    
-    def __init__(self, date: str):
+
+    def __init__(
+        self,
+        date: str,
+        provider: str = "yfinance",
+        provider_options: dict | None = None
+    ):
+        """
+        Args:
+            date: 查询日期 "YYYY-MM-DD"
+            provider: 数据源名称
+            provider_options: 传给数据源的参数（如 fixture 的 path/latency）
+        """
         super().__init__()
         self.date = date
-    
+        self.provider_name = provider
+        self.provider_options = provider_options or {}
+        self._cancel = threading.Event()
+        self.recorder: instrument.Recorder | None = None  # 本次加载的埋点数据
+
+    def cancel(self):
+        """请求取消（协作式：停止发起新请求，尽快结束）"""
+        self._cancel.set()
+
     def run(self):
+        with instrument.recording() as recorder:
+            self.recorder = recorder
+            self._load()
+
+    def _load(self):
         try:
             from ..universe import get_universe
             from ..metadata import fetch_metadata
+            from ..cache import MetadataCache, PriceCache, SnapshotCache
             from ..prices import fetch_prices
             from ..compute import compute_market_caps
-            
+            from ..providers import get_shared_provider
+
+            provider = get_shared_provider(self.provider_name, **self.provider_options)
+            metadata_cache = MetadataCache(provider=provider.name)
+
             # 1. 加载股票池
-            tickers = get_universe()
-            
-            # 2. 获取元数据
+            with instrument.span("universe"):
+                tickers = get_universe(self.date)
+
+            # 2. 先取价格（一次批量下载），没有价格的股票不必抓元数据
+            prices, actual_date = fetch_prices(
+                tickers,
+                self.date,
+                cache=PriceCache(provider=provider.name),
+                provider=provider
+            )
+            if self._cancel.is_set():
+                raise FetchCancelled()
+
+            # 按缓存中（可能过期）的股数估算市值，大市值先抓
+            known_shares = metadata_cache.get_shares(tickers)
+            tickers = sorted(
+                (t for t in tickers if t in prices),
+                key=lambda t: -prices[t] * known_shares.get(t, 0)
+            )
+
+            # 3. 获取元数据，边抓边算
+            pending: list[dict] = []
+            last_emit = 0.0
+
+            def flush():
+                nonlocal last_emit
+                if pending:
+                    with instrument.span("compute.partial", stocks=len(pending)):
+                        stocks = compute_market_caps(pending, prices)
+                    self.partial.emit(stocks, actual_date)
+                    pending.clear()
+                last_emit = time.monotonic()
+
+            def on_batch(batch):
+                pending.extend(batch)
+                if time.monotonic() - last_emit >= self.PARTIAL_INTERVAL:
+                    flush()
+
             def on_progress(done, total):
                 self.progress.emit(done, total)
-            
-            metadata = fetch_metadata(tickers, progress_callback=on_progress)
-            
-            # 3. 获取价格
-            valid_tickers = [m["ticker"] for m in metadata]
-            prices, actual_date = fetch_prices(valid_tickers, self.date)
-            
+
+            metadata = fetch_metadata(
+                tickers,
+                progress_callback=on_progress,
+                cache=metadata_cache,
+                provider=provider,
+                batch_callback=on_batch,
+                cancel_event=self._cancel
+            )
+            flush()
+
             # 4. 计算市值
-            stocks = compute_market_caps(metadata, prices)
-            
+            with instrument.span("compute"):
+                stocks = compute_market_caps(metadata, prices)
+
+            # 5. 保存快照，下次打开同一日期时先显示
+            with instrument.span("snapshot"):
+                SnapshotCache(provider=provider.name).save(self.date, actual_date, stocks)
+
             self.finished.emit(stocks, actual_date)
-            
+
+        except FetchCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class WatchWorker(QThread):
+    """
+    自动刷新工作线程
+
+    元数据只在开始时取一次（走缓存），之后每隔 interval 秒只拉最新价格，
+    由 LiveRanking 增量更新排名；有价格变化时发出各 Tab 的前 N 只。
+    """
+
+    updated = pyqtSignal(list, dict, int)  # (全市场前 N, {行业: 前 N}, 本轮前 N 名次变化数)
+    error = pyqtSignal(str)
+
+    def __init__(
+        self,
+        interval: float,
+        top_n: int = 100,
+        provider: str = "yfinance",
+        provider_options: dict | None = None
+    ):
+        """
+        Args:
+            interval: 轮询间隔（秒）
+            top_n: 每个 Tab 的股票数
+            provider: 数据源名称
+            provider_options: 传给数据源的参数（如 fixture 的 path/latency）
+        """
+        super().__init__()
+        self.interval = interval
+        self.top_n = top_n
+        self.provider_name = provider
+        self.provider_options = provider_options or {}
+        self._stop = threading.Event()
+
+    def cancel(self):
+        """停止轮询（当前这轮结束后退出）"""
+        self._stop.set()
+
+    def run(self):
+        try:
+            from datetime import date
+            from ..universe import get_universe
+            from ..metadata import fetch_metadata
+            from ..cache import MetadataCache
+            from ..providers import get_shared_provider
+            from ..watch import ALL, LiveRanking, watch
+
+            provider = get_shared_provider(self.provider_name, **self.provider_options)
+            tickers = get_universe(date.today().isoformat())
+            metadata = fetch_metadata(
+                tickers,
+                cache=MetadataCache(provider=provider.name),
+                provider=provider,
+                cancel_event=self._stop
+            )
+            ranking = LiveRanking(metadata, top_n=self.top_n, by_sector=True)
+
+            def on_update(changes: dict[str, list[dict]]):
+                if len(ranking.changed) == 0:
+                    return
+                by_sector = {
+                    key: records
+                    for key in ranking.groups if key != ALL
+                    for records in [ranking.records(key)] if records
+                }
+                moves = sum(len(events) for events in changes.values())
+                self.updated.emit(ranking.records(ALL), by_sector, moves)
+
+            watch(ranking, provider, self.interval, on_update, stop_event=self._stop)
+
+        except FetchCancelled:
+            pass
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class ExportWorker(QThread):
+    """导出工作线程：在后台用 export 模块的流式 writer 写文件"""
+
+    finished = pyqtSignal(str, int)  # (path, 写出的行数)
+    error = pyqtSignal(str)
+
+    def __init__(self, stocks: "list[StockRecord]", path: str, fmt: str):
+        """
+        Args:
+            stocks: 要导出的股票数据
+            path: 输出文件路径
+            fmt: 导出格式（见 export.FORMATS）
+        """
+        super().__init__()
+        self.stocks = stocks
+        self.path = path
+        self.fmt = fmt
+
+    def run(self):
+        try:
+            from ..export import export_records
+
+            count = export_records(self.stocks, self.path, self.fmt)
+            self.finished.emit(self.path, count)
         except Exception as e:
             self.error.emit(str(e))
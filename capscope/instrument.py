@@ -0,0 +1,201 @@
+"""性能埋点模块
+
+用 span() 记录各阶段耗时，count() 记录计数（请求数、重试、缓存命中等）。
+未启用记录器时两者都是空操作，开销可忽略。
+
+enable() 启用进程级记录器（CLI 用）；recording() 只对当前上下文（线程/asyncio
+任务）生效，并发的多次加载各记各的。交给线程池执行的代码需在复制的上下文中运行
+（见 fetcher.fetch_all），才能记到同一个记录器。
+
+    recorder = instrument.enable()
+    with instrument.span("compute"):
+        ...
+    instrument.count("fetch.requests")
+    print(recorder.report())
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Iterator
+
+
+class Recorder:
+    """收集 span 与计数器"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: list[dict] = []  # {name, start, duration, depth, thread, args}
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """记录一段代码的耗时（同一线程内可嵌套）"""
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            stack.pop()
+            record = {
+                "name": name,
+                "start": started - self.origin,
+                "duration": ended - started,
+                "depth": len(stack),
+                "thread": threading.get_ident(),
+                "args": args
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """计数器加 n"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stage_totals(self) -> dict[str, float]:
+        """
+        按 span 名称汇总耗时
+
+        Returns:
+            {name: 总耗时（秒）}，按首次开始时间排序
+        """
+        totals: dict[str, float] = {}
+        for record in sorted(self.spans, key=lambda r: r["start"]):
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record["duration"]
+        return totals
+
+    def report(self) -> str:
+        """生成文本报告：各阶段调用次数、总耗时、占比，以及全部计数器"""
+        elapsed = time.perf_counter() - self.origin
+        stats: dict[str, dict] = {}
+        for record in sorted(self.spans, key=lambda r: r["start"]):
+            item = stats.setdefault(
+                record["name"], {"depth": record["depth"], "calls": 0, "total": 0.0}
+            )
+            item["calls"] += 1
+            item["total"] += record["duration"]
+
+        lines = [f"{'stage':<32} {'calls':>7} {'total ms':>11} {'mean ms':>9} {'%':>6}"]
+        for name, item in stats.items():
+            label = "  " * item["depth"] + name
+            lines.append(
+                f"{label:<32} {item['calls']:>7} {item['total'] * 1000:>11.1f} "
+                f"{item['total'] * 1000 / item['calls']:>9.2f} "
+                f"{item['total'] / elapsed * 100 if elapsed else 0:>6.1f}"
+            )
+        lines.append(f"{'(wall)':<32} {'':>7} {elapsed * 1000:>11.1f}")
+
+        if self.counters:
+            lines.append("")
+            lines.append(f"{'counter':<32} {'value':>7}")
+            for name in sorted(self.counters):
+                lines.append(f"{name:<32} {self.counters[name]:>7}")
+        return "\n".join(lines)
+
+    def write_jsonl(self, path: str) -> None:
+        """每行一个 JSON：先是全部 span，再是计数器"""
+        with open(path, "w", encoding="utf-8") as f:
+            for record in sorted(self.spans, key=lambda r: r["start"]):
+                f.write(json.dumps({"type": "span", **record}, ensure_ascii=False) + "\n")
+            for name, value in sorted(self.counters.items()):
+                f.write(json.dumps({"type": "counter", "name": name, "value": value}) + "\n")
+
+    def write_chrome_trace(self, path: str) -> None:
+        """导出 Chrome trace 格式（chrome://tracing 或 Perfetto 打开）"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": record["name"],
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["duration"] * 1e6,
+                "pid": pid,
+                "tid": record["thread"],
+                "args": record["args"]
+            }
+            for record in self.spans
+        ]
+        end = time.perf_counter() - self.origin
+        events.extend(
+            {"name": name, "ph": "C", "ts": end * 1e6, "pid": pid, "args": {name: value}}
+            for name, value in self.counters.items()
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    def write(self, path: str) -> None:
+        """按扩展名导出：.jsonl 为 JSON lines，其余为 Chrome trace"""
+        if path.endswith(".jsonl"):
+            self.write_jsonl(path)
+        else:
+            self.write_chrome_trace(path)
+
+
+# enable() 启用的进程级记录器
+_active: Recorder | None = None
+# recording() 启用的记录器，只在当前上下文可见，优先于 _active
+_scoped: contextvars.ContextVar[Recorder | None] = contextvars.ContextVar(
+    "capscope_recorder", default=None
+)
+
+
+def enable() -> Recorder:
+    """启用一个新的全局记录器"""
+    global _active
+    _active = Recorder()
+    return _active
+
+
+def disable() -> None:
+    """停用全局记录器"""
+    global _active
+    _active = None
+
+
+def get_recorder() -> Recorder | None:
+    """当前上下文生效的记录器（未启用时为 None）"""
+    return _scoped.get() or _active
+
+
+@contextmanager
+def recording() -> Iterator[Recorder]:
+    """在 with 块内为当前上下文启用独立的记录器，不影响其他线程"""
+    recorder = Recorder()
+    token = _scoped.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _scoped.reset(token)
+
+
+def span(name: str, **args: Any):
+    """记录一段代码的耗时；未启用时为空操作"""
+    recorder = _scoped.get() or _active
+    return recorder.span(name, **args) if recorder is not None else nullcontext()
+
+
+def count(name: str, n: int = 1) -> None:
+    """计数器加 n；未启用时为空操作"""
+    recorder = _scoped.get() or _active
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+def timed(name: str) -> Callable:
+    """装饰器：把整个函数调用记为一个 span"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
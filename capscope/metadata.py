@@ -1,76 +1,140 @@
 """元数据获取模块"""
 
+import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 from typing import Callable
 
-import yfinance as yf
+from . import instrument
+from .cache import MetadataCache
+from .fetcher import FetchCancelled, fetch_all
+from .providers import DataProvider, get_provider
 
 logger = logging.getLogger(__name__)
 
 
-def fetch_one_metadata(ticker: str) -> dict | None:
+def fetch_one_metadata(ticker: str, provider: DataProvider | None = None) -> dict | None:
     """
     获取单个股票的元数据
-    
+
     Returns:
         {ticker, name, sector, shares} 或 None（无效数据）
     """
+    provider = provider or get_provider()
     try:
-        info = yf.Ticker(ticker).info
-        
-        shares = info.get("sharesOutstanding")
-        if not shares or shares <= 0:
-            logger.warning(f"Skipping {ticker}: missing sharesOutstanding")
-            return None
-        
-        return {
-            "ticker": ticker,
-            "name": info.get("shortName") or info.get("longName") or ticker,
-            "sector": info.get("sector") or "Unknown",
-            "shares": shares
-        }
+        results = provider.get_metadata([ticker])
+        return results[0] if results else None
     except Exception as e:
         logger.error(f"Failed to fetch {ticker}: {e}")
         return None
 
 
+@instrument.timed("metadata")
 def fetch_metadata(
     tickers: list[str],
     max_workers: int = 10,
-    progress_callback: Callable[[int, int], None] | None = None
+    progress_callback: Callable[[int, int], None] | None = None,
+    cache: MetadataCache | None = None,
+    provider: DataProvider | None = None,
+    rate_limit: float = 20.0,
+    retries: int = 3,
+    batch_callback: Callable[[list[dict]], None] | None = None,
+    cancel_event: threading.Event | None = None
 ) -> list[dict]:
     """
     批量获取元数据
-    
+
     Args:
         tickers: 股票代码列表
-        max_workers: 并发线程数
+        max_workers: 最大并发数（实际并发按错误率和延迟自适应调整）
         progress_callback: 进度回调 (completed, total)
-    
+        cache: 元数据缓存，命中且未过期的 ticker 不再请求网络
+        provider: 数据源，默认 yfinance
+        rate_limit: 每秒最多请求数（数据源 rate_limited 为 False 时不限速）
+        retries: 失败后最多重试次数（指数退避）
+        batch_callback: 每得到一批有效元数据时回调（缓存命中的先回调一次）
+        cancel_event: 取消标志，置位后停止抓取（已抓到的仍写入缓存）
+
     Returns:
         有效的元数据列表
+
+    Raises:
+        FetchCancelled: 抓取被取消
     """
+    provider = provider or get_provider()
     results = []
     total = len(tickers)
-    completed = 0
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(fetch_one_metadata, t): t for t in tickers}
-        
-        for future in as_completed(futures):
-            completed += 1
-            ticker = futures[future]
-            
-            try:
-                data = future.result()
-                if data:
-                    results.append(data)
-            except Exception as e:
-                logger.error(f"Exception for {ticker}: {e}")
-            
-            if progress_callback:
-                progress_callback(completed, total)
-    
+    pending = tickers
+
+    if cache is not None:
+        with instrument.span("metadata.cache_read"):
+            results, pending = cache.get_fresh(tickers)
+        instrument.count("metadata.cache_hits", len(results))
+        logger.info(f"Metadata cache: {len(results)} hit, {len(pending)} to fetch")
+
+    if batch_callback and results:
+        batch_callback(list(results))
+
+    completed = total - len(pending)
+    if progress_callback and completed:
+        progress_callback(completed, total)
+
+    size = max(1, provider.metadata_batch_size)
+    batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+
+    fetched = []
+    dropped = 0
+    single: list[str] = []  # 批量结果里缺失或批次失败、需要逐个再取的 ticker
+
+    def on_done(batch: list[str], result: list[dict] | None):
+        nonlocal completed, dropped
+        if len(batch) > 1:
+            # 批量接口取不到的 ticker 逐个再取（每个单独限速、单独重试）
+            found = {r["ticker"] for r in result or []}
+            single.extend(t for t in batch if t not in found)
+            completed += len(found)
+        else:
+            completed += len(batch)
+            if result is None:
+                dropped += len(batch)
+        if result:
+            fetched.extend(result)
+            if batch_callback:
+                batch_callback(result)
+        if progress_callback:
+            progress_callback(completed, total)
+
+    options = {
+        "rate": rate_limit if provider.rate_limited else None,
+        "max_concurrency": max_workers,
+        "retries": retries,
+        "cancel_event": cancel_event
+    }
+
+    async def fetch_batches():
+        await fetch_all(batches, provider.get_metadata, on_done, **options)
+        if single:
+            logger.info(f"Fetching {len(single)} tickers one by one")
+            instrument.count("metadata.single_fallback", len(single))
+            await fetch_all([[t] for t in single], provider.get_metadata, on_done, **options)
+
+    try:
+        asyncio.run(fetch_batches())
+    except FetchCancelled:
+        logger.info(f"Metadata fetch cancelled after {completed}/{total}")
+        if cache is not None:
+            cache.put(fetched)
+        raise
+
+    instrument.count("metadata.fetched", len(fetched))
+    if dropped:
+        logger.warning(f"Dropped {dropped} tickers after retries")
+        instrument.count("metadata.dropped", dropped)
+
+    if cache is not None:
+        with instrument.span("metadata.cache_write"):
+            cache.put(fetched)
+
+    results.extend(fetched)
     logger.info(f"Fetched metadata: {len(results)}/{total} valid")
     return results
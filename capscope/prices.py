@@ -1,75 +1,174 @@
 """价格获取模块"""
 
 import logging
-from datetime import datetime, timedelta
+from datetime import date as Date, datetime, timedelta
+from typing import TYPE_CHECKING
 
-import pandas as pd
-import yfinance as yf
+from . import instrument, trading_calendar
+from .cache import PriceCache
+from .providers import DataProvider, get_provider
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# 日历判定的交易日没有任何数据时（日历之外的临时休市等），往前按窗口查找的天数
+FALLBACK_LOOKBACK_DAYS = 10
+
+
+def _fill_from_network(
+    provider: DataProvider,
+    cache: PriceCache,
+    tickers: list[str],
+    start: Date,
+    end: Date
+) -> None:
+    """下载缓存中缺失的区间并写入缓存（失败时保留已有缓存，支持离线）"""
+    with instrument.span("prices.cache_lookup"):
+        gaps = cache.missing(tickers, start, end)
+    instrument.count("prices.cache_hits", len(tickers) - len(gaps))
+    if not gaps:
+        logger.info(f"Price cache hit for {len(tickers)} tickers")
+        return
+
+    # 缺口相同的 ticker 合并为一次下载
+    groups: dict[tuple[Date, Date], list[str]] = {}
+    for ticker, spans in gaps.items():
+        envelope = (spans[0][0], spans[-1][1])
+        groups.setdefault(envelope, []).append(ticker)
 
+    logger.info(
+        f"Price cache: {len(tickers) - len(gaps)} hit, {len(gaps)} to fetch "
+        f"in {len(groups)} request(s)"
+    )
+
+    for (gap_start, gap_end), group in groups.items():
+        instrument.count("prices.downloads")
+        try:
+            with instrument.span("prices.download", tickers=len(group)):
+                closes = provider.get_closes(group, gap_start, gap_end)
+        except Exception as e:
+            logger.warning(f"Price download failed ({gap_start} ~ {gap_end}): {e}")
+            instrument.count("prices.download_errors")
+            continue
+        with instrument.span("prices.cache_write"):
+            cache.put(closes, group, gap_start, gap_end)
+
+
+def _load_closes(
+    provider: DataProvider,
+    cache: PriceCache | None,
+    tickers: list[str],
+    start: Date,
+    end: Date
+) -> "pd.DataFrame":
+    """读取 [start, end] 的收盘价（有缓存时先补齐缺口再从缓存读）"""
+    if cache is not None:
+        _fill_from_network(provider, cache, tickers, start, end)
+        with instrument.span("prices.cache_read"):
+            return cache.get_closes(tickers, start, end)
+    instrument.count("prices.downloads")
+    with instrument.span("prices.download", tickers=len(tickers)):
+        return provider.get_closes(tickers, start, end)
+
+
+@instrument.timed("prices")
 def fetch_prices(
     tickers: list[str],
-    date: str
+    date: str,
+    cache: PriceCache | None = None,
+    provider: DataProvider | None = None
 ) -> tuple[dict[str, float], str]:
     """
     获取指定日期的收盘价
-    
+
     Args:
         tickers: 股票代码列表
         date: 目标日期 "YYYY-MM-DD"
-    
+        cache: 收盘价缓存，已覆盖的日期不再下载
+        provider: 数据源，默认 yfinance
+
     Returns:
         (prices_dict, actual_date)
         prices_dict: {"AAPL": 185.92, ...}
         actual_date: 实际使用的交易日
     """
-    target_date = datetime.strptime(date, "%Y-%m-%d")
-    
-    # 往前多取几天，确保能拿到交易日数据
-    start_date = target_date - timedelta(days=10)
-    end_date = target_date + timedelta(days=1)
-    
+    import pandas as pd
+
+    provider = provider or get_provider()
+    target_date = datetime.strptime(date, "%Y-%m-%d").date()
+
+    # 由交易日历直接确定实际交易日，只请求这一天；
+    # 今天的收盘价可能还没有，带上前一个交易日备用
+    session = trading_calendar.previous_trading_day(target_date)
+    start_date = session
+    if session >= Date.today():
+        start_date = trading_calendar.previous_trading_day(session, inclusive=False)
+
     logger.info(f"Fetching prices for {len(tickers)} tickers, target date: {date}")
-    
-    # yfinance 批量下载
-    data = yf.download(
-        tickers=tickers,
-        start=start_date.strftime("%Y-%m-%d"),
-        end=end_date.strftime("%Y-%m-%d"),
-        progress=False,
-        threads=True
-    )
-    
-    if data.empty:
+
+    close_data = _load_closes(provider, cache, tickers, start_date, session).dropna(how="all")
+    if close_data.empty:
+        logger.warning(
+            f"No prices for trading day {session}, "
+            f"searching the previous {FALLBACK_LOOKBACK_DAYS} days"
+        )
+        start_date = target_date - timedelta(days=FALLBACK_LOOKBACK_DAYS)
+        close_data = _load_closes(provider, cache, tickers, start_date, target_date).dropna(how="all")
+    if close_data.empty:
         logger.error("No price data returned")
         return {}, date
-    
-    # 获取 Close 价格
-    close_data = data["Close"] if "Close" in data.columns else data[("Close",)]
-    
+
     # 找到最接近目标日期的交易日（不超过目标日期）
     available_dates = close_data.index[close_data.index <= pd.Timestamp(target_date)]
-    
+
     if len(available_dates) == 0:
         logger.error(f"No trading day found before {date}")
         return {}, date
-    
+
     actual_date = available_dates[-1]
     actual_date_str = actual_date.strftime("%Y-%m-%d")
-    
+
     if actual_date_str != date:
         logger.info(f"Using nearest trading day: {actual_date_str} (requested: {date})")
-    
+
     # 提取该日价格
-    if isinstance(close_data, pd.DataFrame):
-        prices_row = close_data.loc[actual_date]
-        prices = {ticker: price for ticker, price in prices_row.items() if pd.notna(price)}
-    else:
-        # 单个 ticker 的情况
-        price = close_data.loc[actual_date]
-        prices = {tickers[0]: price} if pd.notna(price) else {}
-    
+    prices_row = close_data.loc[actual_date]
+    prices = {ticker: float(price) for ticker, price in prices_row.items() if pd.notna(price)}
+
     logger.info(f"Got prices for {len(prices)} tickers on {actual_date_str}")
     return prices, actual_date_str
+
+
+@instrument.timed("prices")
+def fetch_price_panel(
+    tickers: list[str],
+    start: str,
+    end: str,
+    cache: PriceCache | None = None,
+    provider: DataProvider | None = None
+) -> "pd.DataFrame":
+    """
+    获取日期区间内每个交易日的收盘价（一次下载）
+
+    Args:
+        tickers: 股票代码列表
+        start: 起始日期 "YYYY-MM-DD"（含）
+        end: 结束日期 "YYYY-MM-DD"（含）
+        cache: 收盘价缓存，已覆盖的日期不再下载
+        provider: 数据源，默认 yfinance
+
+    Returns:
+        DataFrame（index=交易日，columns=ticker），无交易的日期不出现
+    """
+    provider = provider or get_provider()
+    start_date = datetime.strptime(start, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end, "%Y-%m-%d").date()
+
+    logger.info(f"Fetching price panel for {len(tickers)} tickers, {start} ~ {end}")
+
+    close_data = _load_closes(provider, cache, tickers, start_date, end_date)
+    close_data = close_data.dropna(how="all").sort_index()
+    logger.info(f"Got {len(close_data)} trading days")
+    return close_data
@@ -0,0 +1,771 @@
+"""数据源模块
+
+所有网络访问都收敛在 DataProvider 实现里：
+- yfinance: 在线数据（默认）
+- fixture: 回放本地录制的数据，可注入延迟，用于离线测试和基准测试
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+from . import instrument
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class DataProvider(Protocol):
+    """数据源协议"""
+
+    # 数据源名称（缓存按名称隔离）
+    name: str
+    # 每次 get_metadata 调用建议的 ticker 数
+    metadata_batch_size: int
+    # 是否需要限速（本地数据源为 False，抓取时跳过令牌桶）
+    rate_limited: bool
+
+    def get_metadata(self, tickers: list[str]) -> list[dict]:
+        """
+        获取元数据
+
+        Returns:
+            有效的元数据 [{ticker, name, sector, shares}, ...]，
+            无效的 ticker（如缺少 sharesOutstanding）直接省略；
+            网络等错误抛出异常，由调用方决定重试或丢弃。
+            多个 ticker 的批量调用也可以省略批量接口取不到的 ticker，
+            调用方会把它们逐个再取一次；单个 ticker 的结果即最终结果
+        """
+        ...
+
+    def get_closes(self, tickers: list[str], start: date, end: date) -> "pd.DataFrame":
+        """
+        获取收盘价
+
+        Args:
+            start: 起始日期（含）
+            end: 结束日期（含）
+
+        Returns:
+            DataFrame（index=交易日，columns=ticker）
+        """
+        ...
+
+    def get_shares_history(self, tickers: list[str], start: date) -> list[dict]:
+        """
+        获取历史流通股数
+
+        Args:
+            start: 起始日期（含）
+
+        Returns:
+            [{ticker, date, shares}, ...]，date 为 "YYYY-MM-DD"，
+            shares 为披露时的原始股数（未按之后的拆股调整）
+        """
+        ...
+
+    def get_splits(self, tickers: list[str], start: date, end: date) -> list[dict]:
+        """
+        获取拆股事件
+
+        Returns:
+            [{ticker, date, ratio}, ...]，ratio 为新股数/旧股数（如 4 拆 1 为 4.0）
+        """
+        ...
+
+    def get_last_prices(self, tickers: list[str]) -> dict[str, float]:
+        """
+        获取最新价格（盘中为最新成交价，收盘后为当日收盘价）
+
+        Returns:
+            {ticker: price}，没有价格的 ticker 省略
+        """
+        ...
+
+
+def parse_info(ticker: str, info: dict) -> dict | None:
+    """
+    从 yfinance info 提取元数据
+
+    Returns:
+        {ticker, name, sector, shares} 或 None（无效数据）
+    """
+    shares = info.get("sharesOutstanding")
+    if not shares or shares <= 0:
+        logger.warning(f"Skipping {ticker}: missing sharesOutstanding")
+        return None
+
+    return {
+        "ticker": ticker,
+        "name": info.get("shortName") or info.get("longName") or ticker,
+        "sector": info.get("sector") or "Unknown",
+        "shares": shares
+    }
+
+
+# 批量行情接口：一次请求多个 symbol，只取需要的字段
+QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+QUOTE_FIELDS = ("symbol", "shortName", "longName", "sharesOutstanding")
+LAST_PRICE_FIELDS = ("symbol", "regularMarketPrice")
+QUOTE_BATCH_SIZE = 100
+
+# 批量接口不返回行业，行业沿用逐个 info 请求的结果，超过该期限重新走 info
+SECTOR_TTL = 90 * 24 * 3600  # 秒
+
+
+class SectorMemo:
+    """
+    逐个 info 请求得到的行业（JSON 文件，线程安全）
+
+    行业几乎不变，记住之后批量请求只需补齐股数和名称；
+    没有记录或超过 TTL 的 ticker 回退到逐个 info 请求。
+    """
+
+    def __init__(self, path: str | Path, ttl: float = SECTOR_TTL):
+        """
+        Args:
+            path: JSON 文件路径 {ticker: [sector, fetched_at]}
+            ttl: 有效期（秒）
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[str, list] | None = None
+
+    def _load(self) -> dict[str, list]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, tickers: list[str], now: float | None = None) -> dict[str, str]:
+        """
+        Returns:
+            {ticker: sector}，只含未过期的记录（空字符串表示 info 里也没有行业）
+        """
+        cutoff = (time.time() if now is None else now) - self.ttl
+        with self._lock:
+            entries = self._load()
+            return {
+                t: entries[t][0] for t in tickers
+                if t in entries and entries[t][1] >= cutoff
+            }
+
+    def put(self, sectors: dict[str, str], now: float | None = None) -> None:
+        """记录行业并写回文件"""
+        if not sectors:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = self._load()
+            entries.update({t: [sector, now] for t, sector in sectors.items()})
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+
+class YFinanceProvider:
+    """
+    yfinance 数据源
+
+    元数据优先走批量行情接口（每次 QUOTE_BATCH_SIZE 个 symbol，只取股数和名称），
+    行业取自 SectorMemo。symbol 缺失或行业未知的 ticker 不在批量结果里，
+    由调用方逐个再取，单个 ticker 走 Ticker.info；接口不可用时批量大小降为 1。
+    """
+
+    name = "yfinance"
+    rate_limited = True
+
+    def __init__(self, batch_quotes: bool = True):
+        """
+        Args:
+            batch_quotes: 是否使用批量行情接口（False 时只走逐个 info 请求）
+        """
+        self.batch_quotes = batch_quotes
+        self.metadata_batch_size = QUOTE_BATCH_SIZE if batch_quotes else 1
+        self._sectors: SectorMemo | None = None
+
+    @property
+    def sectors(self) -> SectorMemo:
+        if self._sectors is None:
+            from .cache import get_cache_dir
+            self._sectors = SectorMemo(get_cache_dir(self.name) / "sectors.json")
+        return self._sectors
+
+    def get_metadata(self, tickers: list[str]) -> list[dict]:
+        # 单个 ticker（含批量结果缺失后的逐个回退）直接走 info；
+        # 批量接口停用后仍按旧批量大小到达的批次全部交给调用方逐个取
+        if len(tickers) == 1:
+            return self._get_info_metadata(tickers)
+        if not self.batch_quotes:
+            return []
+
+        # 行业未知的 ticker 反正要走 info，不必放进批量请求
+        sectors = self.sectors.get(tickers)
+        known = [t for t in tickers if t in sectors]
+        if not known:
+            return []
+
+        try:
+            instrument.count("metadata.quote_requests")
+            quotes = self._get_quotes(known)
+        except Exception as e:
+            # 限流、超时等临时错误交给调用方重试
+            if not self._batch_unavailable(e):
+                raise
+            return []
+
+        results = []
+        for ticker in known:
+            quote = quotes.get(ticker)
+            if quote and quote.get("sharesOutstanding"):
+                results.append(parse_info(ticker, {**quote, "sector": sectors[ticker]}))
+        results = [r for r in results if r]
+        if len(results) < len(tickers):
+            logger.debug(f"{len(tickers) - len(results)}/{len(tickers)} tickers left for per-symbol info")
+        return results
+
+    def _batch_unavailable(self, e: Exception) -> bool:
+        """批量接口拒绝访问（401/403/404）时停用它，之后都走回退路径"""
+        status = getattr(getattr(e, "response", None), "status_code", None)
+        if status not in (401, 403, 404):
+            return False
+        logger.warning(f"Batch quote endpoint unavailable ({status}), falling back")
+        self.batch_quotes = False
+        self.metadata_batch_size = 1
+        return True
+
+    def _get_quotes(self, tickers: list[str], fields: tuple[str, ...] = QUOTE_FIELDS) -> dict[str, dict]:
+        """一次批量行情请求，返回 {symbol: {字段: 值}}（只取 fields）"""
+        from yfinance.data import YfData
+
+        payload = YfData().get_raw_json(QUOTE_URL, params={
+            "symbols": ",".join(tickers),
+            "fields": ",".join(fields),
+            "formatted": "false"
+        })
+        quotes = (payload.get("quoteResponse") or {}).get("result") or []
+        return {q["symbol"]: q for q in quotes if q.get("symbol")}
+
+    def _get_info_metadata(self, tickers: list[str]) -> list[dict]:
+        """
+        逐个 Ticker.info 请求（完整但慢），顺带记住行业
+
+        只有一个 ticker 时错误照常抛出，由调用方重试；多个 ticker 时
+        失败的记录日志后跳过，不影响其余 ticker。
+        """
+        import yfinance as yf
+
+        results = []
+        sectors = {}
+        try:
+            for ticker in tickers:
+                instrument.count("metadata.info_requests")
+                try:
+                    info = yf.Ticker(ticker).info
+                except Exception as e:
+                    if len(tickers) == 1:
+                        raise
+                    logger.error(f"Failed to fetch {ticker}: {e}")
+                    instrument.count("metadata.info_errors")
+                    continue
+                if info:
+                    sectors[ticker] = info.get("sector") or ""
+                data = parse_info(ticker, info)
+                if data:
+                    results.append(data)
+        finally:
+            self.sectors.put(sectors)
+        return results
+
+    def get_closes(self, tickers: list[str], start: date, end: date) -> "pd.DataFrame":
+        import pandas as pd
+        import yfinance as yf
+
+        # yfinance 批量下载（end 不含）
+        data = yf.download(
+            tickers=tickers,
+            start=start.strftime("%Y-%m-%d"),
+            end=(end + timedelta(days=1)).strftime("%Y-%m-%d"),
+            progress=False,
+            threads=True
+        )
+
+        if data.empty:
+            return pd.DataFrame(columns=tickers, dtype="float64")
+
+        # 获取 Close 价格
+        close_data = data["Close"] if "Close" in data.columns else data[("Close",)]
+
+        if isinstance(close_data, pd.Series):
+            # 单个 ticker 的情况
+            close_data = close_data.to_frame(tickers[0])
+
+        close_data.index = pd.DatetimeIndex(close_data.index).tz_localize(None).normalize()
+        return close_data.astype("float64")
+
+    def get_shares_history(self, tickers: list[str], start: date) -> list[dict]:
+        import pandas as pd
+        import yfinance as yf
+
+        results = []
+        for ticker in tickers:
+            series = yf.Ticker(ticker).get_shares_full(start=start.strftime("%Y-%m-%d"))
+            if series is None or series.empty:
+                continue
+            series.index = pd.DatetimeIndex(series.index).tz_localize(None).normalize()
+            # 同一天可能有多条披露，取最后一条
+            series = series[series > 0].groupby(level=0).last()
+            results.extend(
+                {"ticker": ticker, "date": day.strftime("%Y-%m-%d"), "shares": float(value)}
+                for day, value in series.items()
+            )
+        return results
+
+    def get_splits(self, tickers: list[str], start: date, end: date) -> list[dict]:
+        import pandas as pd
+        import yfinance as yf
+
+        # 拆股事件随价格历史一起返回（actions=True 时的 Stock Splits 列）
+        data = yf.download(
+            tickers=tickers,
+            start=start.strftime("%Y-%m-%d"),
+            end=(end + timedelta(days=1)).strftime("%Y-%m-%d"),
+            actions=True,
+            progress=False,
+            threads=True
+        )
+        if data.empty or "Stock Splits" not in data.columns.get_level_values(0):
+            return []
+
+        splits = data["Stock Splits"]
+        if isinstance(splits, pd.Series):
+            splits = splits.to_frame(tickers[0])
+        splits.index = pd.DatetimeIndex(splits.index).tz_localize(None).normalize()
+
+        events = splits.stack()
+        events = events[events > 0]
+        return [
+            {"ticker": ticker, "date": day.strftime("%Y-%m-%d"), "ratio": float(ratio)}
+            for (day, ticker), ratio in events.items()
+        ]
+
+    def get_last_prices(self, tickers: list[str]) -> dict[str, float]:
+        if self.batch_quotes:
+            try:
+                prices = {}
+                for i in range(0, len(tickers), QUOTE_BATCH_SIZE):
+                    instrument.count("prices.quote_requests")
+                    quotes = self._get_quotes(tickers[i:i + QUOTE_BATCH_SIZE], LAST_PRICE_FIELDS)
+                    prices.update(
+                        (ticker, float(quote["regularMarketPrice"]))
+                        for ticker, quote in quotes.items()
+                        if quote.get("regularMarketPrice")
+                    )
+                return prices
+            except Exception as e:
+                if not self._batch_unavailable(e):
+                    raise
+
+        # 回退：日线下载的最后一根（盘中即当日最新价）
+        today = date.today()
+        closes = self.get_closes(tickers, today - timedelta(days=7), today).ffill()
+        if closes.empty:
+            return {}
+        return {ticker: float(price) for ticker, price in closes.iloc[-1].items() if price == price}
+
+
+class FixtureProvider:
+    """
+    本地回放数据源
+
+    目录结构:
+        metadata.json  [{ticker, name, sector, shares}, ...]
+        closes.csv     首列为日期，其余每列一个 ticker
+        quotes.csv     可选，格式同 closes.csv，每行依次作为一次 get_last_prices
+                       的结果（用完后停在最后一行）；没有时返回最后一个收盘价
+        shares.csv     可选，列为 ticker,date,shares（历史流通股数）
+        splits.csv     可选，列为 ticker,date,ratio（拆股事件）
+    """
+
+    name = "fixture"
+    rate_limited = False
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        latency: float = 0.0,
+        metadata_batch_size: int = 1
+    ):
+        """
+        Args:
+            path: 数据目录，默认取环境变量 CAPSCOPE_FIXTURE_DIR
+            latency: 每次调用注入的延迟（秒），模拟网络往返
+            metadata_batch_size: 每次 get_metadata 调用的 ticker 数
+        """
+        import pandas as pd
+
+        path = path or os.environ.get("CAPSCOPE_FIXTURE_DIR")
+        if not path:
+            raise ValueError("Fixture directory not set (use --fixture-dir or CAPSCOPE_FIXTURE_DIR)")
+
+        self.path = Path(path)
+        self.latency = latency
+        self.metadata_batch_size = metadata_batch_size
+
+        with open(self.path / "metadata.json", "r", encoding="utf-8") as f:
+            self._metadata = {m["ticker"]: m for m in json.load(f)}
+
+        self._closes = pd.read_csv(self.path / "closes.csv", index_col=0, parse_dates=True)
+        self._closes.index = pd.DatetimeIndex(self._closes.index).normalize()
+
+        self._shares = self._read_events("shares.csv", "shares")
+        self._splits = self._read_events("splits.csv", "ratio")
+
+        quotes_path = self.path / "quotes.csv"
+        if quotes_path.exists():
+            self._quotes = pd.read_csv(quotes_path, index_col=0)
+        else:
+            self._quotes = self._closes.ffill().iloc[-1:]
+        self._quote_tick = 0
+
+    def _read_events(self, filename: str, value: str) -> "pd.DataFrame":
+        """读取可选的 ticker,date,value 表（不存在时为空表）"""
+        import pandas as pd
+
+        path = self.path / filename
+        if not path.exists():
+            return pd.DataFrame(columns=["ticker", "date", value])
+        return pd.read_csv(path, dtype={"ticker": str, "date": str})
+
+    def _wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def get_metadata(self, tickers: list[str]) -> list[dict]:
+        self._wait()
+        return [dict(self._metadata[t]) for t in tickers if t in self._metadata]
+
+    def get_closes(self, tickers: list[str], start: date, end: date) -> "pd.DataFrame":
+        import pandas as pd
+
+        self._wait()
+        columns = [t for t in tickers if t in self._closes.columns]
+        return self._closes.loc[pd.Timestamp(start):pd.Timestamp(end), columns].copy()
+
+    def get_shares_history(self, tickers: list[str], start: date) -> list[dict]:
+        self._wait()
+        frame = self._shares
+        frame = frame[frame["ticker"].isin(tickers) & (frame["date"] >= start.isoformat())]
+        return frame.to_dict("records")
+
+    def get_splits(self, tickers: list[str], start: date, end: date) -> list[dict]:
+        self._wait()
+        frame = self._splits
+        frame = frame[
+            frame["ticker"].isin(tickers)
+            & (frame["date"] >= start.isoformat())
+            & (frame["date"] <= end.isoformat())
+        ]
+        return frame.to_dict("records")
+
+    def get_last_prices(self, tickers: list[str]) -> dict[str, float]:
+        self._wait()
+        if self._quotes.empty:
+            return {}
+        row = self._quotes.iloc[min(self._quote_tick, len(self._quotes) - 1)]
+        self._quote_tick += 1
+        return {t: float(row[t]) for t in tickers if t in row.index and row[t] == row[t]}
+
+
+class CoalescingProvider:
+    """
+    合并并发请求的数据源包装（线程安全）
+
+    - 元数据：同一 ticker 的并发请求共享一次调用（单个请求不复用批量调用）
+    - 收盘价：已在下载中、区间覆盖本次请求的 ticker 直接等待那次下载；
+      其余请求先等待 linger 秒收集同时到达的请求，区间重叠或相隔不超过
+      merge_gap_days 天的合并成一次批量下载（ticker 取并集，区间取包络）
+    """
+
+    def __init__(self, provider: DataProvider, linger: float = 0.02, merge_gap_days: int = 7):
+        """
+        Args:
+            provider: 被包装的数据源
+            linger: 收盘价请求的合并等待时间（秒）
+            merge_gap_days: 区间相隔不超过该天数时合并下载
+        """
+        self.provider = provider
+        self.name = provider.name
+        self.rate_limited = provider.rate_limited
+        self.linger = linger
+        self.merge_gap = timedelta(days=merge_gap_days)
+        self._lock = threading.Lock()
+        self._metadata_inflight: dict[str, tuple[Future, bool]] = {}  # ticker -> (future, 是否批量)
+        self._downloads: list[tuple[frozenset, date, date, Future]] = []
+        self._pending: list[tuple[list[str], date, date, Future]] = []
+        self.stats = {"metadata_calls": 0, "metadata_shared": 0, "close_calls": 0, "close_shared": 0}
+
+    def __getattr__(self, name: str):
+        # 其余方法（历史股数、拆股等）直接转发
+        return getattr(self.provider, name)
+
+    @property
+    def metadata_batch_size(self) -> int:
+        # 数据源可能在运行中改变批量大小（如批量接口被拒后降为 1）
+        return self.provider.metadata_batch_size
+
+    def get_metadata(self, tickers: list[str]) -> list[dict]:
+        # 批量调用可能漏掉个别 ticker（由调用方逐个重试），
+        # 所以单个请求不复用批量调用的结果，只与其他单个请求合并
+        single = len(set(tickers)) == 1
+        own: list[str] = []
+        futures: dict[str, Future] = {}
+        with self._lock:
+            for ticker in tickers:
+                if ticker in futures:
+                    continue
+                inflight = self._metadata_inflight.get(ticker)
+                if inflight is None or (single and inflight[1]):
+                    future = Future()
+                    self._metadata_inflight[ticker] = (future, not single)
+                    own.append(ticker)
+                else:
+                    future = inflight[0]
+                    self.stats["metadata_shared"] += 1
+                futures[ticker] = future
+
+        if own:
+            with self._lock:
+                self.stats["metadata_calls"] += 1
+            try:
+                results = {r["ticker"]: r for r in self.provider.get_metadata(own)}
+            except Exception as e:
+                for ticker in own:
+                    futures[ticker].set_exception(e)
+            else:
+                for ticker in own:
+                    futures[ticker].set_result(results.get(ticker))
+            finally:
+                with self._lock:
+                    for ticker in own:
+                        # 期间可能已被单个请求的调用替换
+                        inflight = self._metadata_inflight.get(ticker)
+                        if inflight is not None and inflight[0] is futures[ticker]:
+                            del self._metadata_inflight[ticker]
+
+        records = [futures[t].result() for t in futures]
+        return [dict(r) for r in records if r]
+
+    def get_closes(self, tickers: list[str], start: date, end: date) -> "pd.DataFrame":
+        import pandas as pd
+
+        parts: list[tuple[Future, list[str]]] = []
+        leader = False
+        with self._lock:
+            remaining = list(tickers)
+            for covered, d_start, d_end, future in self._downloads:
+                if d_start <= start and d_end >= end:
+                    shared = [t for t in remaining if t in covered]
+                    if shared:
+                        parts.append((future, shared))
+                        remaining = [t for t in remaining if t not in covered]
+                        self.stats["close_shared"] += 1
+            if remaining:
+                future = Future()
+                self._pending.append((remaining, start, end, future))
+                parts.append((future, remaining))
+                leader = len(self._pending) == 1
+
+        if leader:
+            # 第一个到达的请求负责下载：稍等片刻收集同时到达的请求
+            time.sleep(self.linger)
+            self._download_pending()
+
+        frames = []
+        for future, columns in parts:
+            frame = future.result().loc[pd.Timestamp(start):pd.Timestamp(end)]
+            frames.append(frame[[c for c in columns if c in frame.columns]])
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+
+    def _download_pending(self) -> None:
+        """把收集到的请求按区间合并成若干次下载"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            groups: list[list] = []  # [tickers, start, end, [requests]]
+            for request in sorted(pending, key=lambda r: r[1]):
+                tickers, start, end, _ = request
+                if groups and start <= groups[-1][2] + self.merge_gap:
+                    group = groups[-1]
+                    group[0].update(tickers)
+                    group[2] = max(group[2], end)
+                    group[3].append(request)
+                else:
+                    groups.append([set(tickers), start, end, [request]])
+            downloads = []
+            for tickers, start, end, requests in groups:
+                entry = (frozenset(tickers), start, end, Future())
+                self._downloads.append(entry)
+                downloads.append((entry, requests))
+                self.stats["close_calls"] += 1
+
+        for entry, requests in downloads:
+            tickers, start, end, future = entry
+            if len(requests) > 1:
+                logger.debug(
+                    f"Merged {len(requests)} price requests into one download "
+                    f"({len(tickers)} tickers, {start} ~ {end})"
+                )
+            try:
+                frame = self.provider.get_closes(sorted(tickers), start, end)
+            except Exception as e:
+                future.set_exception(e)
+                for *_, request_future in requests:
+                    request_future.set_exception(e)
+            else:
+                future.set_result(frame)
+                for *_, request_future in requests:
+                    request_future.set_result(frame)
+            finally:
+                with self._lock:
+                    self._downloads.remove(entry)
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    FixtureProvider.name: FixtureProvider,
+}
+
+
+def get_provider(name: str = "yfinance", **options) -> DataProvider:
+    """
+    按名称创建数据源
+
+    Args:
+        name: 数据源名称（yfinance/fixture）
+        **options: 传给数据源构造函数的参数
+
+    Returns:
+        数据源实例
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{name}', available: {list(PROVIDERS)}")
+    return PROVIDERS[name](**options)
+
+
+_shared: dict[tuple, CoalescingProvider] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_provider(name: str = "yfinance", **options) -> CoalescingProvider:
+    """
+    获取进程内共享的数据源（同名同参数返回同一个实例）
+
+    并发的多次加载（如连续刷新、服务端的多个请求）共用一个
+    CoalescingProvider，重叠的请求只发一次。
+    """
+    key = (name, tuple(sorted(options.items())))
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = CoalescingProvider(get_provider(name, **options))
+        return _shared[key]
+
+
+def save_fixtures(
+    path: str | Path,
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    shares: list[dict] | None = None,
+    splits: list[dict] | None = None
+) -> None:
+    """
+    写出 FixtureProvider 可读取的数据目录
+
+    Args:
+        path: 输出目录
+        metadata: [{ticker, name, sector, shares}, ...]
+        closes: 收盘价宽表（index=日期，columns=ticker）
+        shares: 历史流通股数 [{ticker, date, shares}, ...]
+        splits: 拆股事件 [{ticker, date, ratio}, ...]
+    """
+    import pandas as pd
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    with open(path / "metadata.json", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+
+    closes.to_csv(path / "closes.csv", index_label="date")
+
+    if shares is not None:
+        pd.DataFrame(shares, columns=["ticker", "date", "shares"]).to_csv(
+            path / "shares.csv", index=False
+        )
+    if splits is not None:
+        pd.DataFrame(splits, columns=["ticker", "date", "ratio"]).to_csv(
+            path / "splits.csv", index=False
+        )
+
+
+def record_fixtures(
+    provider: DataProvider,
+    tickers: list[str],
+    start: date,
+    end: date,
+    path: str | Path
+) -> None:
+    """
+    从数据源录制一份离线数据
+
+    Args:
+        provider: 录制来源（通常是 yfinance）
+        tickers: 股票代码列表
+        start: 收盘价起始日期（含）
+        end: 收盘价结束日期（含）
+        path: 输出目录
+    """
+    metadata = []
+    single = []  # 批量结果里缺失、需要逐个再取的 ticker
+    for i in range(0, len(tickers), provider.metadata_batch_size):
+        batch = tickers[i:i + provider.metadata_batch_size]
+        try:
+            results = provider.get_metadata(batch)
+        except Exception as e:
+            logger.error(f"Failed to record metadata for {batch}: {e}")
+            continue
+        metadata.extend(results)
+        if len(batch) > 1:
+            found = {r["ticker"] for r in results}
+            single.extend(t for t in batch if t not in found)
+    for ticker in single:
+        try:
+            metadata.extend(provider.get_metadata([ticker]))
+        except Exception as e:
+            logger.error(f"Failed to record metadata for {ticker}: {e}")
+
+    recorded = [m["ticker"] for m in metadata]
+    closes = provider.get_closes(recorded, start, end)
+
+    shares = []
+    for ticker in recorded:
+        try:
+            shares.extend(provider.get_shares_history([ticker], start))
+        except Exception as e:
+            logger.error(f"Failed to record shares history for {ticker}: {e}")
+    splits = provider.get_splits(recorded, start, date.today())
+
+    save_fixtures(path, metadata, closes, shares, splits)
+    logger.info(f"Recorded {len(metadata)} tickers to {path}")
@@ -0,0 +1,463 @@
+"""预计算排名索引
+
+    python -m capscope materialize --start 2024-01-01 --end 2024-12-31
+
+对区间内每个交易日预先算好各行业与全市场的市值排名，按年存成定宽数组目录：
+
+    <缓存目录>/<provider>/rankings/2024/
+        meta.json     ticker 表、行业表、覆盖区间、保存深度、生成时间
+        dates.npy     交易日（自 1970-01-01 起的天数，int64，升序）
+        counts.npy    每日有价格的股票数（int32）
+        offsets.npy   (交易日数, 行业数 + 2) 段边界（int64）：前 S 段为各行业，第 S 段为全市场
+        ids.npy       各段内按市值降序的 ticker 编号（int32）
+        closes.npy    对应收盘价（float64）
+        shares.npy    对应股数（float64）
+
+大数组以内存映射方式读取，查询某日某行业前 N 只只触及 N 个元素；
+CLI 与 GUI 命中索引时直接取排名，未覆盖的日期仍现场计算。
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import trading_calendar
+from .cache import MetadataCache, PriceCache, get_cache_dir
+from .compute import MarketCapTable, RankedTable
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 每个行业/全市场段最多保存的股票数，更大的 top N 回退到现场计算
+DEFAULT_DEPTH = 500
+
+_ARRAYS = ("ids", "closes", "shares")
+
+
+class RankYear:
+    """一年的排名索引（只读）"""
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: 年份目录
+        """
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.tickers = np.array(meta["tickers"], dtype=object)
+        self.names = np.array(meta["names"], dtype=object)
+        self.sector_codes = np.array(meta["sector_codes"], dtype=np.int32)
+        self.sectors: list[str] = meta["sectors"]
+        self.start = date.fromisoformat(meta["start"])
+        self.end = date.fromisoformat(meta["end"])
+        self.depth: int = meta["depth"]
+        self.created_at: float = meta["created_at"]
+
+        self.dates = np.load(path / "dates.npy")
+        self.counts = np.load(path / "counts.npy")
+        self.offsets = np.load(path / "offsets.npy")
+        self.ids, self.closes, self.shares = (
+            np.load(path / f"{name}.npy", mmap_mode="r") for name in _ARRAYS
+        )
+
+    def covers(self, day: date) -> bool:
+        return self.start <= day <= self.end
+
+    def day(self, pos: int) -> RankedTable:
+        """第 pos 个交易日的排名"""
+        return RankedTable(
+            tickers=self.tickers,
+            names=self.names,
+            sector_codes=self.sector_codes,
+            sectors=self.sectors,
+            ids=self.ids,
+            closes=self.closes,
+            shares=self.shares,
+            offsets=self.offsets[pos],
+            count=int(self.counts[pos]),
+            depth=self.depth
+        )
+
+    def date_str(self, pos: int) -> str:
+        return str(np.datetime64(int(self.dates[pos]), "D"))
+
+    def decode(self) -> list[dict]:
+        """
+        还原为逐日的段列表（重新物化时与新数据合并用）
+
+        Returns:
+            [{day, count, segments: {行业或 None: (tickers, closes, shares)}}, ...]，
+            None 为全市场段
+        """
+        keys = [*self.sectors, None]
+        days = []
+        for pos, day in enumerate(self.dates.tolist()):
+            bounds = self.offsets[pos]
+            segments = {}
+            for k, key in enumerate(keys):
+                part = slice(int(bounds[k]), int(bounds[k + 1]))
+                segments[key] = (
+                    self.tickers[np.asarray(self.ids[part])],
+                    np.array(self.closes[part]),
+                    np.array(self.shares[part])
+                )
+            days.append({"day": day, "count": int(self.counts[pos]), "segments": segments})
+        return days
+
+
+class RankStore:
+    """
+    排名索引存储
+
+    按年份目录读写；读取过的年份缓存在对象里，目录被重新物化后自动重新加载。
+    """
+
+    def __init__(self, root: str | Path | None = None, provider: str = "yfinance"):
+        """
+        Args:
+            root: 索引目录，默认 <缓存目录>/<provider>/rankings
+            provider: 数据源名称，不同数据源的缓存互相隔离
+        """
+        self.root = Path(root) if root else get_cache_dir(provider) / "rankings"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._years: dict[int, tuple[float, RankYear]] = {}
+
+    def year(self, year: int) -> RankYear | None:
+        """读取某年的索引（不存在时返回 None）"""
+        meta = self.root / str(year) / "meta.json"
+        try:
+            mtime = meta.stat().st_mtime
+        except OSError:
+            self._years.pop(year, None)
+            return None
+        cached = self._years.get(year)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            loaded = RankYear(meta.parent)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable ranking index {meta.parent}: {e}")
+            return None
+        self._years[year] = (mtime, loaded)
+        return loaded
+
+    def lookup(self, query_date: str, max_age: float | None = None) -> tuple[RankedTable, str] | None:
+        """
+        查询某日的排名
+
+        Args:
+            query_date: 请求日期 "YYYY-MM-DD"（非交易日按交易日历取之前最近的交易日）
+            max_age: 索引最长有效期（秒），None 表示不检查
+
+        Returns:
+            (RankedTable, actual_date)；该交易日未覆盖、索引中缺这一天或索引过期时返回 None
+        """
+        session = trading_calendar.previous_trading_day(date.fromisoformat(query_date))
+        found = self.year(session.year)
+        if found is None or not found.covers(session):
+            return None
+
+        target = (session - date(1970, 1, 1)).days
+        pos = int(np.searchsorted(found.dates, target))
+        if pos == len(found.dates) or int(found.dates[pos]) != target:
+            # 交易日却没有数据：是缺口，交给现场计算
+            return None
+        if max_age is not None and time.time() - found.created_at > max_age:
+            return None
+        return found.day(pos), found.date_str(pos)
+
+    def write(
+        self,
+        year: int,
+        days: list[dict],
+        names: dict[str, str],
+        start: date,
+        end: date,
+        depth: int
+    ) -> None:
+        """
+        写入一年的索引（整体替换）
+
+        Args:
+            year: 年份
+            days: [{day, count, segments}, ...]，格式同 RankYear.decode
+            names: {ticker: 公司名}
+            start: 覆盖区间起点（含）
+            end: 覆盖区间终点（含）
+            depth: 每段保存深度
+        """
+        self._years.pop(year, None)
+        write_index(self.root / str(year), days, names, start, end, depth)
+
+
+def write_index(
+    target: Path,
+    days: list[dict],
+    names: dict[str, str],
+    start: date,
+    end: date,
+    depth: int
+) -> None:
+    """
+    把日列表写成一个索引目录（先写临时目录再整体替换）
+
+    Args:
+        target: 目录路径（年份目录或 backfill 的分片目录）
+        days: [{day, count, segments}, ...]，格式同 RankYear.decode
+        names: {ticker: 公司名}
+        start: 覆盖区间起点（含）
+        end: 覆盖区间终点（含）
+        depth: 每段保存深度
+    """
+    days = sorted(days, key=lambda d: d["day"])
+    sectors = list(dict.fromkeys(
+        key for d in days for key in d["segments"] if key is not None
+    ))
+    keys = [*sectors, None]
+
+    codes: dict[str, int] = {}
+    sector_of: dict[str, int] = {}
+    id_parts, close_parts, share_parts = [], [], []
+    offsets = np.zeros((len(days), len(keys) + 1), dtype=np.int64)
+    position = 0
+    for row, d in enumerate(days):
+        for k, key in enumerate(keys):
+            offsets[row, k] = position
+            tickers, closes, shares = d["segments"].get(key, ((), (), ()))
+            if key is not None:
+                for t in tickers:
+                    sector_of.setdefault(t, k)
+            id_parts.append(np.fromiter(
+                (codes.setdefault(t, len(codes)) for t in tickers),
+                dtype=np.int32, count=len(tickers)
+            ))
+            close_parts.append(np.asarray(closes, dtype=np.float64))
+            share_parts.append(np.asarray(shares, dtype=np.float64))
+            position += len(tickers)
+        offsets[row, len(keys)] = position
+
+    meta = {
+        "tickers": list(codes),
+        "names": [names.get(t, t) for t in codes],
+        "sector_codes": [sector_of.get(t, 0) for t in codes],
+        "sectors": sectors,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "depth": depth,
+        "created_at": time.time()
+    }
+
+    tmp = target.with_name(f"{target.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    np.save(tmp / "dates.npy", np.array([d["day"] for d in days], dtype=np.int64))
+    np.save(tmp / "counts.npy", np.array([d["count"] for d in days], dtype=np.int32))
+    np.save(tmp / "offsets.npy", offsets)
+    for name, parts, dtype in (
+        ("ids", id_parts, np.int32),
+        ("closes", close_parts, np.float64),
+        ("shares", share_parts, np.float64)
+    ):
+        np.save(tmp / f"{name}.npy", np.concatenate(parts) if parts else np.empty(0, dtype=dtype))
+    # meta.json 最后写入：读取方以它是否存在判断目录完整
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    old = target.with_name(f"{target.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        os.replace(target, old)
+    os.replace(tmp, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _rank_days(
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    depth: int
+) -> list[dict]:
+    """逐日排名，返回 RankYear.decode 格式的日列表"""
+    metadata = [m for m in metadata if m["ticker"] in closes.columns]
+    tickers = np.array([m["ticker"] for m in metadata], dtype=object)
+    names = np.array([m["name"] for m in metadata], dtype=object)
+    sectors = list(dict.fromkeys(m["sector"] for m in metadata))
+    sector_index = {s: i for i, s in enumerate(sectors)}
+    codes = np.array([sector_index[m["sector"]] for m in metadata], dtype=np.int32)
+    shares = np.fromiter((m["shares"] for m in metadata), dtype=np.float64, count=len(metadata))
+    values = closes.reindex(columns=list(tickers)).to_numpy(dtype=np.float64)
+    days = closes.index.values.astype("datetime64[D]").astype(np.int64)
+    return rank_rows(tickers, names, codes, sectors, shares, values, days, depth)
+
+
+def rank_rows(
+    tickers: np.ndarray,
+    names: np.ndarray,
+    codes: np.ndarray,
+    sectors: list[str],
+    shares: np.ndarray,
+    values: np.ndarray,
+    days: np.ndarray,
+    depth: int
+) -> list[dict]:
+    """
+    逐行排名（不依赖 pandas，backfill 的工作进程直接在内存映射的面板上调用）
+
+    Args:
+        tickers/names/codes/shares: 每列股票的 ticker、公司名、行业编码、股数
+        sectors: 行业名列表
+        values: (交易日数, 股票数) 收盘价，NaN 表示当日无价格或不在成分内
+        days: 各行的交易日（自 1970-01-01 起的天数）
+        depth: 每段保存深度
+    """
+    result = []
+    for row, day in zip(values, days.tolist()):
+        present = np.flatnonzero(~np.isnan(row))
+        if not len(present):
+            continue
+        table = MarketCapTable(
+            tickers[present], names[present], codes[present], sectors, shares[present], row[present]
+        )
+        ranked: dict[str | None, np.ndarray] = dict(table.top_by_sector(depth))
+        ranked[None] = table.top(depth)
+        result.append({
+            "day": day,
+            "count": len(present),
+            "segments": {
+                key: (table.tickers[idx], table.closes[idx], table.shares[idx])
+                for key, idx in ranked.items()
+            }
+        })
+    return result
+
+
+def materialize(
+    metadata: list[dict],
+    closes: "pd.DataFrame",
+    start: str,
+    end: str,
+    store: RankStore,
+    depth: int = DEFAULT_DEPTH
+) -> int:
+    """
+    计算区间内每个交易日的排名并写入索引
+
+    已有索引中区间外的交易日保留，区间内的整体替换。
+
+    Args:
+        metadata: [{ticker, name, sector, shares}, ...]
+        closes: 收盘价宽表（index=交易日，columns=ticker）
+        start: 起始日期 "YYYY-MM-DD"（含）
+        end: 结束日期 "YYYY-MM-DD"（含）；今天及以后的收盘价还会变化，不写入
+        store: 索引存储
+        depth: 每个行业/全市场保存的股票数
+
+    Returns:
+        写入的交易日数
+    """
+    start_date = date.fromisoformat(start)
+    end_date = min(date.fromisoformat(end), date.today() - timedelta(days=1))
+    if end_date < start_date:
+        logger.warning(f"Nothing to materialize: {start} ~ {end} has no closed trading day")
+        return 0
+
+    names = {m["ticker"]: m["name"] for m in metadata}
+    first = (start_date - date(1970, 1, 1)).days
+    last = (end_date - date(1970, 1, 1)).days
+    days = [d for d in _rank_days(metadata, closes, depth) if first <= d["day"] <= last]
+
+    written = 0
+    for year in range(start_date.year, end_date.year + 1):
+        written += store_year(store, year, days, names, start_date, end_date, depth)
+    return written
+
+
+def store_year(
+    store: RankStore,
+    year: int,
+    days: list[dict],
+    names: dict[str, str],
+    start: date,
+    end: date,
+    depth: int
+) -> int:
+    """
+    把 [start, end] 内属于 year 的交易日并入该年索引
+
+    已有索引中区间外的交易日保留，覆盖区间取并集（两段不相连时只保留新区间）。
+
+    Returns:
+        写入的区间内交易日数
+    """
+    year_start = max(start, date(year, 1, 1))
+    year_end = min(end, date(year, 12, 31))
+    lo = (year_start - date(1970, 1, 1)).days
+    hi = (year_end - date(1970, 1, 1)).days
+    year_days = [d for d in days if lo <= d["day"] <= hi]
+    names = dict(names)
+
+    existing = store.year(year)
+    if existing is not None:
+        kept = [d for d in existing.decode() if not lo <= d["day"] <= hi]
+        for ticker, name in zip(existing.tickers.tolist(), existing.names.tolist()):
+            names.setdefault(ticker, name)
+        if existing.start <= year_end + timedelta(days=1) and year_start <= existing.end + timedelta(days=1):
+            year_start, year_end = min(year_start, existing.start), max(year_end, existing.end)
+            year_days = kept + year_days
+        del existing
+
+    store.write(year, year_days, names, year_start, year_end, depth)
+    logger.info(f"Materialized {year}: {len(year_days)} trading days ({year_start} ~ {year_end})")
+    return sum(1 for d in year_days if lo <= d["day"] <= hi)
+
+
+def main(argv: list[str] | None = None):
+    """python -m capscope materialize 入口"""
+    from .cli import add_source_arguments, build_provider, setup_logging
+    from .metadata import fetch_metadata
+    from .prices import fetch_price_panel
+    from .universe import get_universe_between, membership_mask
+
+    parser = argparse.ArgumentParser(
+        prog="capscope materialize",
+        description="预计算日期区间内每个交易日的行业排名，供查询与界面直接读取"
+    )
+    parser.add_argument("--start", required=True, help="起始日期 (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="结束日期 (YYYY-MM-DD)")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=DEFAULT_DEPTH,
+        help=f"每个行业/全市场保存的股票数，默认 {DEFAULT_DEPTH}；更大的 --top 会现场计算"
+    )
+    add_source_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_logging(args.verbose)
+
+    provider = build_provider(args)
+    metadata_cache = None if args.no_cache else MetadataCache(
+        ttl=args.cache_ttl * 3600, provider=provider.name
+    )
+    price_cache = None if args.no_cache else PriceCache(provider=provider.name)
+
+    tickers = get_universe_between(args.start, args.end)
+    metadata = fetch_metadata(tickers, cache=metadata_cache, provider=provider)
+    closes = fetch_price_panel(
+        [m["ticker"] for m in metadata], args.start, args.end,
+        cache=price_cache, provider=provider
+    )
+    closes = closes.where(membership_mask(list(closes.columns), closes.index.values))
+
+    store = RankStore(provider=provider.name)
+    days = materialize(metadata, closes, args.start, args.end, store, depth=args.depth)
+    logger.info(f"Materialized {days} trading days into {store.root}")
@@ -0,0 +1,424 @@
+"""本地 HTTP 查询服务
+
+    python -m capscope serve --port 8750
+
+股票池、元数据、单日结果和价格面板常驻进程内存，重复查询只需毫秒级；
+相同的查询同时到达时只计算一次，其余请求等待同一个结果。
+
+接口（GET）:
+    /caps?date=YYYY-MM-DD&sector=&top=100&format=json|csv
+    /series?start=YYYY-MM-DD&end=YYYY-MM-DD&sector=&top=100&format=json|csv
+    /health
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import MetadataCache, PriceCache
+from .compute import (
+    StockRecord, compute_market_caps, compute_market_cap_series, get_top_overall, rank_by_sector
+)
+from .export import FIELDNAMES, SERIES_FIELDNAMES, frame_values
+from .metadata import fetch_metadata
+from .prices import fetch_price_panel, fetch_prices
+from .providers import CoalescingProvider, DataProvider
+from .universe import get_all_tickers, get_universe, membership_mask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8750
+
+# 单日结果与价格面板在内存中的有效期（秒）：收盘后数据不变，盘中价格会更新
+RESULT_TTL = 15 * 60
+
+# 内存中最多保留的单日结果/价格面板数
+MAX_ENTRIES = 64
+
+
+class BadRequest(Exception):
+    """请求参数错误（HTTP 400）"""
+
+
+class NotFound(Exception):
+    """资源不存在（HTTP 404）"""
+
+
+class QueryEngine:
+    """
+    常驻内存的查询引擎
+
+    阻塞的抓取与计算在线程池中执行；内存缓存只在事件循环线程读写，
+    进行中的计算按 key 登记，相同 key 的请求直接等待同一个 future。
+    """
+
+    def __init__(
+        self,
+        provider: DataProvider,
+        metadata_cache: MetadataCache | None = None,
+        price_cache: PriceCache | None = None,
+        result_ttl: float = RESULT_TTL,
+        max_workers: int = 4
+    ):
+        """
+        Args:
+            provider: 数据源
+            metadata_cache: 元数据缓存（磁盘）
+            price_cache: 收盘价缓存（磁盘）
+            result_ttl: 内存结果有效期（秒）
+            max_workers: 计算线程数
+        """
+        self.provider = provider
+        self.metadata_cache = metadata_cache
+        self.price_cache = price_cache
+        self.result_ttl = result_ttl
+        self.metadata_ttl = metadata_cache.ttl if metadata_cache else result_ttl
+
+        self._metadata: tuple[float, list[dict]] | None = None
+        self._days: OrderedDict[str, tuple[float, list[StockRecord], str]] = OrderedDict()
+        self._panels: OrderedDict[tuple[str, str], tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = {"queries": 0, "memo_hits": 0, "coalesced": 0, "computed": 0}
+
+    async def _coalesce(self, key: tuple, func: Callable, *args) -> Any:
+        """在线程池中执行 func；相同 key 的计算进行中时直接等待它的结果"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["computed"] += 1
+            future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 某个请求断开不影响其他等待者
+        return await asyncio.shield(future)
+
+    def _memo_get(self, memo: OrderedDict, key) -> tuple | None:
+        entry = memo.get(key)
+        if entry is None or time.time() - entry[0] > self.result_ttl:
+            return None
+        memo.move_to_end(key)
+        self.stats["memo_hits"] += 1
+        return entry
+
+    @staticmethod
+    def _memo_put(memo: OrderedDict, key, entry: tuple) -> None:
+        memo[key] = entry
+        memo.move_to_end(key)
+        while len(memo) > MAX_ENTRIES:
+            memo.popitem(last=False)
+
+    def _load_metadata(self) -> list[dict]:
+        # 历史上出现过的成分都要有元数据，按日期查询时再按当日成分过滤
+        tickers = get_all_tickers()
+        return fetch_metadata(tickers, cache=self.metadata_cache, provider=self.provider)
+
+    async def metadata(self) -> list[dict]:
+        """股票池全部有效元数据（过期后重新加载）"""
+        if self._metadata and time.time() - self._metadata[0] <= self.metadata_ttl:
+            return self._metadata[1]
+        metadata = await self._coalesce(("metadata",), self._load_metadata)
+        self._metadata = (time.time(), metadata)
+        return metadata
+
+    def _compute_day(self, date: str, metadata: list[dict]) -> tuple[list[StockRecord], str]:
+        members = set(get_universe(date))
+        metadata = [m for m in metadata if m["ticker"] in members]
+        tickers = [m["ticker"] for m in metadata]
+        prices, actual_date = fetch_prices(
+            tickers, date, cache=self.price_cache, provider=self.provider
+        )
+        return compute_market_caps(metadata, prices), actual_date
+
+    async def day(self, date: str) -> tuple[list[StockRecord], str]:
+        """
+        某日全部股票的市值（按市值降序）
+
+        Returns:
+            (stocks, actual_date)
+        """
+        entry = self._memo_get(self._days, date)
+        if entry:
+            return entry[1], entry[2]
+        metadata = await self.metadata()
+        stocks, actual_date = await self._coalesce(("day", date), self._compute_day, date, metadata)
+        self._memo_put(self._days, date, (time.time(), stocks, actual_date))
+        return stocks, actual_date
+
+    async def caps(self, date: str, sector: str | None, top: int) -> tuple[list[StockRecord], str]:
+        """
+        单日排名
+
+        Returns:
+            (stocks, actual_date)
+
+        Raises:
+            NotFound: 行业不存在
+        """
+        self.stats["queries"] += 1
+        stocks, actual_date = await self.day(date)
+        if not sector:
+            return get_top_overall(stocks, top), actual_date
+
+        by_sector = rank_by_sector(stocks, top)
+        if sector not in by_sector:
+            raise NotFound(f"Sector '{sector}' not found, available: {list(by_sector)}")
+        return by_sector[sector], actual_date
+
+    def _load_panel(self, start: str, end: str, metadata: list[dict]):
+        closes = fetch_price_panel(
+            [m["ticker"] for m in metadata], start, end,
+            cache=self.price_cache, provider=self.provider
+        )
+        # 不属于当日成分的股票不参与当日排名
+        return closes.where(membership_mask(list(closes.columns), closes.index.values))
+
+    async def panel(self, start: str, end: str):
+        """区间收盘价面板（非成分股当日为空）"""
+        entry = self._memo_get(self._panels, (start, end))
+        if entry:
+            return entry[1]
+        metadata = await self.metadata()
+        closes = await self._coalesce(("panel", start, end), self._load_panel, start, end, metadata)
+        self._memo_put(self._panels, (start, end), (time.time(), closes))
+        return closes
+
+    async def series(self, start: str, end: str, sector: str | None, top: int):
+        """
+        区间每日排名长表
+
+        Raises:
+            NotFound: 行业不存在
+        """
+        self.stats["queries"] += 1
+        metadata = await self.metadata()
+        if sector and sector not in {m["sector"] for m in metadata}:
+            raise NotFound(f"Sector '{sector}' not found")
+        closes = await self.panel(start, end)
+        return await self._coalesce(
+            ("series", start, end, sector, top),
+            compute_market_cap_series, metadata, closes, top, sector or None
+        )
+
+    def health(self) -> dict:
+        return {
+            **self.stats,
+            "metadata_loaded": self._metadata is not None,
+            "days_cached": len(self._days),
+            "panels_cached": len(self._panels),
+            "inflight": len(self._inflight),
+            "provider": dict(getattr(self.provider, "stats", {}))
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _param(query: dict, name: str, default: str | None = None) -> str | None:
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _date_param(query: dict, name: str, default: str | None = None) -> str:
+    value = _param(query, name, default)
+    if not value:
+        raise BadRequest(f"Missing parameter '{name}'")
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise BadRequest(f"Invalid date '{value}', expected YYYY-MM-DD")
+    return value
+
+
+def _int_param(query: dict, name: str, default: int, minimum: int | None = None) -> int:
+    value = _param(query, name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise BadRequest(f"Invalid integer '{value}' for '{name}'")
+    if minimum is not None and number < minimum:
+        raise BadRequest(f"'{name}' must be at least {minimum}, got {number}")
+    return number
+
+
+def _records_csv(records: list[dict], fieldnames: list[str]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _json(data: Any) -> bytes:
+    # StockRecord 等 Mapping 记录按字典输出
+    return json.dumps(data, ensure_ascii=False, default=dict).encode("utf-8")
+
+
+async def handle_query(engine: QueryEngine, path: str, query: dict) -> tuple[int, str, bytes]:
+    """
+    处理一个 GET 请求
+
+    Returns:
+        (status, content_type, body)
+    """
+    fmt = _param(query, "format", "json")
+    if fmt not in ("json", "csv"):
+        raise BadRequest(f"Unknown format '{fmt}', expected json or csv")
+
+    if path == "/caps":
+        date = _date_param(query, "date", datetime.now().strftime("%Y-%m-%d"))
+        stocks, actual_date = await engine.caps(
+            date, _param(query, "sector"), _int_param(query, "top", 100, minimum=0)
+        )
+        if fmt == "csv":
+            return 200, "text/csv; charset=utf-8", _records_csv(stocks, FIELDNAMES)
+        return 200, "application/json", _json({
+            "query_date": date,
+            "actual_date": actual_date,
+            "total_stocks": len(stocks),
+            "stocks": stocks
+        })
+
+    if path == "/series":
+        start = _date_param(query, "start")
+        end = _date_param(query, "end")
+        series = await engine.series(
+            start, end, _param(query, "sector"), _int_param(query, "top", 100, minimum=0)
+        )
+        if fmt == "csv":
+            return 200, "text/csv; charset=utf-8", series.to_csv(index=False).encode("utf-8")
+        # 与 CLI 导出同一套取值，float 按 repr 输出
+        return 200, "application/json", _json([
+            dict(zip(SERIES_FIELDNAMES, values))
+            for values in frame_values(series, SERIES_FIELDNAMES)
+        ])
+
+    if path == "/health":
+        return 200, "application/json", _json(engine.health())
+
+    raise NotFound(f"Unknown path '{path}'")
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error"}
+
+
+async def _handle_connection(
+    engine: QueryEngine,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter
+) -> None:
+    """处理一个连接（一问一答后关闭）"""
+    started = time.perf_counter()
+    target = "-"
+    try:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        # 跳过请求头
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.split(" ")
+        if len(parts) != 3:
+            raise BadRequest("Malformed request line")
+        method, target, _ = parts
+        if method != "GET":
+            status, content_type, body = 405, "application/json", _json({"error": "GET only"})
+        else:
+            url = urlsplit(target)
+            status, content_type, body = await handle_query(engine, url.path, parse_qs(url.query))
+    except BadRequest as e:
+        status, content_type, body = 400, "application/json", _json({"error": str(e)})
+    except NotFound as e:
+        status, content_type, body = 404, "application/json", _json({"error": str(e)})
+    except Exception as e:
+        logger.exception(f"Request failed: {target}")
+        status, content_type, body = 500, "application/json", _json({"error": str(e)})
+
+    header = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    try:
+        writer.write(header.encode("latin-1") + body)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+    logger.info(f"{status} {target} {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+async def serve(engine: QueryEngine, host: str = "127.0.0.1", port: int = DEFAULT_PORT, warm: bool = True):
+    """
+    启动服务（直到被取消）
+
+    Args:
+        engine: 查询引擎
+        host: 监听地址
+        port: 监听端口
+        warm: 启动时先加载股票池与元数据
+    """
+    server = await asyncio.start_server(
+        lambda r, w: _handle_connection(engine, r, w), host, port
+    )
+    logger.info(f"Serving on http://{host}:{port}")
+    if warm:
+        await engine.metadata()
+        logger.info("Metadata warm")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: list[str] | None = None):
+    """python -m capscope serve 入口"""
+    from .cli import add_source_arguments, build_provider, setup_logging
+
+    parser = argparse.ArgumentParser(
+        prog="capscope serve",
+        description="CapScope 本地 HTTP 查询服务"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口，默认 {DEFAULT_PORT}")
+    parser.add_argument(
+        "--result-ttl",
+        type=float,
+        default=RESULT_TTL / 60,
+        help="内存中单日结果/价格面板的有效期（分钟），默认 15"
+    )
+    parser.add_argument(
+        "--no-warm",
+        action="store_true",
+        help="启动时不预加载元数据（首个请求时再加载）"
+    )
+    add_source_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_logging(args.verbose)
+
+    # 并发请求的重叠下载合并为一次
+    provider = CoalescingProvider(build_provider(args))
+    metadata_cache = None if args.no_cache else MetadataCache(
+        ttl=args.cache_ttl * 3600, provider=provider.name
+    )
+    price_cache = None if args.no_cache else PriceCache(provider=provider.name)
+    engine = QueryEngine(provider, metadata_cache, price_cache, result_ttl=args.result_ttl * 60)
+
+    try:
+        asyncio.run(serve(engine, args.host, args.port, warm=not args.no_warm))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
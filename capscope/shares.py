@@ -0,0 +1,281 @@
+"""历史流通股数模块
+
+按披露日期保存各 ticker 的股数，查询某日时取该日及之前最近一次披露（as-of）。
+收盘价是拆股复权后的价格，所以股数统一换算到当前拆股口径：
+披露日之后每发生一次拆股，股数乘以拆股比例，两者相乘即当日真实市值。
+"""
+
+import asyncio
+import logging
+import weakref
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from . import instrument
+from .cache import SharesStore
+from .fetcher import fetch_all
+from .providers import DataProvider
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 查询日往前取多久的历史，保证查询日之前至少有一次披露（季报间隔约 90 天）
+LOOKBACK_DAYS = 400
+
+# (ticker 编码, 日期) 合成 int64 键时编码的位移
+_KEY_SHIFT = 1 << 32
+
+
+def _to_days(dates) -> np.ndarray:
+    """日期（字符串/date/Timestamp 序列）→ 自 1970-01-01 起的天数"""
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+class SharesIndex:
+    """
+    历史股数的 as-of 查询索引
+
+    全部披露按 (ticker 编码, 日期) 排序后合成一个有序 int64 键数组，
+    任意 (ticker × 日期) 网格的查询只需一次 searchsorted。
+    """
+
+    def __init__(
+        self,
+        shares: list[tuple[str, str, float]],
+        splits: list[tuple[str, str, float]]
+    ):
+        """
+        Args:
+            shares: [(ticker, "YYYY-MM-DD", 原始股数), ...]，按 (ticker, date) 排序
+            splits: [(ticker, "YYYY-MM-DD", 拆股比例), ...]
+        """
+        self._codes: dict[str, int] = {}
+        codes = np.fromiter(
+            (self._codes.setdefault(t, len(self._codes)) for t, _, _ in shares),
+            dtype=np.int64,
+            count=len(shares)
+        )
+        self._keys = codes * _KEY_SHIFT + _to_days([d for _, d, _ in shares])
+        values = np.fromiter((v for _, _, v in shares), dtype=np.float64, count=len(shares))
+        self._values = np.round(values * self._split_factors(splits))
+        # 每个 ticker 第一条披露的位置
+        self._first = np.searchsorted(codes, np.arange(len(self._codes)))
+
+    def _split_factors(self, splits: list[tuple[str, str, float]]) -> np.ndarray:
+        """每条披露之后（不含披露当天）所有拆股比例的乘积"""
+        events = [(self._codes[t], d, r) for t, d, r in splits if t in self._codes and r > 0]
+        if not events:
+            return np.ones(len(self._keys))
+
+        split_keys = (
+            np.array([c for c, _, _ in events], dtype=np.int64) * _KEY_SHIFT
+            + _to_days([d for _, d, _ in events])
+        )
+        order = np.argsort(split_keys, kind="stable")
+        split_keys = split_keys[order]
+        log_ratios = np.log(np.array([r for _, _, r in events], dtype=np.float64))[order]
+        cumulative = np.concatenate([[0.0], np.cumsum(log_ratios)])
+
+        # 同一 ticker 内：披露日之后的拆股 = (该 ticker 最后一次拆股] - (披露日]
+        after = np.searchsorted(split_keys, self._keys, side="right")
+        last = np.searchsorted(split_keys, (self._keys // _KEY_SHIFT + 1) * _KEY_SHIFT, side="left")
+        return np.exp(cumulative[last] - cumulative[after])
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._codes
+
+    def lookup(self, tickers: list[str], dates) -> np.ndarray:
+        """
+        查询各日期的股数（当前拆股口径）
+
+        Args:
+            tickers: 股票代码列表
+            dates: 日期序列（"YYYY-MM-DD"/date/Timestamp）
+
+        Returns:
+            (len(dates), len(tickers)) 数组；没有历史的 ticker 为 NaN，
+            早于第一次披露的日期取第一次披露
+        """
+        days = _to_days(dates)
+        columns = np.fromiter(
+            (self._codes.get(t, -1) for t in tickers), dtype=np.int64, count=len(tickers)
+        )
+        result = np.full((len(days), len(tickers)), np.nan)
+        known = np.flatnonzero(columns >= 0)
+        if not len(known) or not len(days):
+            return result
+
+        codes = columns[known]
+        keys = codes[None, :] * _KEY_SHIFT + days[:, None]
+        pos = np.searchsorted(self._keys, keys, side="right") - 1
+        first = self._first[codes][None, :]
+        result[:, known] = self._values[np.maximum(pos, first)]
+        return result
+
+
+_indexes: "weakref.WeakKeyDictionary[SharesStore, tuple[int, SharesIndex]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_index(store: SharesStore) -> SharesIndex:
+    """读取存储中的全部历史并建索引（存储未变化时复用上次的索引）"""
+    cached = _indexes.get(store)
+    if cached and cached[0] == store.version:
+        return cached[1]
+    with instrument.span("shares.index"):
+        index = SharesIndex(*store.load())
+    _indexes[store] = (store.version, index)
+    return index
+
+
+def update_shares(
+    tickers: list[str],
+    start: date,
+    store: SharesStore,
+    provider: DataProvider,
+    max_workers: int = 10,
+    rate_limit: float = 20.0,
+    retries: int = 3
+) -> None:
+    """
+    抓取缺失或过期的历史股数与拆股事件并写入存储
+
+    Args:
+        tickers: 股票代码列表
+        start: 需要的最早日期
+        store: 历史股数存储
+        provider: 数据源
+        max_workers: 最大并发数
+        rate_limit: 每秒最多请求数（数据源 rate_limited 为 False 时不限速）
+        retries: 失败后最多重试次数
+    """
+    stale = store.stale(tickers, start)
+    instrument.count("shares.cache_hits", len(tickers) - len(stale))
+    if not stale:
+        logger.info(f"Shares history cache hit for {len(tickers)} tickers")
+        return
+    logger.info(f"Fetching shares history for {len(stale)} tickers since {start}")
+
+    options = {
+        "rate": rate_limit if provider.rate_limited else None,
+        "max_concurrency": max_workers,
+        "retries": retries
+    }
+
+    # 拆股事件逐个下载（yfinance 每个 ticker 一次请求），与股数历史一样经 fetch_all
+    # 限速、重试；失败的 ticker 不写入，下次重试
+    splits: list[dict] = []
+    with_splits: list[str] = []
+
+    def on_splits(batch: list[str], result: list[dict] | None):
+        if result is not None:
+            splits.extend(result)
+            with_splits.extend(batch)
+
+    today = date.today()
+    with instrument.span("shares.splits"):
+        asyncio.run(fetch_all(
+            [[t] for t in stale],
+            lambda batch: provider.get_splits(batch, start, today),
+            on_splits,
+            **options
+        ))
+    if len(with_splits) < len(stale):
+        logger.warning(f"Split download failed for {len(stale) - len(with_splits)} tickers")
+    if not with_splits:
+        return
+
+    history: list[dict] = []
+    done: list[str] = []
+
+    def on_done(batch: list[str], result: list[dict] | None):
+        if result is not None:
+            history.extend(result)
+            done.extend(batch)
+
+    with instrument.span("shares.history"):
+        asyncio.run(fetch_all(
+            [[t] for t in with_splits],
+            lambda batch: provider.get_shares_history(batch, start),
+            on_done,
+            **options
+        ))
+
+    fetched = set(done)
+    store.put(
+        done,
+        start,
+        [(r["ticker"], r["date"], r["shares"]) for r in history],
+        [(r["ticker"], r["date"], r["ratio"]) for r in splits if r["ticker"] in fetched]
+    )
+    logger.info(f"Cached shares history for {len(done)}/{len(stale)} tickers")
+
+
+def load_shares(
+    tickers: list[str],
+    start: date,
+    store: SharesStore,
+    provider: DataProvider,
+    **options
+) -> SharesIndex:
+    """
+    补齐历史后返回索引
+
+    Args:
+        tickers: 股票代码列表
+        start: 需要的最早日期
+        store: 历史股数存储
+        provider: 数据源
+        **options: 传给 update_shares 的抓取参数
+
+    Returns:
+        SharesIndex
+    """
+    update_shares(tickers, start, store, provider, **options)
+    return get_index(store)
+
+
+def history_start(day: str | date) -> date:
+    """查询某日（或区间起点）时需要的历史起始日期"""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day - timedelta(days=LOOKBACK_DAYS)
+
+
+def point_in_time_metadata(metadata: list[dict], day: str, index: SharesIndex) -> list[dict]:
+    """
+    把元数据中的当前股数替换为 day 当日的股数
+
+    Args:
+        metadata: [{ticker, name, sector, shares}, ...]
+        day: 日期 "YYYY-MM-DD"
+        index: 历史股数索引
+
+    Returns:
+        新的元数据列表；没有历史的 ticker 保持当前股数
+    """
+    values = index.lookup([m["ticker"] for m in metadata], [day])[0]
+    return [
+        m if np.isnan(value) else {**m, "shares": int(value)}
+        for m, value in zip(metadata, values)
+    ]
+
+
+def shares_frame(tickers: list[str], dates: "pd.DatetimeIndex", index: SharesIndex) -> "pd.DataFrame":
+    """
+    区间内每个交易日的股数宽表
+
+    Returns:
+        DataFrame（index=dates，columns=tickers），没有历史的 ticker 为 NaN
+    """
+    import pandas as pd
+
+    return pd.DataFrame(index.lookup(tickers, dates.values), index=dates, columns=tickers)
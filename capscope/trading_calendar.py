@@ -0,0 +1,165 @@
+"""纽交所交易日历（离线）
+
+按规则推算每年的休市日与提前收盘日，不需要联网：
+- 固定节日（元旦、六月节、独立日、圣诞）落在周六提前到周五、周日顺延到周一；
+  元旦落在周六时不补休（前一年 12/31 照常交易）
+- 浮动节日：马丁·路德·金纪念日（1998 年起）、总统日、耶稣受难日、阵亡将士纪念日、
+  劳动节、感恩节
+- 临时休市（国丧、飓风、9·11 等）见 SPECIAL_CLOSURES
+- 提前收盘（13:00）：独立日前一天、感恩节次日、平安夜，当天本身是交易日时
+
+价格获取据此直接确定查询日对应的交易日，缓存据此区分“本来就没有数据的日子”
+与真正的缺口。
+"""
+
+import functools
+from datetime import date, time, timedelta
+
+# 正常/提前收盘时间（美东时间）
+CLOSE_TIME = time(16, 0)
+EARLY_CLOSE_TIME = time(13, 0)
+
+# 规则之外的全天休市
+SPECIAL_CLOSURES = frozenset(date.fromisoformat(d) for d in [
+    "1972-11-07",  # 总统选举日
+    "1972-12-28",  # 杜鲁门国葬
+    "1973-01-25",  # 约翰逊国葬
+    "1976-11-02",  # 总统选举日
+    "1977-07-14",  # 纽约大停电
+    "1980-11-04",  # 总统选举日
+    "1985-09-27",  # 飓风 Gloria
+    "1994-04-27",  # 尼克松国葬
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",  # 9·11
+    "2004-06-11",  # 里根国葬
+    "2007-01-02",  # 福特国葬
+    "2012-10-29", "2012-10-30",  # 飓风 Sandy
+    "2018-12-05",  # 老布什国葬
+    "2025-01-09",  # 卡特国葬
+])
+
+
+def _observed(day: date) -> date:
+    """周六的节日提前到周五，周日的顺延到周一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """某月第 n 个星期几（n=-1 为最后一个）"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """复活节（公历，Anonymous Gregorian 算法）"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    return date(year, month, (h + l - 7 * m + 114) % 31 + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def holidays(year: int) -> frozenset[date]:
+    """某年的全部休市日（不含周末，含临时休市）"""
+    days = set()
+
+    new_year = date(year, 1, 1)
+    if new_year.weekday() < 5:
+        days.add(new_year)
+    elif new_year.weekday() == 6:
+        days.add(new_year + timedelta(days=1))
+
+    if year >= 1998:
+        days.add(_nth_weekday(year, 1, 0, 3))  # 马丁·路德·金纪念日
+    if year >= 1971:
+        days.add(_nth_weekday(year, 2, 0, 3))  # 总统日
+        days.add(_nth_weekday(year, 5, 0, -1))  # 阵亡将士纪念日
+    else:
+        days.add(_observed(date(year, 2, 22)))
+        days.add(_observed(date(year, 5, 30)))
+    days.add(_easter(year) - timedelta(days=2))  # 耶稣受难日
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # 六月节
+    days.add(_observed(date(year, 7, 4)))
+    days.add(_nth_weekday(year, 9, 0, 1))  # 劳动节
+    days.add(_nth_weekday(year, 11, 3, 4))  # 感恩节
+    days.add(_observed(date(year, 12, 25)))
+
+    days.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(days)
+
+
+@functools.lru_cache(maxsize=None)
+def early_closes(year: int) -> frozenset[date]:
+    """某年 13:00 提前收盘的交易日"""
+    candidates = [
+        date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),
+        date(year, 12, 24)
+    ]
+    return frozenset(d for d in candidates if is_trading_day(d))
+
+
+def is_trading_day(day: date) -> bool:
+    """是否为交易日（工作日且不休市）"""
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def close_time(day: date) -> time | None:
+    """当天收盘时间（美东时间），非交易日返回 None"""
+    if not is_trading_day(day):
+        return None
+    return EARLY_CLOSE_TIME if day in early_closes(day.year) else CLOSE_TIME
+
+
+def previous_trading_day(day: date, inclusive: bool = True) -> date:
+    """
+    不晚于 day 的最近交易日
+
+    Args:
+        day: 日期
+        inclusive: day 本身是交易日时是否返回它；False 时严格早于 day
+    """
+    if not inclusive:
+        day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def next_trading_day(day: date, inclusive: bool = True) -> date:
+    """
+    不早于 day 的最近交易日
+
+    Args:
+        day: 日期
+        inclusive: day 本身是交易日时是否返回它；False 时严格晚于 day
+    """
+    if not inclusive:
+        day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def trading_days(start: date, end: date) -> list[date]:
+    """[start, end] 内的全部交易日"""
+    days = []
+    day = start
+    while day <= end:
+        if is_trading_day(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
@@ -1,8 +1,41 @@
-"""股票池加载模块"""
+"""股票池加载模块
+
+每个指数一个 JSON：当前成分（tickers）加可选的成分变动事件（events）:
+
+    {
+      "index": "S&P 500",
+      "updated": "2026-01-30",
+      "count": 503,
+      "tickers": ["A", "AAPL", ...],
+      "events": [{"date": "2025-12-22", "added": ["APP"], "removed": ["ENPH"]}, ...]
+    }
+
+某日的成分 = 当前成分按时间倒序撤销该日之后的事件，历史查询因此只包含
+当时的成分股。最早一条事件（没有事件时为 updated）之前的变动没有记录，
+更早日期的成分只能用当时已知的成分近似，仍有幸存者偏差；内置数据不带事件，
+需要先 refresh_universe 从 Wikipedia 变动表导入带生效日期的历史事件。
+
+refresh_universe 抓取最新成分与变动表：与当前成分的差异按变动表中的生效日期
+记为事件，本地还没有的更早事件一并补上，写到缓存目录下的副本，之后优先读取副本。
+解析结果按文件修改时间缓存在进程内，重复调用不再读盘。
+"""
 
 import json
+import logging
+import os
+import re
 import sys
+from datetime import date, datetime
+from html.parser import HTMLParser
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from .cache import get_cache_dir
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
 
 
 def _get_data_dir() -> Path:
@@ -17,36 +50,533 @@ def _get_data_dir() -> Path:
 
 DATA_DIR = _get_data_dir()
 
+# 指数 → 数据文件
+INDEX_FILES = {
+    "sp500": "sp500.json",
+    "nasdaq100": "nasdaq100.json",
+}
+
+# refresh_universe 默认的成分来源（表格 id 均为 constituents）
+WIKIPEDIA_PAGES = {
+    "sp500": "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies",
+    "nasdaq100": "https://en.wikipedia.org/wiki/Nasdaq-100",
+}
+
+# 带生效日期的成分变动表（Nasdaq-100 页面没有可解析的变动表）
+WIKIPEDIA_CHANGE_TABLES = {
+    "sp500": "changes",
+}
+
+
+class IndexHistory:
+    """一个指数的成分及其变动历史（只读）"""
+
+    def __init__(self, data: dict):
+        """
+        Args:
+            data: 指数 JSON 的内容
+        """
+        self.index: str = data.get("index", "")
+        self.updated: str = data.get("updated", "")
+        # 本地副本基于的内置数据版本（内置数据升级后副本作废）
+        self.based_on: str = data.get("based_on", self.updated)
+        self.tickers = frozenset(data.get("tickers", []))
+        # 按日期升序；同一天的多条事件按出现顺序
+        self.events: list[tuple[str, tuple[str, ...], tuple[str, ...]]] = sorted(
+            (
+                (e["date"], tuple(e.get("added", [])), tuple(e.get("removed", [])))
+                for e in data.get("events", [])
+            ),
+            key=lambda e: e[0]
+        )
+        # 有记录的最早日期，更早的成分变动未知
+        self.since: str = self.events[0][0] if self.events else self.updated
+        self._members: dict[str | None, frozenset[str]] = {None: self.tickers}
+        self._warned = False
+
+    def members(self, as_of: str | None = None) -> frozenset[str]:
+        """
+        某日收盘时的成分
+
+        Args:
+            as_of: 日期 "YYYY-MM-DD"，None 表示当前成分
+        """
+        cached = self._members.get(as_of)
+        if cached is not None:
+            return cached
+        if as_of < self.since and not self._warned:
+            self._warned = True
+            logger.warning(
+                f"{self.index or 'Universe'}: no membership changes recorded before {self.since}, "
+                f"earlier dates use the constituents known then (survivorship bias); "
+                f"run 'capscope universe --refresh' to import the dated change log"
+            )
+        members = set(self.tickers)
+        for day, added, removed in reversed(self.events):
+            if day <= as_of:
+                break
+            members.difference_update(added)
+            members.update(removed)
+        result = self._members[as_of] = frozenset(members)
+        return result
+
+    def members_between(self, start: str, end: str) -> frozenset[str]:
+        """区间内任一天属于成分的股票"""
+        members = set(self.members(start))
+        for day, added, _ in self.events:
+            if start < day <= end:
+                members.update(added)
+        return frozenset(members)
+
+    def with_members(
+        self,
+        tickers: Iterable[str],
+        on: str,
+        changes: Iterable[dict] = ()
+    ) -> tuple["IndexHistory", list[str], list[str]]:
+        """
+        记录一次成分更新
+
+        与当前成分的差异按 changes 中的生效日期记为事件；changes 里 updated 之前、
+        本地还没有的变动作为历史事件补上。
+
+        Args:
+            tickers: 最新成分
+            on: 在 changes 中找不到生效日期的差异记在这一天 "YYYY-MM-DD"
+            changes: 带生效日期的变动 [{date, added, removed}, ...]
+
+        Returns:
+            (新的 IndexHistory, added, removed)；没有新事件时返回自身
+        """
+        current = set(tickers)
+        added = sorted(current - self.tickers)
+        removed = sorted(self.tickers - current)
+        undated_added, undated_removed = set(added), set(removed)
+        recorded = {(day, t) for day, a, r in self.events for t in a + r}
+
+        events = []
+        for change in sorted(changes, key=lambda c: c["date"]):
+            day = change["date"]
+            if day > self.updated:
+                # 当前数据之后的变动：只取与差异吻合的部分
+                new_added = [t for t in change.get("added", []) if t in undated_added]
+                new_removed = [t for t in change.get("removed", []) if t in undated_removed]
+                undated_added.difference_update(new_added)
+                undated_removed.difference_update(new_removed)
+            else:
+                new_added = [t for t in change.get("added", []) if (day, t) not in recorded]
+                new_removed = [t for t in change.get("removed", []) if (day, t) not in recorded]
+            if new_added or new_removed:
+                events.append({"date": day, "added": new_added, "removed": new_removed})
+
+        if undated_added or undated_removed:
+            logger.warning(
+                f"{self.index}: {len(undated_added) + len(undated_removed)} changes "
+                f"have no effective date in the change log, recorded as of {on}"
+            )
+            events.append({"date": on, "added": sorted(undated_added), "removed": sorted(undated_removed)})
+        if not events:
+            return self, added, removed
+
+        data = self.to_dict()
+        data.update(updated=max(self.updated, on), count=len(current), tickers=sorted(current))
+        data["events"].extend(events)
+        return IndexHistory(data), added, removed
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "updated": self.updated,
+            "based_on": self.based_on,
+            "count": len(self.tickers),
+            "tickers": sorted(self.tickers),
+            "events": [
+                {"date": day, "added": list(added), "removed": list(removed)}
+                for day, added, removed in self.events
+            ]
+        }
+
+
+# 数据文件路径 → (修改时间, 解析结果)
+_loaded: dict[Path, tuple[float, IndexHistory]] = {}
+# 当前这组指数的 as_of → 成分并集（IndexHistory 无 __eq__，按对象比较）
+_unions: tuple[tuple[IndexHistory, ...], dict[str | None, tuple[str, ...]]] = ((), {})
+
 
-def get_universe() -> list[str]:
+def _local_dir() -> Path:
+    """refresh_universe 写入的副本目录"""
+    return get_cache_dir("universe")
+
+
+def _read(path: Path) -> IndexHistory | None:
+    """读取并缓存一个数据文件（文件未变化时复用上次的解析结果）"""
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            history = IndexHistory(json.load(f))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable universe file {path}: {e}")
+        return None
+    _loaded[path] = (mtime, history)
+    return history
+
+
+def load_index(key: str) -> IndexHistory | None:
+    """
+    读取一个指数（本地副本基于当前内置数据时用副本）
+
+    Args:
+        key: INDEX_FILES 中的指数键
+    """
+    filename = INDEX_FILES[key]
+    bundled = _read(DATA_DIR / filename)
+    local = _read(_local_dir() / filename)
+    if local is None:
+        return bundled
+    if bundled is None or local.based_on >= bundled.updated:
+        return local
+    return bundled
+
+
+def _histories() -> tuple[IndexHistory, ...]:
+    return tuple(h for h in map(load_index, INDEX_FILES) if h is not None)
+
+
+def _union(histories: tuple[IndexHistory, ...], as_of: str | None) -> tuple[str, ...]:
+    global _unions
+    cached, memo = _unions
+    if cached != histories:
+        # 指数文件有变化：旧的并集连同旧的 IndexHistory 一起丢弃
+        memo = {}
+        _unions = (histories, memo)
+    result = memo.get(as_of)
+    if result is None:
+        members: set[str] = set()
+        for history in histories:
+            members.update(history.members(as_of))
+        result = memo[as_of] = tuple(sorted(members))
+    return result
+
+
+def _iso(day: str | date | None) -> str | None:
+    return day.isoformat() if isinstance(day, date) else day
+
+
+def get_universe(as_of: str | date | None = None) -> list[str]:
     """
     加载股票池（S&P 500 + Nasdaq 100 去重）
-    
+
+    Args:
+        as_of: 只返回该日属于成分的股票，None 表示当前成分
+
+    Returns:
+        去重后的 ticker 列表
+    """
+    return list(_union(_histories(), _iso(as_of)))
+
+
+def get_universe_between(start: str | date, end: str | date) -> list[str]:
+    """
+    区间内任一天属于成分的股票（区间查询时抓取这些股票）
+
     Returns:
         去重后的 ticker 列表
     """
-    tickers = set()
-    
-    for filename in ["sp500.json", "nasdaq100.json"]:
-        filepath = DATA_DIR / filename
-        if filepath.exists():
-            with open(filepath, "r") as f:
-                data = json.load(f)
-                tickers.update(data.get("tickers", []))
-    
-    return sorted(list(tickers))
+    members: set[str] = set()
+    for history in _histories():
+        members.update(history.members_between(_iso(start), _iso(end)))
+    return sorted(members)
+
+
+def get_all_tickers() -> list[str]:
+    """记录中出现过的全部成分（当前成分 + 历史上被移出的）"""
+    members: set[str] = set()
+    for history in _histories():
+        members.update(history.tickers)
+        for _, added, removed in history.events:
+            members.update(added)
+            members.update(removed)
+    return sorted(members)
+
+
+def membership_mask(tickers: list[str], dates: Iterable) -> "np.ndarray":
+    """
+    每个交易日每只股票是否属于成分
+
+    Args:
+        tickers: 股票代码列表
+        dates: 升序日期序列（"YYYY-MM-DD"/date/Timestamp）
+
+    Returns:
+        (len(dates), len(tickers)) 布尔数组
+    """
+    import numpy as np
+
+    days = np.asarray(list(dates), dtype="datetime64[D]")
+    mask = np.zeros((len(days), len(tickers)), dtype=bool)
+    if not len(days):
+        return mask
+    column = {t: i for i, t in enumerate(tickers)}
+    start, end = str(days[0]), str(days[-1])
+
+    for history in _histories():
+        member = np.zeros((len(days), len(tickers)), dtype=bool)
+        member[:, [column[t] for t in history.members(start) if t in column]] = True
+        for day, added, removed in history.events:
+            if not start < day <= end:
+                continue
+            rows = days >= np.datetime64(day)
+            member[np.ix_(rows, [column[t] for t in added if t in column])] = True
+            member[np.ix_(rows, [column[t] for t in removed if t in column])] = False
+        mask |= member
+    return mask
+
+
+class _TableParser(HTMLParser):
+    """取出页面中指定 id 的表格，按 rowspan/colspan 展开成等宽的行"""
+
+    def __init__(self, table_id: str):
+        super().__init__()
+        self.table_id = table_id
+        self.rows: list[list[str]] = []
+        self._depth = 0        # 在目标表格内的嵌套层数
+        self._row: list[str] | None = None
+        self._cell: list[str] | None = None
+        self._span = (1, 1)    # 当前单元格的 (rowspan, colspan)
+        self._carry: dict[int, tuple[int, str]] = {}  # 列 → (还要向下延续的行数, 文本)
+
+    def _fill_carried(self):
+        """补上从上方行延续下来的单元格"""
+        while len(self._row) in self._carry:
+            column = len(self._row)
+            remaining, text = self._carry.pop(column)
+            self._row.append(text)
+            if remaining > 1:
+                self._carry[column] = (remaining - 1, text)
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth:
+            if tag == "table":
+                self._depth += 1
+            elif self._depth > 1:
+                return
+            elif tag == "tr":
+                self._row = []
+            elif tag in ("td", "th") and self._row is not None:
+                attrs = dict(attrs)
+                self._span = tuple(
+                    int(attrs[name]) if str(attrs.get(name, "")).isdigit() else 1
+                    for name in ("rowspan", "colspan")
+                )
+                self._cell = []
+        elif tag == "table" and dict(attrs).get("id") == self.table_id:
+            self._depth = 1
+
+    def handle_endtag(self, tag):
+        if not self._depth:
+            return
+        if tag == "table":
+            self._depth -= 1
+        elif self._depth > 1:
+            return
+        elif tag in ("td", "th") and self._cell is not None:
+            # 去掉脚注标记 [1]，合并空白
+            text = " ".join(re.sub(r"\[[^\]]*\]", "", "".join(self._cell)).split())
+            self._cell = None
+            self._fill_carried()
+            rowspan, colspan = self._span
+            for _ in range(max(colspan, 1)):
+                if rowspan > 1:
+                    self._carry[len(self._row)] = (rowspan - 1, text)
+                self._row.append(text)
+        elif tag == "tr" and self._row is not None:
+            self._fill_carried()
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _wikipedia_table(key: str, table_id: str, timeout: float) -> list[list[str]]:
+    """抓取指数的 Wikipedia 页面并取出 id 为 table_id 的表格"""
+    from urllib.request import Request, urlopen
+
+    request = Request(WIKIPEDIA_PAGES[key], headers={"User-Agent": "CapScope"})
+    with urlopen(request, timeout=timeout) as response:
+        html = response.read().decode("utf-8", errors="replace")
+    parser = _TableParser(table_id)
+    parser.feed(html)
+    return parser.rows
+
+
+def fetch_wikipedia_members(key: str, timeout: float = 30.0) -> list[str]:
+    """
+    从 Wikipedia 抓取指数最新成分
+
+    Args:
+        key: INDEX_FILES 中的指数键
+        timeout: 请求超时（秒）
+    """
+    tickers = []
+    column = None  # 代码所在列
+    for row in _wikipedia_table(key, "constituents", timeout):
+        if column is None:
+            headers = [c.lower() for c in row]
+            for name in ("symbol", "ticker"):
+                if name in headers:
+                    column = headers.index(name)
+        elif len(row) > column and row[column]:
+            tickers.append(row[column])
+    if not tickers:
+        raise ValueError(f"No constituents table found for {key}")
+    return tickers
+
+
+def fetch_wikipedia_changes(key: str, timeout: float = 30.0) -> list[dict]:
+    """
+    从 Wikipedia 变动表抓取带生效日期的成分变动
+
+    表格列为：生效日期、调入代码、调入公司、调出代码、调出公司、原因。
+
+    Args:
+        key: INDEX_FILES 中的指数键
+        timeout: 请求超时（秒）
+
+    Returns:
+        [{date, added, removed}, ...]，按日期升序，同一天的变动合并为一条；
+        页面没有变动表的指数返回空列表
+    """
+    table_id = WIKIPEDIA_CHANGE_TABLES.get(key)
+    if table_id is None:
+        return []
+
+    events: dict[str, dict] = {}
+    for row in _wikipedia_table(key, table_id, timeout):
+        if len(row) < 4:
+            continue
+        try:
+            day = datetime.strptime(row[0], "%B %d, %Y").date().isoformat()
+        except ValueError:
+            continue  # 表头
+        event = events.setdefault(day, {"date": day, "added": [], "removed": []})
+        if row[1]:
+            event["added"].append(row[1])
+        if row[3]:
+            event["removed"].append(row[3])
+    if not events:
+        raise ValueError(f"No change log table found for {key}")
+    return [events[day] for day in sorted(events)]
+
+
+def refresh_universe(
+    fetch: Callable[[str], list[str]] = fetch_wikipedia_members,
+    on: str | date | None = None,
+    fetch_changes: Callable[[str], list[dict]] | None = fetch_wikipedia_changes
+) -> dict[str, tuple[list[str], list[str]]]:
+    """
+    抓取最新成分，把差异按实际生效日期作为新事件写入本地副本
+
+    Args:
+        fetch: 指数键 → 最新成分列表
+        on: 变动表中查不到生效日期的差异记在这一天，默认今天
+        fetch_changes: 指数键 → 带生效日期的变动 [{date, added, removed}, ...]，
+            None 时不查变动表（差异全部记在 on）
+
+    Returns:
+        {指数键: (added, removed)}；抓取失败的指数不出现
+    """
+    on = _iso(on) or date.today().isoformat()
+    changes = {}
+    for key, filename in INDEX_FILES.items():
+        history = load_index(key)
+        if history is None:
+            continue
+        try:
+            latest = fetch(key)
+        except Exception as e:
+            logger.warning(f"Failed to fetch {key} constituents: {e}")
+            continue
+        dated = []
+        if fetch_changes is not None:
+            try:
+                dated = fetch_changes(key)
+            except Exception as e:
+                logger.warning(f"Failed to fetch {key} change log: {e}")
+
+        updated, added, removed = history.with_members(latest, on, dated)
+        changes[key] = (added, removed)
+        if updated is history:
+            logger.info(f"{history.index}: no membership change")
+            continue
+
+        path = _local_dir() / filename
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(updated.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        logger.info(
+            f"{history.index}: +{len(added)} -{len(removed)}, "
+            f"{len(updated.events) - len(history.events)} new change events"
+        )
+    return changes
 
 
 def get_universe_info() -> dict:
     """获取股票池元信息"""
     info = {}
-    for filename in ["sp500.json", "nasdaq100.json"]:
-        filepath = DATA_DIR / filename
-        if filepath.exists():
-            with open(filepath, "r") as f:
-                data = json.load(f)
-                info[data.get("index", filename)] = {
-                    "count": data.get("count", 0),
-                    "updated": data.get("updated", "unknown")
-                }
+    for key, filename in INDEX_FILES.items():
+        history = load_index(key)
+        if history is not None:
+            info[history.index or filename] = {
+                "count": len(history.tickers),
+                "updated": history.updated or "unknown",
+                "since": history.since or "unknown",
+                "events": len(history.events)
+            }
     return info
+
+
+def main(argv: list[str] | None = None):
+    """python -m capscope universe 入口"""
+    import argparse
+
+    from .cli import setup_logging
+
+    parser = argparse.ArgumentParser(
+        prog="capscope universe",
+        description="查看股票池成分及其变动历史，或抓取最新成分"
+    )
+    parser.add_argument("--date", "-d", help="显示该日的成分（默认当前）")
+    parser.add_argument("--list", action="store_true", help="逐行输出 ticker")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="从 Wikipedia 抓取最新成分与变动表，差异按生效日期记为变动事件并补上历史事件"
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="详细日志")
+    args = parser.parse_args(argv)
+    setup_logging(args.verbose)
+
+    if args.refresh:
+        for key, (added, removed) in refresh_universe().items():
+            print(f"{key}: +{len(added)} {' '.join(added)}  -{len(removed)} {' '.join(removed)}")
+
+    if args.list:
+        print("\n".join(get_universe(args.date)))
+        return
+
+    for index, item in get_universe_info().items():
+        print(
+            f"{index}: {item['count']} tickers, updated {item['updated']}, "
+            f"{item['events']} change events (history since {item['since']})"
+        )
+    tickers = get_universe(args.date)
+    print(f"Universe{f' as of {args.date}' if args.date else ''}: {len(tickers)} tickers")
@@ -0,0 +1,249 @@
+"""盘中实时排名（CLI 的 --watch 与 GUI 自动刷新共用）
+
+元数据只在开始时取一次（走缓存），之后每轮只拉最新价格：
+价格有变化的股票才重算市值，并在全市场与所属行业的有序索引里挪到新位置；
+每轮只输出前 N 名的差异（名次变动、进入、退出）。
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+from . import instrument
+from .compute import MarketCapTable, StockRecord
+from .providers import DataProvider
+
+logger = logging.getLogger(__name__)
+
+# 全市场排名的分组名
+ALL = "__all__"
+
+
+class _RankedGroup:
+    """
+    一组股票按市值降序排列的行号（增量维护）
+
+    排序键为复数 -市值 + 1j*行号：numpy 按实部、虚部依次比较，
+    市值相同时按行号排列，与 MarketCapTable 的全量排名一致。
+    """
+
+    # 变化的行超过组内已排名行数的该比例时，整组重排比逐个插入快
+    REBUILD_RATIO = 0.25
+
+    def __init__(self, members: np.ndarray):
+        """
+        Args:
+            members: 组内全部行号
+        """
+        self.members = members
+        self.order = members[:0]  # 有市值的行，按市值降序
+        self.keys = np.empty(0, dtype=np.complex128)
+
+    @staticmethod
+    def _keys(rows: np.ndarray, caps: np.ndarray) -> np.ndarray:
+        return -caps[rows] + 1j * rows
+
+    def update(self, rows: np.ndarray, caps: np.ndarray) -> None:
+        """
+        组内 rows 的市值已变：移出后按新市值插回（市值为 NaN 的不再插回）
+
+        Args:
+            rows: 组内市值变化的行号
+            caps: 全部行的市值
+        """
+        if len(rows) > self.REBUILD_RATIO * len(self.order):
+            ranked = self.members[np.isfinite(caps[self.members])]
+            keys = self._keys(ranked, caps)
+            order = np.argsort(keys)
+            self.order, self.keys = ranked[order], keys[order]
+            return
+
+        keep = ~np.isin(self.order, rows)
+        order, keys = self.order[keep], self.keys[keep]
+        rows = rows[np.isfinite(caps[rows])]
+        new_keys = self._keys(rows, caps)
+        sort = np.argsort(new_keys)
+        rows, new_keys = rows[sort], new_keys[sort]
+        positions = np.searchsorted(keys, new_keys)
+        self.order = np.insert(order, positions, rows)
+        self.keys = np.insert(keys, positions, new_keys)
+
+
+class LiveRanking:
+    """
+    随最新价格增量更新的市值排名
+
+    ranking = LiveRanking(metadata, top_n=20)
+    changes = ranking.update(provider.get_last_prices(ranking.tickers))
+    # {"__all__": [{"event": "move", "rank": 3, "prev_rank": 4, "ticker": ...}, ...]}
+    """
+
+    def __init__(
+        self,
+        metadata: list[dict],
+        top_n: int = 100,
+        sector: str | None = None,
+        by_sector: bool = False
+    ):
+        """
+        Args:
+            metadata: [{ticker, name, sector, shares}, ...]
+            top_n: 每组比较前 N 名
+            sector: 只排这个行业（分组名为行业名），默认排全市场
+            by_sector: 除全市场外，每个行业也各排一组
+        """
+        codes, sectors = MarketCapTable._encode_sectors([m["sector"] for m in metadata])
+        n = len(metadata)
+        self.tickers = [m["ticker"] for m in metadata]
+        self.top_n = top_n
+        self.table = MarketCapTable(
+            tickers=np.array(self.tickers, dtype=object),
+            names=np.array([m["name"] for m in metadata], dtype=object),
+            sector_codes=codes,
+            sectors=sectors,
+            shares=np.fromiter((m["shares"] for m in metadata), dtype=np.float64, count=n),
+            closes=np.full(n, np.nan),
+            market_caps=np.full(n, np.nan)
+        )
+
+        self.groups: dict[str, _RankedGroup] = {}
+        self._group_codes: dict[str, int | None] = {}  # 分组 → 行业编码（全市场为 None）
+        if sector is None:
+            self.groups[ALL] = _RankedGroup(np.arange(n))
+            self._group_codes[ALL] = None
+        for code, name in enumerate(sectors):
+            if name == sector or (sector is None and by_sector):
+                self.groups[name] = _RankedGroup(np.flatnonzero(codes == code))
+                self._group_codes[name] = code
+        self._tops = {key: np.empty(0, dtype=np.intp) for key in self.groups}
+        self.changed = np.empty(0, dtype=np.intp)  # 上一轮价格变化的行
+
+    def update(self, prices: dict[str, float]) -> dict[str, list[dict]]:
+        """
+        用最新价格更新排名（prices 中没有或为 NaN 的股票沿用上一轮价格）
+
+        Args:
+            prices: {ticker: 最新价}
+
+        Returns:
+            {分组名: 前 N 名的变化}，没有变化的分组不出现；
+            变化为 {event, rank, prev_rank, ticker, name, sector, close, market_cap_b}，
+            event 为 enter/exit/move，rank/prev_rank 从 1 起（进入时 prev_rank、
+            退出时 rank 为 None）
+        """
+        table = self.table
+        # 缺失的价格为 None，转成 NaN 后沿用旧值
+        fetched = np.array(list(map(prices.get, self.tickers)), dtype=np.float64)
+        closes = np.where(np.isnan(fetched), table.closes, fetched)
+
+        same = (closes == table.closes) | (np.isnan(closes) & np.isnan(table.closes))
+        changed = np.flatnonzero(~same)
+        self.changed = changed
+        instrument.count("watch.changed_prices", len(changed))
+        if len(changed) == 0:
+            return {}
+
+        table.closes[changed] = closes[changed]
+        table.market_caps[changed] = closes[changed] * table.shares[changed]
+
+        result = {}
+        for key, group in self.groups.items():
+            code = self._group_codes[key]
+            rows = changed if code is None else changed[table.sector_codes[changed] == code]
+            if len(rows) == 0:
+                continue
+            group.update(rows, table.market_caps)
+            events = self._diff(key, group)
+            if events:
+                result[key] = events
+        logger.debug(
+            f"Live ranking: {len(changed)} prices changed, "
+            f"{sum(map(len, result.values()))} rank changes"
+        )
+        return result
+
+    def _diff(self, key: str, group: _RankedGroup) -> list[dict]:
+        """比较该组前 N 名与上一轮"""
+        prev, top = self._tops[key], group.order[:self.top_n]
+        self._tops[key] = top
+        if np.array_equal(prev, top):
+            return []
+
+        prev_rank = {row: rank for rank, row in enumerate(prev.tolist(), 1)}
+        events = []
+        for rank, row in enumerate(top.tolist(), 1):
+            before = prev_rank.pop(row, None)
+            if before is None:
+                events.append(self._event("enter", row, rank, None))
+            elif before != rank:
+                events.append(self._event("move", row, rank, before))
+        for row, before in prev_rank.items():
+            events.append(self._event("exit", row, None, before))
+        return events
+
+    def _event(self, event: str, row: int, rank: int | None, prev_rank: int | None) -> dict:
+        table = self.table
+        close, cap = table.closes[row], table.market_caps[row]
+        return {
+            "event": event,
+            "rank": rank,
+            "prev_rank": prev_rank,
+            "ticker": table.tickers[row],
+            "name": table.names[row],
+            "sector": table.sectors[table.sector_codes[row]],
+            "close": round(float(close), 2) if np.isfinite(close) else None,
+            "market_cap_b": round(float(cap) / 1e9, 2) if np.isfinite(cap) else None
+        }
+
+    def records(self, key: str = ALL) -> list[StockRecord]:
+        """某组当前的前 N 名"""
+        return self.table.to_records(self.groups[key].order[:self.top_n])
+
+
+def watch(
+    ranking: LiveRanking,
+    provider: DataProvider,
+    interval: float,
+    callback: Callable[[dict[str, list[dict]]], None],
+    count: int | None = None,
+    stop_event: threading.Event | None = None
+) -> None:
+    """
+    轮询最新价格并增量更新排名，每轮把变化交给 callback
+
+    第一轮相当于从空排名开始，前 N 名全部以 enter 给出。单轮拉取超过 interval 时
+    下一轮立即开始，不补齐错过的轮次。
+
+    Args:
+        ranking: 要维护的排名
+        provider: 数据源（只调用 get_last_prices）
+        interval: 两轮开始之间的间隔（秒）
+        callback: 每轮的回调，参数为 LiveRanking.update 的返回值
+        count: 轮询次数，None 为一直运行
+        stop_event: 置位后在下一轮之前停止
+    """
+    stop_event = stop_event or threading.Event()
+    polls = 0
+    next_poll = time.monotonic()
+    while not stop_event.is_set():
+        instrument.count("watch.polls")
+        try:
+            with instrument.span("watch.poll", tickers=len(ranking.tickers)):
+                prices = provider.get_last_prices(ranking.tickers)
+        except Exception as e:
+            # 单轮失败保留上一轮的排名，下一轮再试
+            logger.warning(f"Price poll failed: {e}")
+            instrument.count("watch.poll_errors")
+            prices = {}
+        with instrument.span("watch.rank"):
+            changes = ranking.update(prices)
+        callback(changes)
+
+        polls += 1
+        if count is not None and polls >= count:
+            break
+        next_poll = max(next_poll + interval, time.monotonic())
+        stop_event.wait(next_poll - time.monotonic())
@@ -0,0 +1,164 @@
+"""CoalescingProvider 合并并发请求后结果与直接调用一致"""
+
+import threading
+import unittest
+from datetime import date, timedelta
+
+from capscope.providers import CoalescingProvider
+
+
+class SlowProvider:
+    """元数据调用阻塞到 release 为止；批量调用漏掉 omit 中的 ticker"""
+
+    name = "slow"
+    metadata_batch_size = 50
+    rate_limited = False
+
+    def __init__(self, omit: set[str] = frozenset()):
+        self.omit = set(omit)
+        self.calls: list[list[str]] = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def get_metadata(self, tickers: list[str]) -> list[dict]:
+        with self._lock:
+            self.calls.append(list(tickers))
+        self.started.set()
+        self.release.wait(5)
+        return [
+            {"ticker": t, "name": t, "sector": "Technology", "shares": 100}
+            for t in tickers
+            if len(tickers) == 1 or t not in self.omit
+        ]
+
+
+class PriceProvider:
+    """收盘价 = ticker 序号 + 日期序号（工作日），记录每次下载"""
+
+    name = "prices"
+    metadata_batch_size = 50
+    rate_limited = False
+
+    def __init__(self):
+        self.downloads: list[tuple[list[str], date, date]] = []
+        self._lock = threading.Lock()
+
+    def get_closes(self, tickers: list[str], start: date, end: date):
+        import pandas as pd
+
+        with self._lock:
+            self.downloads.append((list(tickers), start, end))
+        days = pd.bdate_range(start, end)
+        return pd.DataFrame(
+            {t: [int(t[1:]) * 1000 + d.toordinal() % 1000 for d in days] for t in tickers},
+            index=days, dtype=float
+        )
+
+
+def _run(target, *args) -> tuple[threading.Thread, dict]:
+    out = {}
+    thread = threading.Thread(target=lambda: out.setdefault("result", target(*args)))
+    thread.start()
+    return thread, out
+
+
+class MetadataCoalescingTest(unittest.TestCase):
+
+    def test_single_request_does_not_reuse_batch_that_omits_it(self):
+        provider = SlowProvider(omit={"X"})
+        coalescing = CoalescingProvider(provider)
+
+        batch, batch_out = _run(coalescing.get_metadata, ["A", "X"])
+        self.assertTrue(provider.started.wait(5))
+        single, single_out = _run(coalescing.get_metadata, ["X"])
+        # 等单个请求自己发出调用后再放行
+        for _ in range(500):
+            if len(provider.calls) == 2:
+                break
+            threading.Event().wait(0.01)
+        provider.release.set()
+        batch.join(5)
+        single.join(5)
+
+        self.assertEqual(sorted(provider.calls), [["A", "X"], ["X"]])
+        self.assertEqual([r["ticker"] for r in batch_out["result"]], ["A"])
+        self.assertEqual([r["ticker"] for r in single_out["result"]], ["X"])
+        self.assertEqual(coalescing._metadata_inflight, {})
+
+    def test_concurrent_single_requests_share_one_call(self):
+        provider = SlowProvider()
+        coalescing = CoalescingProvider(provider)
+
+        first, first_out = _run(coalescing.get_metadata, ["X"])
+        self.assertTrue(provider.started.wait(5))
+        second, second_out = _run(coalescing.get_metadata, ["X"])
+        for _ in range(500):
+            if coalescing.stats["metadata_shared"]:
+                break
+            threading.Event().wait(0.01)
+        provider.release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(provider.calls, [["X"]])
+        self.assertEqual(first_out["result"], second_out["result"])
+        self.assertEqual(coalescing.stats["metadata_shared"], 1)
+
+    def test_batch_shares_inflight_tickers(self):
+        provider = SlowProvider()
+        coalescing = CoalescingProvider(provider)
+
+        first, first_out = _run(coalescing.get_metadata, ["A", "B"])
+        self.assertTrue(provider.started.wait(5))
+        second, second_out = _run(coalescing.get_metadata, ["B", "C"])
+        for _ in range(500):
+            if len(provider.calls) == 2:
+                break
+            threading.Event().wait(0.01)
+        provider.release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(provider.calls, [["A", "B"], ["C"]])
+        self.assertEqual([r["ticker"] for r in second_out["result"]], ["B", "C"])
+        # 共享的记录各自拷贝，调用方修改互不影响
+        self.assertIsNot(first_out["result"][1], second_out["result"][0])
+
+
+class ClosesCoalescingTest(unittest.TestCase):
+
+    def test_concurrent_requests_match_direct_calls(self):
+        provider = PriceProvider()
+        coalescing = CoalescingProvider(provider, linger=0.05)
+        start = date(2024, 1, 2)
+        requests = [
+            ([f"T{i}" for i in range(k, k + 5)], start + timedelta(days=k), start + timedelta(days=k + 10))
+            for k in range(8)
+        ]
+        results = [None] * len(requests)
+        barrier = threading.Barrier(len(requests))
+
+        def fetch(i):
+            barrier.wait()
+            results[i] = coalescing.get_closes(*requests[i])
+
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        direct = PriceProvider()
+        for (tickers, d_start, d_end), result in zip(requests, results):
+            with self.subTest(start=d_start):
+                expected = direct.get_closes(tickers, d_start, d_end)
+                self.assertEqual(list(result.columns), tickers)
+                self.assertTrue(result.equals(expected))
+        # 区间相互重叠，合并成远少于请求数的下载
+        self.assertLess(len(provider.downloads), len(requests))
+        self.assertEqual(coalescing.stats["close_calls"], len(provider.downloads))
+
+
+if __name__ == "__main__":
+    unittest.main()
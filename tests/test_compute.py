@@ -0,0 +1,147 @@
+"""MarketCapTable 的排名与原先逐条字典排序的结果一致"""
+
+import random
+import unittest
+
+from capscope.compute import (
+    SECTOR_CN_MAP,
+    MarketCapTable,
+    compute_market_caps,
+    get_top_overall,
+    iter_market_cap_series,
+    rank_by_sector,
+)
+
+SECTORS = ["Technology", "Healthcare", "Energy", "Utilities", "Made Up"]
+
+
+def baseline_market_caps(metadata: list[dict], prices: dict[str, float]) -> list[dict]:
+    """原先的实现：逐只算市值，按（取整后的）市值稳定降序"""
+    results = []
+    for stock in metadata:
+        ticker = stock["ticker"]
+        if ticker not in prices:
+            continue
+        close = prices[ticker]
+        market_cap = close * stock["shares"]
+        results.append({
+            "ticker": ticker,
+            "name": stock["name"],
+            "sector": stock["sector"],
+            "sector_cn": SECTOR_CN_MAP.get(stock["sector"], "未分类"),
+            "close": round(close, 2),
+            "shares": stock["shares"],
+            "market_cap": round(market_cap, 2),
+            "market_cap_b": round(market_cap / 1e9, 2)
+        })
+    results.sort(key=lambda x: x["market_cap"], reverse=True)
+    return results
+
+
+def baseline_rank_by_sector(stocks: list[dict], top_n: int) -> dict[str, list[dict]]:
+    """原先的实现：按出现顺序分组，组内稳定降序后截断"""
+    sectors: dict[str, list[dict]] = {}
+    for stock in stocks:
+        sectors.setdefault(stock["sector"], []).append(stock)
+    for sector in sectors:
+        sectors[sector].sort(key=lambda x: x["market_cap"], reverse=True)
+        sectors[sector] = sectors[sector][:top_n]
+    return sectors
+
+
+def _universe(seed: int, n: int) -> tuple[list[dict], dict[str, float]]:
+    """
+    随机元数据和价格：价格与股数取少量整数值，制造大量市值相同的股票；
+    部分股票没有价格，"Made Up" 行业的股票全部没有价格
+    """
+    rng = random.Random(seed)
+    metadata, prices = [], {}
+    for i in range(n):
+        ticker = f"T{i:03d}"
+        sector = rng.choice(SECTORS)
+        metadata.append({
+            "ticker": ticker,
+            "name": f"Company {i}",
+            "sector": sector,
+            "shares": rng.choice([1_000, 2_000, 5_000]) * 1_000_000
+        })
+        if sector != "Made Up" and rng.random() > 0.1:
+            prices[ticker] = float(rng.choice([10, 20, 25, 50, 100]))
+    return metadata, prices
+
+
+class MarketCapTableTest(unittest.TestCase):
+
+    def test_compute_market_caps(self):
+        for seed in range(20):
+            metadata, prices = _universe(seed, 120)
+            with self.subTest(seed=seed):
+                records = [dict(r) for r in compute_market_caps(metadata, prices)]
+                self.assertEqual(records, baseline_market_caps(metadata, prices))
+
+    def test_top_with_ties(self):
+        metadata, prices = _universe(1, 200)
+        table = MarketCapTable.from_metadata(metadata, prices)
+        expected = [s["ticker"] for s in baseline_market_caps(metadata, prices)]
+        for n in (0, 1, 7, 50, len(table), len(table) + 10):
+            with self.subTest(n=n):
+                self.assertEqual(table.tickers[table.top(n)].tolist(), expected[:n])
+
+    def test_rank_by_sector(self):
+        for seed in range(20):
+            metadata, prices = _universe(seed, 120)
+            stocks = compute_market_caps(metadata, prices)
+            expected_input = baseline_market_caps(metadata, prices)
+            for top_n in (0, 1, 3, 200):
+                with self.subTest(seed=seed, top_n=top_n):
+                    expected = baseline_rank_by_sector(expected_input, top_n)
+                    for ranked in (
+                        rank_by_sector(stocks, top_n),
+                        rank_by_sector(MarketCapTable.from_metadata(metadata, prices), top_n),
+                    ):
+                        # 行业顺序也要一致（按各行业最大市值降序）
+                        self.assertEqual(list(ranked), list(expected))
+                        self.assertEqual(
+                            {k: [dict(s) for s in v] for k, v in ranked.items()}, expected
+                        )
+                    # 没有任何价格的行业不出现
+                    self.assertNotIn("Made Up", expected)
+
+    def test_series_matches_daily_ranking(self):
+        import pandas as pd
+
+        days = [_universe(seed, 60) for seed in range(5)]
+        metadata = days[0][0]
+        closes = pd.DataFrame(
+            [prices for _, prices in days],
+            index=pd.date_range("2024-01-02", periods=len(days), freq="B")
+        ).reindex(columns=[m["ticker"] for m in metadata])
+        # 分块边界不影响结果
+        series = pd.concat(iter_market_cap_series(metadata, closes, top_n=10, chunk_days=2))
+
+        for day, (_, prices) in zip(closes.index, days):
+            with self.subTest(day=day):
+                rows = series[series["date"] == day.strftime("%Y-%m-%d")]
+                expected = baseline_market_caps(metadata, prices)[:10]
+                self.assertEqual(rows["ticker"].tolist(), [s["ticker"] for s in expected])
+                self.assertEqual(rows["rank"].tolist(), list(range(1, len(expected) + 1)))
+
+    def test_empty(self):
+        self.assertEqual(compute_market_caps([], {}), [])
+        metadata, _ = _universe(0, 10)
+        self.assertEqual(compute_market_caps(metadata, {}), [])
+        self.assertEqual(rank_by_sector([], 10), {})
+        self.assertEqual(get_top_overall([], 10), [])
+
+    def test_from_records_roundtrip(self):
+        metadata, prices = _universe(3, 80)
+        stocks = compute_market_caps(metadata, prices)
+        table = MarketCapTable.from_records(stocks)
+        self.assertEqual(table.to_records(table.top()), stocks)
+        # 字典列表（如快照）也可以
+        table = MarketCapTable.from_records([dict(s) for s in stocks])
+        self.assertEqual(table.to_records(table.top(10)), stocks[:10])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""fetch_all 的调度：AIMD 并发、重试与取消"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from capscope.fetcher import AdaptiveLimiter, FetchCancelled, fetch_all
+
+
+def _run(batches, fetch, **options) -> dict:
+    """同步跑一次 fetch_all，返回 {批次首个 ticker: 结果}"""
+    done = {}
+
+    def on_done(batch, result):
+        assert batch[0] not in done, f"{batch} delivered twice"
+        done[batch[0]] = result
+
+    asyncio.run(fetch_all(batches, fetch, on_done, **options))
+    return done
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+
+    def test_additive_increase(self):
+        limiter = AdaptiveLimiter(initial=4, maximum=32, latency_target=1.0)
+        # 每成功一轮（limit 个请求）并发约 +1
+        for _ in range(4):
+            limiter.on_success(0.1)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.1)
+        for _ in range(1000):
+            limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 32)
+
+    def test_multiplicative_decrease(self):
+        limiter = AdaptiveLimiter(initial=16, minimum=2, latency_target=1.0)
+        limiter.on_error()
+        self.assertEqual(limiter.limit, 8)
+        # 同一轮内的多个失败只减一次
+        limiter.on_error()
+        limiter.on_error()
+        self.assertEqual(limiter.limit, 8)
+
+        limiter._last_decrease -= 1.0
+        limiter.on_success(5.0)  # 超过目标延迟视为拥塞
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(5):
+            limiter._last_decrease -= 1.0
+            limiter.on_error()
+        self.assertEqual(limiter.limit, 2)
+
+    def test_initial_is_clamped(self):
+        self.assertEqual(AdaptiveLimiter(initial=10, maximum=3).limit, 3)
+        self.assertEqual(AdaptiveLimiter(initial=0, minimum=1).limit, 1)
+
+    def test_concurrency_never_exceeds_limit(self):
+        async def main():
+            limiter = AdaptiveLimiter(initial=3, maximum=3)
+            active, peak = 0, 0
+
+            async def task():
+                nonlocal active, peak
+                async with limiter:
+                    active += 1
+                    peak = max(peak, active)
+                    await asyncio.sleep(0.001)
+                    active -= 1
+
+            await asyncio.gather(*(task() for _ in range(30)))
+            return peak
+
+        self.assertEqual(asyncio.run(main()), 3)
+
+
+class FetchAllTest(unittest.TestCase):
+
+    def test_every_batch_delivered_once(self):
+        batches = [[f"T{i}", f"U{i}"] for i in range(40)]
+        done = _run(batches, lambda batch: [t.lower() for t in batch], rate=None)
+        self.assertEqual(done, {b[0]: [t.lower() for t in b] for b in batches})
+
+    def test_empty(self):
+        self.assertEqual(_run([], lambda batch: batch), {})
+
+    def test_retries_then_drops(self):
+        calls: dict[str, int] = {}
+        lock = threading.Lock()
+
+        def fetch(batch):
+            with lock:
+                calls[batch[0]] = calls.get(batch[0], 0) + 1
+            if batch[0] == "BAD":
+                raise RuntimeError("boom")
+            if batch[0] == "FLAKY" and calls["FLAKY"] < 3:
+                raise RuntimeError("429 Too Many Requests")
+            return batch
+
+        with self.assertLogs("capscope.fetcher", "ERROR"):
+            done = _run([["OK"], ["BAD"], ["FLAKY"]], fetch, rate=None, retries=2, backoff=0.001)
+        self.assertEqual(done, {"OK": ["OK"], "BAD": None, "FLAKY": ["FLAKY"]})
+        self.assertEqual(calls, {"OK": 1, "BAD": 3, "FLAKY": 3})
+
+    def test_max_concurrency(self):
+        lock = threading.Lock()
+        active, peak = 0, 0
+
+        def fetch(batch):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.005)
+            with lock:
+                active -= 1
+            return batch
+
+        done = _run([[str(i)] for i in range(60)], fetch, rate=None, max_concurrency=3)
+        self.assertEqual(len(done), 60)
+        self.assertLessEqual(peak, 3)
+
+    def test_cancel_before_start(self):
+        cancel = threading.Event()
+        cancel.set()
+        calls = []
+        with self.assertRaises(FetchCancelled):
+            _run([["A"], ["B"]], calls.append, rate=None, cancel_event=cancel)
+        self.assertEqual(calls, [])
+
+    def test_cancel_stops_new_requests(self):
+        cancel = threading.Event()
+        lock = threading.Lock()
+        started = []
+        after_cancel = []
+
+        def fetch(batch):
+            with lock:
+                (after_cancel if cancel.is_set() else started).append(batch[0])
+                if len(started) == 5:
+                    cancel.set()
+            time.sleep(0.01)
+            return batch
+
+        done = {}
+        with self.assertRaises(FetchCancelled):
+            asyncio.run(fetch_all(
+                [[str(i)] for i in range(200)], fetch, lambda b, r: done.setdefault(b[0], r),
+                rate=None, max_concurrency=2, cancel_event=cancel
+            ))
+        # 取消后最多还有已拿到并发名额的请求执行完，不会再发起新的
+        self.assertLessEqual(len(after_cancel), 2)
+        self.assertLess(len(done), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""StockTableModel 的增量过滤与逐行重新过滤的结果一致"""
+
+import random
+import unittest
+
+try:
+    from PyQt6.QtCore import QModelIndex, Qt
+except ImportError:  # 没有安装 GUI 依赖
+    Qt = None
+
+from capscope.compute import compute_market_caps
+
+if Qt is not None:
+    from capscope.gui.model import StockTableModel
+
+WORDS = ["Alpha", "Beta", "Gamma", "Delta", "Apex", "Albion", "Tech", "Bank"]
+
+# 依次输入的过滤文本：逐字收窄、退格放宽、整体替换、清空
+TYPING = [
+    "a", "al", "alp", "alph", "al", "a", "", "t", "t0", "t01", "t0", "t", "",
+    "be", "bank", "an", "ALPHA", "x", "", "a b", "company", "compan", "",
+]
+
+
+def _stocks(seed: int, n: int) -> list:
+    rng = random.Random(seed)
+    metadata = [
+        {
+            "ticker": f"T{i:03d}",
+            "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} Company",
+            "sector": "Technology",
+            "shares": rng.randint(1, 50) * 1_000_000
+        }
+        for i in range(n)
+    ]
+    prices = {m["ticker"]: float(rng.randint(10, 500)) for m in metadata}
+    return compute_market_caps(metadata, prices)
+
+
+def _baseline(stocks: list, order: list[int], text: str) -> list[str]:
+    """原先的过滤：ticker 或公司名包含文本（不区分大小写）"""
+    text = text.lower()
+    return [
+        stocks[i]["ticker"] for i in order
+        if text in stocks[i]["ticker"].lower() or text in stocks[i]["name"].lower()
+    ]
+
+
+class ShadowRows:
+    """按模型发出的增删/变更/重置通知维护一份行副本，检查通知与数据一致"""
+
+    def __init__(self, model: "StockTableModel"):
+        self.model = model
+        self.rows = self._read(0, model.rowCount())
+        model.rowsInserted.connect(self._inserted)
+        model.rowsRemoved.connect(self._removed)
+        model.dataChanged.connect(self._changed)
+        model.modelReset.connect(self._reset)
+        model.layoutChanged.connect(self._reset)
+
+    def _read(self, first: int, stop: int) -> list[str]:
+        return [self.model.index(row, 1).data() for row in range(first, stop)]
+
+    def _inserted(self, parent, first, last):
+        self.rows[first:first] = self._read(first, last + 1)
+
+    def _removed(self, parent, first, last):
+        del self.rows[first:last + 1]
+
+    def _changed(self, top_left, bottom_right):
+        first, last = top_left.row(), bottom_right.row()
+        self.rows[first:last + 1] = self._read(first, last + 1)
+
+    def _reset(self, *args):
+        self.rows = self._read(0, self.model.rowCount())
+
+
+@unittest.skipIf(Qt is None, "PyQt6 not installed")
+class FilterTest(unittest.TestCase):
+
+    def _check_typing(self, model, stocks, order, shadow):
+        for text in TYPING:
+            model.set_filter(text)
+            expected = _baseline(stocks, order, text)
+            with self.subTest(text=text):
+                self.assertEqual([s["ticker"] for s in model.get_filtered_data()], expected)
+                self.assertEqual(shadow.rows, expected)
+                # 排名列保持过滤前的名次
+                shown = set(expected)
+                ranks = [model.index(row, 0).data() for row in range(model.rowCount())]
+                self.assertEqual(ranks, [i + 1 for i in order if stocks[i]["ticker"] in shown])
+
+    def test_filter_in_rank_order(self):
+        for seed in range(5):
+            stocks = _stocks(seed, 300)
+            model = StockTableModel()
+            model.set_data(stocks)
+            shadow = ShadowRows(model)
+            self._check_typing(model, stocks, list(range(len(stocks))), shadow)
+
+    def test_filter_while_sorted(self):
+        stocks = _stocks(7, 300)
+        model = StockTableModel()
+        model.set_data(stocks)
+        shadow = ShadowRows(model)
+        model.set_filter("a")
+        model.sort(2, Qt.SortOrder.DescendingOrder)  # 公司名降序
+        order = model._store.order("", "name", True)
+        self.assertEqual(shadow.rows, _baseline(stocks, order, "a"))
+        self._check_typing(model, stocks, order, shadow)
+
+    def test_update_keeps_filter(self):
+        stocks = _stocks(3, 200)
+        model = StockTableModel()
+        model.set_data(stocks)
+        model.set_filter("alpha")
+        shadow = ShadowRows(model)
+        refreshed = _stocks(4, 200)
+        model.update_data(refreshed)
+        expected = _baseline(refreshed, list(range(len(refreshed))), "alpha")
+        self.assertEqual([s["ticker"] for s in model.get_filtered_data()], expected)
+        self.assertEqual(shadow.rows, expected)
+        self.assertEqual(model.rowCount(QModelIndex()), len(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""instrument.recording() 在并发加载之间互不干扰"""
+
+import asyncio
+import threading
+import unittest
+
+from capscope import instrument
+from capscope.fetcher import fetch_all
+
+
+class RecordingTest(unittest.TestCase):
+
+    def test_concurrent_recordings_are_isolated(self):
+        recorders = {}
+        barrier = threading.Barrier(4)
+
+        def load(name: str, batches: int):
+            with instrument.recording() as recorder:
+                barrier.wait()
+
+                def fetch(batch):
+                    instrument.count(name)
+                    return batch
+
+                # 线程池里执行的抓取也要记到本次的记录器
+                asyncio.run(fetch_all([[str(i)] for i in range(batches)], fetch, lambda b, r: None, rate=None))
+                with instrument.span(name):
+                    pass
+            recorders[name] = recorder
+
+        threads = [threading.Thread(target=load, args=(f"load{i}", 5 + i)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(4):
+            name = f"load{i}"
+            recorder = recorders[name]
+            self.assertEqual(recorder.counters, {"fetch.requests": 5 + i, name: 5 + i})
+            self.assertEqual({s["name"] for s in recorder.spans}, {"fetch.request", name})
+        self.assertIsNone(instrument.get_recorder())
+
+    def test_recording_takes_precedence_over_enable(self):
+        outer = instrument.enable()
+        try:
+            with instrument.recording() as inner:
+                instrument.count("inner")
+            instrument.count("outer")
+        finally:
+            instrument.disable()
+        self.assertEqual(inner.counters, {"inner": 1})
+        self.assertEqual(outer.counters, {"outer": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""trading_calendar 与纽交所公布的休市日、提前收盘日对照"""
+
+import unittest
+from datetime import date, time
+
+from capscope import trading_calendar as tc
+
+# 纽交所公布的全天休市日
+HOLIDAYS = {
+    2021: [
+        "2021-01-01", "2021-01-18", "2021-02-15", "2021-04-02", "2021-05-31",
+        "2021-07-05", "2021-09-06", "2021-11-25", "2021-12-24",
+    ],
+    2022: [
+        "2022-01-17", "2022-02-21", "2022-04-15", "2022-05-30", "2022-06-20",
+        "2022-07-04", "2022-09-05", "2022-11-24", "2022-12-26",
+    ],
+    2023: [
+        "2023-01-02", "2023-01-16", "2023-02-20", "2023-04-07", "2023-05-29",
+        "2023-06-19", "2023-07-04", "2023-09-04", "2023-11-23", "2023-12-25",
+    ],
+    2024: [
+        "2024-01-01", "2024-01-15", "2024-02-19", "2024-03-29", "2024-05-27",
+        "2024-06-19", "2024-07-04", "2024-09-02", "2024-11-28", "2024-12-25",
+    ],
+    2025: [
+        "2025-01-01", "2025-01-09", "2025-01-20", "2025-02-17", "2025-04-18",
+        "2025-05-26", "2025-06-19", "2025-07-04", "2025-09-01", "2025-11-27",
+        "2025-12-25",
+    ],
+    2026: [
+        "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25",
+        "2026-06-19", "2026-07-03", "2026-09-07", "2026-11-26", "2026-12-25",
+    ],
+}
+
+# 13:00 提前收盘日
+EARLY_CLOSES = {
+    2018: ["2018-07-03", "2018-11-23", "2018-12-24"],
+    2021: ["2021-11-26"],
+    2022: ["2022-11-25"],
+    2023: ["2023-07-03", "2023-11-24"],
+    2024: ["2024-07-03", "2024-11-29", "2024-12-24"],
+    2025: ["2025-07-03", "2025-11-28", "2025-12-24"],
+    2026: ["2026-11-27", "2026-12-24"],
+}
+
+# 规则之外的临时休市
+SPECIAL_CLOSURES = [
+    "2001-09-11", "2001-09-14", "2004-06-11", "2007-01-02",
+    "2012-10-29", "2012-10-30", "2018-12-05", "2025-01-09",
+]
+
+# 容易算错的照常交易日（元旦落在周六不补休、节前节后等）
+TRADING_DAYS = [
+    "2021-12-31", "2022-12-23", "2021-07-02", "2026-07-02", "2024-03-28",
+    "2024-12-24", "2024-12-26", "2001-09-17", "1997-01-20",
+]
+
+# 每年交易日数
+SESSIONS_PER_YEAR = {2021: 252, 2022: 251, 2023: 250, 2024: 252, 2025: 250}
+
+
+def _dates(values: list[str]) -> list[date]:
+    return [date.fromisoformat(v) for v in values]
+
+
+class HolidayTest(unittest.TestCase):
+
+    def test_holidays(self):
+        for year, expected in HOLIDAYS.items():
+            with self.subTest(year=year):
+                self.assertEqual(sorted(tc.holidays(year)), _dates(expected))
+
+    def test_special_closures(self):
+        for day in _dates(SPECIAL_CLOSURES):
+            with self.subTest(day=day):
+                self.assertFalse(tc.is_trading_day(day))
+
+    def test_trading_days(self):
+        for day in _dates(TRADING_DAYS):
+            with self.subTest(day=day):
+                self.assertTrue(tc.is_trading_day(day))
+
+    def test_sessions_per_year(self):
+        for year, count in SESSIONS_PER_YEAR.items():
+            with self.subTest(year=year):
+                days = tc.trading_days(date(year, 1, 1), date(year, 12, 31))
+                self.assertEqual(len(days), count)
+
+
+class EarlyCloseTest(unittest.TestCase):
+
+    def test_early_closes(self):
+        for year, expected in EARLY_CLOSES.items():
+            with self.subTest(year=year):
+                self.assertEqual(sorted(tc.early_closes(year)), _dates(expected))
+
+    def test_close_time(self):
+        self.assertEqual(tc.close_time(date(2024, 11, 29)), time(13, 0))
+        self.assertEqual(tc.close_time(date(2024, 11, 27)), time(16, 0))
+        self.assertIsNone(tc.close_time(date(2024, 11, 28)))
+        self.assertIsNone(tc.close_time(date(2024, 11, 30)))
+
+
+class NavigationTest(unittest.TestCase):
+
+    def test_previous_trading_day(self):
+        # 周末 + 耶稣受难日
+        self.assertEqual(tc.previous_trading_day(date(2024, 3, 31)), date(2024, 3, 28))
+        self.assertEqual(tc.previous_trading_day(date(2024, 3, 28)), date(2024, 3, 28))
+        self.assertEqual(
+            tc.previous_trading_day(date(2024, 3, 28), inclusive=False), date(2024, 3, 27)
+        )
+        # 跨年且元旦休市
+        self.assertEqual(tc.previous_trading_day(date(2024, 1, 1)), date(2023, 12, 29))
+
+    def test_next_trading_day(self):
+        self.assertEqual(tc.next_trading_day(date(2024, 12, 25)), date(2024, 12, 26))
+        self.assertEqual(
+            tc.next_trading_day(date(2024, 12, 26), inclusive=False), date(2024, 12, 27)
+        )
+        # 9·11 后 9/17 复市
+        self.assertEqual(tc.next_trading_day(date(2001, 9, 11)), date(2001, 9, 17))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""LiveRanking 增量排名与每轮全量重排一致，变化事件与前后两轮的前 N 名对应"""
+
+import random
+import unittest
+
+from capscope.compute import compute_market_caps, rank_by_sector
+from capscope.watch import ALL, LiveRanking
+
+SECTORS = ["Technology", "Healthcare", "Energy", "Financials"]
+TOP_N = 8
+
+
+def _metadata(rng: random.Random, n: int) -> list[dict]:
+    return [
+        {
+            "ticker": f"T{i:03d}",
+            "name": f"Company {i}",
+            "sector": rng.choice(SECTORS),
+            "shares": rng.choice([1_000, 2_000, 4_000]) * 1_000_000
+        }
+        for i in range(n)
+    ]
+
+
+def _expected_tops(metadata: list[dict], prices: dict[str, float]) -> dict[str, list[str]]:
+    """按当前全部价格整体重排的各组前 N 名"""
+    stocks = compute_market_caps(metadata, prices)
+    tops = {ALL: [s["ticker"] for s in stocks[:TOP_N]]}
+    for sector, ranked in rank_by_sector(stocks, TOP_N).items():
+        tops[sector] = [s["ticker"] for s in ranked]
+    return tops
+
+
+def _events_between(before: list[str], after: list[str]) -> set[tuple]:
+    """前后两轮前 N 名之间应有的 (event, ticker, rank, prev_rank)"""
+    prev_rank = {t: r for r, t in enumerate(before, 1)}
+    rank = {t: r for r, t in enumerate(after, 1)}
+    events = set()
+    for ticker, r in rank.items():
+        p = prev_rank.get(ticker)
+        if p is None:
+            events.add(("enter", ticker, r, None))
+        elif p != r:
+            events.add(("move", ticker, r, p))
+    for ticker, p in prev_rank.items():
+        if ticker not in rank:
+            events.add(("exit", ticker, None, p))
+    return events
+
+
+class LiveRankingTest(unittest.TestCase):
+
+    def _check_rounds(self, seed: int, changes_per_round: list[int]):
+        rng = random.Random(seed)
+        metadata = _metadata(rng, 80)
+        ranking = LiveRanking(metadata, top_n=TOP_N, by_sector=True)
+        prices: dict[str, float] = {}
+        tops = {key: [] for key in ranking.groups}
+
+        for round_, count in enumerate(changes_per_round):
+            update = {}
+            for stock in rng.sample(metadata, count):
+                # 价格取少量整数值制造大量并列；偶尔为 NaN（沿用上一轮价格）
+                update[stock["ticker"]] = rng.choice([10.0, 20.0, 25.0, 40.0, float("nan")])
+            prices.update({t: p for t, p in update.items() if p == p})
+
+            changes = ranking.update(update)
+            expected = _expected_tops(metadata, prices)
+            with self.subTest(seed=seed, round=round_):
+                for key in ranking.groups:
+                    current = [r["ticker"] for r in ranking.records(key)]
+                    self.assertEqual(current, expected.get(key, []), key)
+                    events = {
+                        (e["event"], e["ticker"], e["rank"], e["prev_rank"])
+                        for e in changes.get(key, [])
+                    }
+                    self.assertEqual(events, _events_between(tops[key], current), key)
+                    tops[key] = current
+
+    def test_incremental_updates(self):
+        # 首轮整组构建，之后每轮只变几只（逐个插入的路径）
+        for seed in range(10):
+            self._check_rounds(seed, [80] + [3] * 30)
+
+    def test_rebuild_updates(self):
+        # 变化多时整组重排
+        for seed in range(10):
+            self._check_rounds(seed, [20, 60, 40, 80, 5, 70])
+
+    def test_unchanged_prices(self):
+        rng = random.Random(0)
+        metadata = _metadata(rng, 20)
+        ranking = LiveRanking(metadata, top_n=TOP_N)
+        prices = {m["ticker"]: 10.0 for m in metadata}
+        self.assertEqual(len(ranking.update(prices)[ALL]), TOP_N)
+        self.assertEqual(ranking.update(prices), {})
+        self.assertEqual(ranking.update({}), {})
+        self.assertEqual(len(ranking.changed), 0)
+
+    def test_single_sector(self):
+        rng = random.Random(1)
+        metadata = _metadata(rng, 40)
+        ranking = LiveRanking(metadata, top_n=TOP_N, sector="Energy")
+        self.assertEqual(list(ranking.groups), ["Energy"])
+        prices = {m["ticker"]: rng.choice([10.0, 20.0]) for m in metadata}
+        changes = ranking.update(prices)
+        expected = _expected_tops(metadata, prices)["Energy"]
+        self.assertEqual([e["ticker"] for e in changes["Energy"]], expected)
+        self.assertEqual([e["rank"] for e in changes["Energy"]], list(range(1, len(expected) + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()